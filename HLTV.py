@@ -1,51 +1,420 @@
+import collections
 import re
 import requests
+import threading
 import time
 
-from bs4 import BeautifulSoup, NavigableString
-from datetime import datetime
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 from tqdm import tqdm
 
+from records import Map, MapPlayerStats, Match
+from scrape_stats import ScrapeStats, instrumented
+from urls import UrlBuilder
+
+RATE_LIMIT_WAIT = 120
+
+# Compiled once rather than per call in the extractors' hot loops
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.DOTALL | re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+_OVERTIME_RE = re.compile(r"[\s()]+")
+_PARENS_TABLE = str.maketrans("", "", "()")
+_EVENT_HREF_RE = re.compile(r"^/events/\d+/")
+_TEAM_HREF_RE = re.compile(r"^/team/\d+/")
+
+# Events listed per page of the events archive
+ARCHIVE_PAGE_SIZE = 50
+
+# Only build the parts of the page the parsers look at
+_MAP_PAGE_STRAINER = SoupStrainer("div", {"class": "stats-match"})
+_ECON_PAGE_STRAINER = SoupStrainer("table", {"class": "equipment-categories"})
+
+# Round outcome icon filename -> round type
+_WIN_TYPES = {
+    "t_win.svg":         "elimination",
+    "ct_win.svg":        "elimination",
+    "bomb_defused.svg":  "defuse",
+    "bomb_exploded.svg": "bomb",
+    "stopwatch.svg":     "timeout"
+}
+
+def _path_segment(url, idx):
+    """
+    Returns the idx'th "/" separated segment of url
+    """
+    return url.split("/", idx + 1)[idx]
+
+def _im_src_to_win_type(im_src):
+    return _WIN_TYPES.get(im_src)
+
+def _get_econ(td):
+    equip_val = td["title"][17:]
+    val = int(equip_val)
+    if val > 20_000:
+        return "full_buy", equip_val
+    elif val > 10_000:
+        return "semi_buy", equip_val
+    elif val > 5_000:
+        return "semi_eco", equip_val
+    else:
+        return "eco", equip_val
+
+def _is_rate_limited(html):
+    title = _TITLE_RE.search(html)
+    return title is not None and "Access denied" in title.group(1)
+
+def _timed(parse_func, *args):
+    """
+    Runs parse_func(*args), returning its result and the time it took. Used
+    so parse times from worker processes can be recorded by the client
+    """
+    start = time.perf_counter()
+    result = parse_func(*args)
+    return result, time.perf_counter() - start
+
+def parse_map_page(html, econ_html, team1_id, team2_id, map_pick):
+    """
+    Parses the map overview and economy pages of a map
+    Params:
+        html:       string. Map overview page
+        econ_html:  string. Map economy page
+        team1_id:   string. Id of team1 on the match page
+        team2_id:   string. Id of team2 on the match page
+        map_pick:   string. Id of the team that picked the map, or None
+    Returns:
+        dictionary of map info as in HLTV.get_map_info, or None if the map 
+        was not mr16
+    """
+    map_info = parse_map_overview(html, team1_id, team2_id, map_pick)
+    if map_info is None:
+        return None
+    return add_econ(map_info, parse_econ_page(econ_html))
+
+def parse_map_overview(html, team1_id, team2_id, map_pick):
+    """
+    Parses the map overview page of a map, so get_map_info only fetches the
+    economy page of mr16 maps
+    Returns:
+        dictionary of map info as in HLTV.get_map_info with no buys in the
+        rounds, or None if the map was not mr16
+    """
+    soup = BeautifulSoup(html, "html.parser", parse_only=_MAP_PAGE_STRAINER)
+    soup = soup.find("div", {"class": "stats-match"})
+
+    summary_html = soup.find("div", {"class": "wide-grid"}).div.div
+
+    map_date = str(summary_html.div.div.span.string)
+    map_name = _WHITESPACE_RE.sub("", summary_html.div.div.next_sibling)
+
+    # Check team ids are in same order as on match page
+    map_team_1_id = summary_html.div.find("div", {"class": "team-left"})
+    map_team_1_id = _path_segment(map_team_1_id.a["href"], 3)
+    map_team_2_id = summary_html.div.find("div", {"class": "team-right"})
+    map_team_2_id = _path_segment(map_team_2_id.a["href"], 3)
+    if map_team_1_id != team1_id:
+        print(
+            f"Mismatched team ids: {team1_id} != {map_team_1_id}"
+            f"{team2_id} != {map_team_2_id}"
+        )
+
+    info_rows = summary_html.find_all("div", {"class": "match-info-row"})
+
+    # Scores
+    scores_spans = info_rows[0].find("div", {"class": "right"}).find_all("span")
+    team1_score = str(scores_spans[0].string)
+    team2_score = str(scores_spans[1].string)
+    team1_first_half_score = str(scores_spans[2].string)
+    team2_first_half_score = str(scores_spans[3].string)
+    ct_start_team = map_team_1_id if "ct-color" in scores_spans[2]["class"] else map_team_2_id
+    team1_second_half_score = str(scores_spans[4].string)
+    team2_second_half_score = str(scores_spans[5].string)
+    team1_overtime_score = "0"
+    team2_overtime_score = "0"
+    # Check game was mr16 and not something funky
+    if int(team1_score) < 16 and int(team2_score) < 16:
+        return None
+    # Check for overtime
+    if int(team1_score) > 16 or int(team2_score) > 16:
+        overtime_str = _OVERTIME_RE.sub("", scores_spans[5].next_sibling)
+        team1_overtime_score, team2_overtime_score = overtime_str.split(":")
+
+    team_ratings = info_rows[1].find("div", {"class": "right"}).string
+    team_ratings = team_ratings.split()[0:3:2]
+
+    first_kills = info_rows[2].find("div", {"class": "right"}).string
+    first_kills = first_kills.split()[0:3:2]
+
+    clutches = info_rows[3].find("div", {"class": "right"}).string
+    clutches = clutches.split()[0:3:2]
+
+    # Players
+    stats_tables = soup.find_all("table", {"class": "stats-table"})
+    team1_players_html = stats_tables[0].find_all("td", {"class": "st-player"})
+    team1_players = [_path_segment(p.a["href"], 3) for p in team1_players_html]
+    team2_players_html = stats_tables[1].find_all("td", {"class": "st-player"})
+    team2_players = [_path_segment(p.a["href"], 3) for p in team2_players_html]
+
+    # Round winner and type
+    rounds = []
+    rounds_html = soup.find("div", {"class": "round-history-con"})
+    rounds_html = rounds_html.find_all("div", {"class": "round-history-team-row"})
+    team1_rounds_html = rounds_html[0].find_all("img", {"class": "round-history-outcome"})
+    team2_rounds_html = rounds_html[1].find_all("img", {"class": "round-history-outcome"})
+    for (im1, im2) in zip(team1_rounds_html, team2_rounds_html):
+        im1_type = _path_segment(im1["src"], 4)
+        im2_type = _path_segment(im2["src"], 4)
+        if im1_type != "emptyHistory.svg":
+            win_type = _im_src_to_win_type(im1_type)
+            win_team = map_team_1_id
+        elif im2_type != "emptyHistory.svg":
+            win_type = _im_src_to_win_type(im2_type)
+            win_team = map_team_2_id
+        else:
+            # Game finished, rest or scoreboard is empty
+            break
+        rounds.append({
+            "round_winner": win_team, 
+            "round_type": win_type
+        })
+
+    return {
+        "date":              map_date,
+        "map_name":          map_name,
+        "team1_id":          map_team_1_id,
+        "team2_id":          map_team_2_id,
+        "map_picked_by":     map_pick,
+        "ct_start_team":     ct_start_team,
+        "score":             (team1_score, team2_score),
+        "first_half_score":  (team1_first_half_score, team2_first_half_score),
+        "second_half_score": (team1_second_half_score, team2_second_half_score),
+        "overtime_score":    (team1_overtime_score, team2_overtime_score),
+        "team_rating":       team_ratings,
+        "first_kills":       first_kills,
+        "clutches":          clutches,
+        "rounds":            rounds,
+        "team1_players":     team1_players,
+        "team2_players":     team2_players
+    }
+
+def parse_econ_page(econ_html):
+    """
+    Parses the economy page of a map
+    Returns:
+        [((team1_buy_type, team1_buy), (team2_buy_type, team2_buy))] for
+        each round, None if the page has no econ stats
+    """
+    econ_soup = BeautifulSoup(econ_html, "html.parser", parse_only=_ECON_PAGE_STRAINER)
+    econ_soup = econ_soup.find_all("table", {"class": "equipment-categories"})
+    if len(econ_soup) != 2:
+        return None
+    first_half_econ = econ_soup[0].find_all("tr")
+    team1_econ = first_half_econ[0].find_all("td", {"class": "equipment-category-td"})
+    team2_econ = first_half_econ[1].find_all("td", {"class": "equipment-category-td"})
+    second_half_econ = econ_soup[1].find_all("tr")
+    team1_econ.extend(second_half_econ[0].find_all("td", {"class": "equipment-category-td"}))
+    team2_econ.extend(second_half_econ[1].find_all("td", {"class": "equipment-category-td"}))
+    return [(_get_econ(econ1), _get_econ(econ2)) for econ1, econ2 in zip(team1_econ, team2_econ)]
+
+def add_econ(map_info, econ):
+    """
+    Adds the buys of parse_econ_page to the rounds of parse_map_overview.
+    Rounds past the last one on the economy page are dropped, as when both
+    pages were parsed together
+    """
+    if econ is None:
+        return map_info
+    rounds = []
+    for round, ((t1_econ_type, t1_econ), (t2_econ_type, t2_econ)) in zip(map_info["rounds"], econ):
+        rounds.append(dict(round,
+            team1_buy=t1_econ,
+            team2_buy=t2_econ,
+            team1_buy_type=t1_econ_type,
+            team2_buy_type=t2_econ_type))
+    map_info["rounds"] = rounds
+    return map_info
+
+def _get_overview_stats(tr):
+    tds = tr.find_all("td", recursive=False)
+    player_a = tds[0].div.a
+    player_id = _path_segment(player_a["href"], 3)
+    player_name = str(player_a.string)
+    kills, headshots = tds[1].get_text().split()[:2]
+    headshots = headshots.translate(_PARENS_TABLE)
+    assists, flash_assists = tds[2].get_text().split()[:2]
+    flash_assists = flash_assists.translate(_PARENS_TABLE)
+    deaths = str(tds[3].string)
+    kast = tds[4].string[:-1]
+    adr = str(tds[6].string)
+    fk_title = tds[7]["title"].split()
+    first_kills = fk_title[0]
+    first_deaths = fk_title[3]
+    rating = str(tds[8].string)
+
+    return player_id, player_name, {
+        "kills": kills,
+        "headshots": headshots,
+        "assists": assists,
+        "flash_assists": flash_assists,
+        "deaths": deaths,
+        "kast": kast,
+        "adr": adr,
+        "first_kills": first_kills,
+        "first_deaths": first_deaths,
+        "rating": rating
+    }
+
+def parse_map_player_page(html):
+    """
+    Parses the player stats tables of a map overview page
+    Returns:
+        ([(player_id, player_name, stats)], [(player_id, player_name, stats)])
+        for team1 and team2
+    """
+    overview_soup = BeautifulSoup(html, "html.parser", parse_only=_MAP_PAGE_STRAINER)
+    overview_soup = overview_soup.find("div", {"class": "stats-match"})
+    stats_html = overview_soup.find_all("table", {"class": "stats-table"})
+    team1_stats = [_get_overview_stats(tr) for tr in stats_html[0].tbody.find_all("tr")]
+    team2_stats = [_get_overview_stats(tr) for tr in stats_html[1].tbody.find_all("tr")]
+    return team1_stats, team2_stats
+
+
 class HLTV():
 
-    def __init__(self, base_url, timeout=0.5):
+    def __init__(self, base_url, timeout=0.5, profile=False, session=None, records=False,
+        redirect_file=None):
+        """
+        Params:
+            base_url:   string. Domain to scrape
+            timeout:    float. Minimum time in seconds between requests
+            profile:    boolean. Whether to run cProfile around each 
+                        extractor, results are kept in self.stats.profiles
+            session:    object with a get(url) method returning a response.
+                        Defaults to the requests module, see fixtures.py
+                        for recording and replaying pages
+            records:    boolean. Whether the map, match and map player
+                        extractors return the typed records of records.py
+                        instead of dictionaries
+            redirect_file: string. json file the redirects learned by
+                        self.urls are kept in between runs, None to keep
+                        them for this client only. Call self.urls.save()
+                        when done to write the last ones
+        """
         self.base_url = "https://" + base_url
         self.timeout = timeout
         self.last_request = None
-
-    def _soup_from_url(self, url):
+        self.profile = profile
+        self._profiling = False
+        self.stats = ScrapeStats()
+        self.session = session if session is not None else requests
+        self.records = records
+        self.urls = UrlBuilder(self.base_url, redirect_file)
+        # Held for each request and the wait before it, so extractors run
+        # on several threads share one rate budget
+        self.lock = threading.Lock()
+
+    def _html_from_url(self, url):
         """
-        Returns soup object for the given url
+        Returns the html of the given url as a string
         """
-        # Apply timeout if needed
-        if self.last_request is not None:
-            time_diff = time.time() - self.last_request
-            if time_diff < self.timeout:
-                time.sleep(self.timeout - time_diff)
-
-        url.replace(" ", "-")   # Replace whitespace with dash
-
-        # If we get rate limited, wait 2mins then retry
-        while True:
-            response = requests.get(url)
-            self.last_request = time.time()
+        with self.lock:
+            # Apply timeout if needed
+            if self.last_request is not None:
+                time_diff = time.time() - self.last_request
+                if time_diff < self.timeout:
+                    time.sleep(self.timeout - time_diff)
+                    self.stats.record_sleep(self.timeout - time_diff)
+
+            # Go straight to where the url was redirected before
+            requested = self.urls.resolve(url)
+            if requested != url:
+                self.stats.record_redirect_avoided(url)
+
+            # If we get rate limited, wait 2mins then retry
+            while True:
+                start = time.perf_counter()
+                response = self.session.get(requested)
+                self.last_request = time.time()
+                self.stats.record_request(url, time.perf_counter() - start, len(response.content))
+
+                if _is_rate_limited(response.text):
+                    print("Rate limited, waiting 2 minutes...")
+                    time.sleep(RATE_LIMIT_WAIT)
+                    self.stats.record_retry(RATE_LIMIT_WAIT)
+                else:
+                    break
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            # requests lists the redirects followed, replayed pages don't
+            final_url = getattr(response, "url", requested)
+            if len(getattr(response, "history", ())) > 0 or final_url != requested:
+                self.urls.learn(requested, final_url)
+                self.stats.record_redirect(url)
 
-            if "Access denied" in soup.find("title").string:
-                print("Rate limited, waiting 2 minutes...")
-                time.sleep(120)
-            else:
-                break
+        # Written outside the request lock, so other threads aren't held up
+        self.urls.flush()
+        return response.text
 
+    def _soup_from_url(self, url):
+        """
+        Returns soup object for the given url
+        """
+        html = self._html_from_url(url)
+        soup, parse_time = _timed(BeautifulSoup, html, "html.parser")
+        self.stats.record_page(url, parse_time)
         return soup
 
+    def _pipeline(self, jobs, parse_func, workers=0, max_pending=None):
+        """
+        Fetches the pages for each job and parses them with parse_func. If
+        workers > 0 pages are parsed in a process pool while the next pages
+        are fetched, with at most max_pending parsed pages in flight so
+        memory stays bounded
+        Params:
+            jobs:        iterable of (key, [url], args). The html of each url
+                         is passed to parse_func, followed by args
+            parse_func:  module level function so it can be pickled
+            workers:     int. Number of parser processes, 0 to parse inline
+            max_pending: int. Defaults to 4 * workers
+        Yields:
+            (key, parse_func result) in the order of jobs
+        """
+        def record(urls, parse_time):
+            for url in urls:
+                self.stats.record_page(url, parse_time / len(urls))
+
+        if workers == 0:
+            for key, urls, args in jobs:
+                html = [self._html_from_url(url) for url in urls]
+                result, parse_time = _timed(parse_func, *html, *args)
+                record(urls, parse_time)
+                yield key, result
+            return
+
+        max_pending = max_pending if max_pending is not None else 4 * workers
+        pending = collections.deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for key, urls, args in jobs:
+                # Backpressure, wait for the oldest page before fetching more
+                while len(pending) >= max_pending:
+                    done_key, done_urls, future = pending.popleft()
+                    result, parse_time = future.result()
+                    record(done_urls, parse_time)
+                    yield done_key, result
+                html = [self._html_from_url(url) for url in urls]
+                pending.append((key, urls, pool.submit(_timed, parse_func, *html, *args)))
+            while len(pending) > 0:
+                done_key, done_urls, future = pending.popleft()
+                result, parse_time = future.result()
+                record(done_urls, parse_time)
+                yield done_key, result
+
+    @instrumented
     def get_event_teams(self, event_id, event_name):
         """
         Returns a dictionary of {(team_name: team_id)} for the event in 
         the url
         """
-        url = f"{self.base_url}/events/{event_id}/{event_name}"
+        url = self.urls.event(event_id, event_name)
         soup = self._soup_from_url(url)
 
         teams_html = soup.find("div", {"class": "group"})
@@ -54,17 +423,108 @@ class HLTV():
         team_dict = {}
         for team in teams_html:
             name = team.div.find("div", {"class": "text-ellipsis"}).string
-            id = re.split("/", team.a["href"])[2]
+            id = _path_segment(team.a["href"], 2)
             team_dict[id] = {"name": name}
 
         return team_dict
 
+    @instrumented
+    def get_events(self, start_date, end_date, max_pages=None):
+        """
+        Enumerates the events archive between start_date and end_date
+        Params:
+            start_date: date
+            end_date:   date
+            max_pages:  int. Stop after this many archive pages, None to 
+                        read every page
+        Returns:
+            dictionary
+            {
+                (event_id: {
+                    event_name: string
+                    slug:       string. Name of the event in its url
+                    start_date: string ("%Y-%m-%d") or None
+                    end_date:   string ("%Y-%m-%d") or None
+                    n_teams:    int. Number of teams listed, 0 if unknown
+                })
+            }
+        """
+        events = {}
+        page = 0
+        while max_pages is None or page < max_pages:
+            url = self.urls.events_archive(start_date, end_date, page * ARCHIVE_PAGE_SIZE)
+            soup = self._soup_from_url(url)
+
+            new_events = 0
+            for event in soup.find_all("a", href=_EVENT_HREF_RE):
+                event_id = _path_segment(event["href"], 2)
+                if event_id in events:
+                    continue
+                slug = _path_segment(event["href"], 3).split("?")[0]
+                name = event.find("div", {"class": "text-ellipsis"})
+                name = str(name.string) if name is not None and name.string is not None else slug
+
+                # Dates are in milliseconds since the epoch
+                dates = [
+                    datetime.fromtimestamp(int(span["data-unix"]) / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+                    for span in event.find_all("span", attrs={"data-unix": True})
+                ]
+                teams_td = event.find("td", {"class": "col-value small-col"})
+                n_teams = teams_td.get_text().strip() if teams_td is not None else ""
+
+                events[event_id] = {
+                    "event_name": name,
+                    "slug":       slug,
+                    "start_date": dates[0] if len(dates) > 0 else None,
+                    "end_date":   dates[-1] if len(dates) > 0 else None,
+                    "n_teams":    int(n_teams) if n_teams.isdigit() else 0
+                }
+                new_events += 1
+
+            if new_events == 0:
+                break
+            page += 1
+
+        return events
+
+    @instrumented
+    def get_event_participants(self, event_id, event_name):
+        """
+        Returns a dictionary of {(team_id: {name})} of every team attending
+        the event. Unlike get_event_teams, reads the teams attending list and
+        falls back to every group on the page
+        """
+        url = self.urls.event(event_id, event_name)
+        soup = self._soup_from_url(url)
+
+        team_dict = {}
+        attending = soup.find("div", {"class": "teams-attending"})
+        if attending is not None:
+            for team in attending.find_all("div", {"class": "team-box"}):
+                team_a = team.find("a", href=_TEAM_HREF_RE)
+                if team_a is None:
+                    # Slot not yet decided
+                    continue
+                name = team.find("div", {"class": "text"})
+                id = _path_segment(team_a["href"], 2)
+                name = str(name.string) if name is not None else _path_segment(team_a["href"], 3)
+                team_dict[id] = {"name": name}
+        else:
+            for group in soup.find_all("div", {"class": "group"}):
+                for team in group.find_all("div", {"class": "group-name"}):
+                    name = team.div.find("div", {"class": "text-ellipsis"}).string
+                    id = _path_segment(team.a["href"], 2)
+                    team_dict[id] = {"name": str(name)}
+
+        return team_dict
+
+    @instrumented
     def get_event_team_players(self, team_id, team_name, event_id):
         """
         Returns dictionary {(player_name: player_id)} for the team url
         for the event ID
         """
-        url = f"{self.base_url}/stats/teams/{team_id}/{team_name}?event={event_id}"
+        url = self.urls.team_stats(team_id, team_name, event_id)
         soup = self._soup_from_url(url)
 
         players_html = soup.find("div", {"class": "contentCol"})
@@ -74,11 +534,12 @@ class HLTV():
         players_dict = {}
         for player in players_html:
             name = player.a.div.string
-            id = re.split("/", player.a["href"])[3]
+            id = _path_segment(player.a["href"], 3)
             players_dict[id] = {"name": name}
         
         return players_dict
 
+    @instrumented
     def get_map_ids(self, player_ids, team_id, opponent_ids, 
         latest_date=None, min_players=5):
         """
@@ -92,9 +553,7 @@ class HLTV():
         Returns:
             dictionary {(map_id: [team_id, opponent_id])}
         """
-        url = f"{self.base_url}/stats/lineup/matches?minLineupMatch={min_players}"
-        for id in player_ids:
-            url += f"&lineup={id}"
+        url = self.urls.lineup_matches(player_ids, min_players)
         soup = self._soup_from_url(url)
 
         maps_html = soup.find("table", {"class": "stats-table"}).tbody
@@ -103,25 +562,25 @@ class HLTV():
         map_ids = {}
         for map in maps_html:
             # Check date of map
-            date_td = map.td
+            tds = map.find_all("td", recursive=False)
+            date_td = tds[0]
             date = datetime.strptime(date_td.a.string, "%d/%m/%y").date()
             if latest_date is not None and date > latest_date:
                 continue
             
-            # Get team IDs n.b. strings after an html tag count as the next #
-            # sibling, so double the .next_sibling count to account for the 
-            # new lines in the html document
-            team1_td = date_td.next_sibling.next_sibling.next_sibling.next_sibling.next_sibling.next_sibling
-            team1_id = re.split("/", team1_td.a["href"])[3]
-            team2_id = re.split("/", team1_td.next_sibling.next_sibling.a["href"])[3]
+            # Get team IDs. Only the td tags are listed, so the new lines 
+            # between them don't need to be skipped
+            team1_id = _path_segment(tds[3].a["href"], 3)
+            team2_id = _path_segment(tds[4].a["href"], 3)
 
             # Append if team ids are what we're looking for
             if team1_id == team_id and team2_id in opponent_ids:
-                map_id = re.split("/", date_td.a["href"])[4]
+                map_id = _path_segment(date_td.a["href"], 4)
                 map_ids[map_id] = [team1_id, team2_id]
 
         return map_ids
 
+    @instrumented
     def get_match_info(self, map_ids, team_dict, use_tqdm=True):
         """
         Params:
@@ -166,17 +625,14 @@ class HLTV():
             if map_id not in encountered_map_ids:
 
                 # Get map url
-                map_url = (
-                    f"{self.base_url}/stats/matches/mapstatsid/{map_id}/"
-                    f"{team1_name}-vs-{team2_name}"
-                )
+                map_url = self.urls.map_stats(map_id, team1_name, team2_name)
                 map_soup = self._soup_from_url(map_url)
 
                 # Find match id
                 match_html = map_soup.find("div", {"class": "colCon"})
                 match_html = match_html.find("div", {"class": "match-info-box-con"})
                 match_html = match_html.find("a", {"class": "match-page-link"})
-                match_id = re.split("/", match_html["href"])[2]
+                match_id = _path_segment(match_html["href"], 2)
 
                 # Get info for match
                 match_dict, map_dict, event_id, event_name = self._get_match_info(match_id, team1_name, team2_name)
@@ -198,28 +654,26 @@ class HLTV():
 
         return match_ids, map_picks, event_ids
 
+    @instrumented
     def _get_match_info(self, match_id, team1_name, team2_name):
         """
         Retrieves dictionary of match info
         """
         # Get match url
-        match_url = (
-            f"{self.base_url}/matches/{match_id}/"
-            f"{team1_name}-vs-{team2_name}"
-        )
+        match_url = self.urls.match(match_id, team1_name, team2_name)
         match_soup = self._soup_from_url(match_url)
 
         # Gather the info required
         match_html = match_soup.find("div", {"class": "match-page"})
         team1_div = match_html.div.div
-        team1_id = re.split("/", team1_div.div.a["href"])[2]
+        team1_id = _path_segment(team1_div.div.a["href"], 2)
         team1_score = team1_div.div.a.next_sibling.next_sibling.string
         event_div = team1_div.next_sibling.next_sibling
         event_a = event_div.find("div", {"class": "event"}).a
-        event_id = re.split("/", event_a["href"])[2]
+        event_id = _path_segment(event_a["href"], 2)
         event_name = event_a.string
         team2_div = event_div.next_sibling.next_sibling
-        team2_id = re.split("/", team2_div.div.a["href"])[2]
+        team2_id = _path_segment(team2_div.div.a["href"], 2)
         team2_score = team2_div.div.a.next_sibling.next_sibling.string
 
         format_div = match_html.find("div", {"class": "maps"}).div.div
@@ -250,7 +704,7 @@ class HLTV():
 
             results_div = map.div.next_sibling.next_sibling
             map_stat_link = results_div.div.next_sibling.next_sibling.div.a
-            map_id = re.split("/", map_stat_link["href"])[4]
+            map_id = _path_segment(map_stat_link["href"], 4)
             map_id_list.append(map_id)
 
             if "pick" in results_div.div["class"]:
@@ -270,17 +724,26 @@ class HLTV():
                 "map_ids":     map_id_list
             }
         }
+        if self.records:
+            match_dict[match_id] = Match.from_dict(match_dict[match_id])
 
         return match_dict, map_pick_dict, event_id, event_name
 
+    @instrumented
     def get_map_info(self, teams_dict, matches_dict, map_picks_dict, 
-        use_tqdm=True):
+        use_tqdm=True, workers=0, map_ids=None):
         """
         Params:
             teams_dict:     dictionary returned from self.get_major_teams()
             matches_dict:   dictionary returned from self.get_match_info()
             map_picks_dict: dictionary returned from self.get_match_info()
             use_tqdm:       boolean. Whether to use tqdm
+            workers:        int. Number of processes to parse the overview
+                            pages in, and as many for the economy pages, 0
+                            to parse them as they are fetched
+            map_ids:        list of map ids of matches_dict to fetch, in
+                            this order, as planned by scheduler.py. Every
+                            map of every match in dict order if None
         Returns:
             dictionary
             {
@@ -308,181 +771,55 @@ class HLTV():
             }
             list [invalid_map_ids] list of map_ids that were not mr16 format
         """
-        def im_src_to_win_type(im_src):
-            if im_src == "t_win.svg" or im_src == "ct_win.svg":
-                return "elimination"
-            elif im_src == "bomb_defused.svg":
-                return "defuse"
-            elif im_src == "bomb_exploded.svg":
-                return "bomb"
-            elif im_src == "stopwatch.svg":
-                return "timeout"
-
-        def get_econ(td):
-            equip_val = td["title"][17:]
-            if int(equip_val) > 20_000:
-                return "full_buy", equip_val
-            elif int(equip_val) > 10_000:
-                return "semi_buy", equip_val
-            elif int(equip_val) > 5_000:
-                return "semi_eco", equip_val
-            else:
-                return "eco", equip_val
+        map_matches = {map_id: match for match in matches_dict for map_id in matches_dict[match]["map_ids"]}
+        ordered_ids = list(map_matches) if map_ids is None else map_ids
 
-        map_info_dict = {}
-        invalid_map_ids = []
+        map_teams = {}
 
-        match_keys = tqdm(matches_dict, unit="matches") if use_tqdm else matches_dict
-        for match in match_keys:
-            team1_id = matches_dict[match]["team1_id"]
-            team2_id = matches_dict[match]["team2_id"]
-            team1_name = teams_dict[team1_id]["name"]
-            team2_name = teams_dict[team2_id]["name"]
+        def jobs():
+            items = tqdm(ordered_ids, unit="maps") if use_tqdm else ordered_ids
+            for map_id in items:
+                match = map_matches[map_id]
+                team1_id = matches_dict[match]["team1_id"]
+                team2_id = matches_dict[match]["team2_id"]
+                map_teams[map_id] = (teams_dict[team1_id]["name"], teams_dict[team2_id]["name"])
 
-            for map_id in matches_dict[match]["map_ids"]:
-                # Get map url
-                url = (
-                    f"{self.base_url}/stats/matches/mapstatsid/{map_id}/"
-                    f"{team1_name}-vs-{team2_name}"
-                )
-                soup = self._soup_from_url(url).find("div", {"class": "stats-match"})
-
-                summary_html = soup.find("div", {"class": "wide-grid"}).div.div
-
-                map_date = summary_html.div.div.span.string
-                map_name = re.sub(r"[\n\t\s]*", "", summary_html.div.div.next_sibling)
-
-                # Check team ids are in same order as on match page
-                map_team_1_id = summary_html.div.find("div", {"class": "team-left"})
-                map_team_1_id = re.split("/", map_team_1_id.a["href"])[3]
-                map_team_2_id = summary_html.div.find("div", {"class": "team-right"})
-                map_team_2_id = re.split("/", map_team_2_id.a["href"])[3]
-                if map_team_1_id != team1_id:
-                    print(
-                        f"Mismatched team ids: {team1_id} != {map_team_1_id}"
-                        f"{team2_id} != {map_team_2_id}"
-                    )
-
-                info_rows = summary_html.find_all("div", {"class": "match-info-row"})
-
-                # Scores
-                scores_spans = info_rows[0].find("div", {"class": "right"}).find_all("span")
-                team1_score = scores_spans[0].string
-                team2_score = scores_spans[1].string
-                team1_first_half_score = scores_spans[2].string
-                team2_first_half_score = scores_spans[3].string
-                ct_start_team = map_team_1_id if "ct-color" in scores_spans[2]["class"] else map_team_2_id
-                team1_second_half_score = scores_spans[4].string
-                team2_second_half_score = scores_spans[5].string
-                team1_overtime_score = "0"
-                team2_overtime_score = "0"
-                # Check game was mr16 and not something funky
-                if int(team1_score) < 16 and int(team2_score) < 16:
+                url = self.urls.map_stats(map_id, *map_teams[map_id])
+                args = (team1_id, team2_id, map_picks_dict[map_id])
+                yield map_id, [url], args
+
+        map_info_dict = {}
+        invalid_map_ids = []
+        overviews = {}
+
+        def econ_jobs():
+            # The economy page is only fetched once the overview shows the
+            # map was mr16, so an invalid map costs one request
+            for map_id, map_info in self._pipeline(jobs(), parse_map_overview, workers):
+                team_names = map_teams.pop(map_id)
+                if map_info is None:
                     invalid_map_ids.append(map_id)
                     continue
-                # Check for overtime
-                if int(team1_score) > 16 or int(team2_score) > 16:
-                    overtime_str = re.sub(r"[\n\t\s()]*", "", scores_spans[5].next_sibling)
-                    team1_overtime_score, team2_overtime_score = re.split(":", overtime_str)
-
-                team_ratings = info_rows[1].find("div", {"class": "right"}).string
-                team_ratings = [team_ratings.split()[i] for i in [0, 2]]
-
-                first_kills = info_rows[2].find("div", {"class": "right"}).string
-                first_kills = [first_kills.split()[i] for i in [0, 2]]
-
-                clutches = info_rows[3].find("div", {"class": "right"}).string
-                clutches = [clutches.split()[i] for i in [0, 2]]
-
-                # Players
-                stats_tables = soup.find_all("table", {"class": "stats-table"})
-                team1_players_html = stats_tables[0].find_all("td", {"class": "st-player"})
-                team1_players = [re.split("/", p.a["href"])[3] for p in team1_players_html]
-                team2_players_html = stats_tables[1].find_all("td", {"class": "st-player"})
-                team2_players = [re.split("/", p.a["href"])[3] for p in team2_players_html]
-
-                # Round winner and type
-                # Get url for economy history
-                econ_url = (
-                    f"{self.base_url}/stats/matches/economy/mapstatsid/"
-                    f"{map_id}/{team1_name}-vs-{team2_name}"
-                )
-                econ_soup = self._soup_from_url(econ_url)
-                econ_soup = econ_soup.find_all("table", {"class": "equipment-categories"})
-                econ_exists = False
-                if len(econ_soup) == 2:
-                    first_half_econ = econ_soup[0].find_all("tr")
-                    team1_econ = first_half_econ[0].find_all("td", {"class": "equipment-category-td"})
-                    team2_econ = first_half_econ[1].find_all("td", {"class": "equipment-category-td"})
-                    second_half_econ = econ_soup[1].find_all("tr")
-                    team1_econ.extend(second_half_econ[0].find_all("td", {"class": "equipment-category-td"}))
-                    team2_econ.extend(second_half_econ[1].find_all("td", {"class": "equipment-category-td"}))
-                    econ_exists = True
-
-                rounds = []
-                rounds_html = soup.find("div", {"class": "round-history-con"})
-                rounds_html = rounds_html.find_all("div", {"class": "round-history-team-row"})
-                team1_rounds_html = rounds_html[0].find_all("img", {"class": "round-history-outcome"})
-                team2_rounds_html = rounds_html[1].find_all("img", {"class": "round-history-outcome"})
-                for (im1, im2, econ1, econ2) in zip(team1_rounds_html, team2_rounds_html, team1_econ, team2_econ):
-                    im1_type = re.split("/", im1["src"])[4]
-                    im2_type = re.split("/", im2["src"])[4]
-                    if im1_type != "emptyHistory.svg":
-                        win_type = im_src_to_win_type(im1_type)
-                        win_team = map_team_1_id
-                    elif im2_type != "emptyHistory.svg":
-                        win_type = im_src_to_win_type(im2_type)
-                        win_team = map_team_2_id
-                    else:
-                        # Game finished, rest or scoreboard is empty
-                        break
-                    if econ_exists:
-                        t1_econ_type, t1_econ = get_econ(econ1)
-                        t2_econ_type, t2_econ = get_econ(econ2)
-                        rounds.append({
-                            "round_winner": win_team, 
-                            "round_type": win_type,
-                            "team1_buy": t1_econ,
-                            "team2_buy": t2_econ,
-                            "team1_buy_type": t1_econ_type,
-                            "team2_buy_type": t2_econ_type
-                        })
-                    else:
-                        rounds.append({
-                            "round_winner": win_team, 
-                            "round_type": win_type
-                        })
-
-                # Add to dict
-                map_info_dict[map_id] = {
-                    "date":              map_date,
-                    "map_name":          map_name,
-                    "team1_id":          map_team_1_id,
-                    "team2_id":          map_team_2_id,
-                    "map_picked_by":     map_picks_dict[map_id],
-                    "ct_start_team":     ct_start_team,
-                    "score":             (team1_score, team2_score),
-                    "first_half_score":  (team1_first_half_score, team2_first_half_score),
-                    "second_half_score": (team1_second_half_score, team2_second_half_score),
-                    "overtime_score":    (team1_overtime_score, team2_overtime_score),
-                    "team_rating":       team_ratings,
-                    "first_kills":       first_kills,
-                    "clutches":          clutches,
-                    "rounds":            rounds,
-                    "team1_players":     team1_players,
-                    "team2_players":     team2_players
-                }
+                overviews[map_id] = map_info
+                yield map_id, [self.urls.map_stats(map_id, *team_names, "economy")], ()
+
+        for map_id, econ in self._pipeline(econ_jobs(), parse_econ_page, workers):
+            map_info = add_econ(overviews.pop(map_id), econ)
+            map_info_dict[map_id] = Map.from_dict(map_info) if self.records else map_info
 
         return map_info_dict, invalid_map_ids
 
+    @instrumented
     def get_map_player_info(self, map_dict, player_dict, team_dict, 
-        use_tqdm=True):
+        use_tqdm=True, workers=0):
         """
         Params:
             map_dict:
             player_dict:
             team_dict:
             use_tqdm:       boolean. Whether to use tqdm
+            workers:        int. Number of processes to parse pages in, 0
+                            to parse them as they are fetched
         Returns:
             dictionary
             {
@@ -502,80 +839,34 @@ class HLTV():
             player_dict updated with new players
             teams_dict  updated with new players
         """
-        def get_overview_stats(tr, map_id, team_id, player_dict, team_dict):
-            # Get info
-            tds = tr.find_all("td")
-            player_id = re.split("/", tds[0].div.a["href"])[3]
-            player_name = tds[0].div.a.string
-            kills = tds[1].get_text().split()[0]
-            headshots = re.sub(r"[()]*", "", tds[1].get_text().split()[1])
-            assists = tds[2].get_text().split()[0]
-            flash_assists = re.sub(r"[()]*", "", tds[2].get_text().split()[1])
-            deaths = tds[3].string
-            kast = tds[4].string[:-1]
-            adr = tds[6].string
-            first_kills = tds[7]["title"].split()[0]
-            first_deaths = tds[7]["title"].split()[3]
-            rating = tds[8].string
-
-            # Check player in player_dict
-            if player_id not in player_dict:
-                print(f"{player_name} ({player_id}) not in team {team_dict[team_id]['name']} ({team_id})")
-                player_dict[player_id] = {"name": player_name}
-                team_dict[team_id]["players"].append(player_id)
-
-            stats_dict = {(map_id, player_id): {
-                "kills": kills,
-                "headshots": headshots,
-                "assists": assists,
-                "flash_assists": flash_assists,
-                "deaths": deaths,
-                "kast": kast,
-                "adr": adr,
-                "first_kills": first_kills,
-                "first_deaths": first_deaths,
-                "rating": rating
-            }}
-
-            return stats_dict, player_dict, team_dict
+        def jobs():
+            items = tqdm(map_dict, unit="maps") if use_tqdm else map_dict
+            for map in items:
+                team1_id = map_dict[map]["team1_id"]
+                team2_id = map_dict[map]["team2_id"]
+                team1_name = team_dict[team1_id]["name"]
+                team2_name = team_dict[team2_id]["name"]
+
+                # Get the good soup
+                overview_url = self.urls.map_stats(map, team1_name, team2_name)
+                ### CAN'T FETCH :(
+                # performance_url = self.urls.map_stats(map, team1_name, team2_name, "performance")
+                yield map, [overview_url], ()
 
         player_map_dict = {}
 
-        items = tqdm(map_dict, unit="maps") if use_tqdm else map_dict
-        for map in items:
-            stats_dict = {} # Update smaller dict before adding to main
-
-            team1_id = map_dict[map]["team1_id"]
-            team2_id = map_dict[map]["team2_id"]
-            team1_name = team_dict[team1_id]["name"]
-            team2_name = team_dict[team2_id]["name"]
-
-            # Get the good soup
-            overview_url = (
-                f"{self.base_url}/stats/matches/mapstatsid/{map}/"
-                f"{team1_name}-vs-{team2_name}"
-            )
-            overview_soup = self._soup_from_url(overview_url)
-            overview_soup = overview_soup.find("div", {"class": "stats-match"})
-            ### CAN'T FETCH :(
-            # performance_url = (
-            #     f"{self.base_url}/stats/matches/performance/mapstatsid/{map}/"
-            #     f"{team1_name}-vs-{team2_name}"
-            # )
-            # performance_soup = self._soup_from_url(performance_url)
-
-            # Player stats from overview page
-            stats_html = overview_soup.find_all("table", {"class": "stats-table"})
-            team1_stats_html = stats_html[0].tbody.find_all("tr")
-            team2_stats_html = stats_html[1].tbody.find_all("tr")
-            for tr in team1_stats_html:
-                stats, player_dict, team_dict = get_overview_stats(
-                    tr, map, team1_id, player_dict, team_dict)
-                stats_dict.update(stats)
-            for tr in team2_stats_html:
-                stats, player_dict, team_dict = get_overview_stats(
-                    tr, map, team2_id, player_dict, team_dict)
-                stats_dict.update(stats)
+        for map, team_stats in self._pipeline(jobs(), parse_map_player_page, workers):
+            team_ids = (map_dict[map]["team1_id"], map_dict[map]["team2_id"])
+            for team_id, stats in zip(team_ids, team_stats):
+                for player_id, player_name, stats_dict in stats:
+                    # Check player in player_dict
+                    if player_id not in player_dict:
+                        print(f"{player_name} ({player_id}) not in team {team_dict[team_id]['name']} ({team_id})")
+                        player_dict[player_id] = {"name": player_name}
+                        team_dict[team_id]["players"].append(player_id)
+                    if self.records:
+                        stats_dict = MapPlayerStats.from_dict(stats_dict)
+                    player_map_dict[(map, player_id)] = stats_dict
 
             # Impact stat from performance page
             # impact_html = performance_soup.find("div", {"class": "player-overview"})
@@ -586,6 +877,4 @@ class HLTV():
             #     impact = ast.literal_eval(impact["data-fusionchart-config"])
             #     impact = impact["data"][3]["value"]
 
-            player_map_dict.update(stats_dict)
-
-        return player_map_dict, player_dict, team_dict
\ No newline at end of file
+        return player_map_dict, player_dict, team_dict
@@ -3,42 +3,24 @@ import numpy as np
 
 from datetime import datetime
 
-from main import read_json
+from dataset_generation import TEST_EVENT_IDS, split_maps
+from main import MAJOR_EVENT_ID, read_json
+from matchups import MatchupIndex, print_matchups
 
-def get_matchup_frequencies(team_dict, map_dict):
+def get_matchup_frequencies(team_dict, map_dict, match_dict=None, top_n=20, **filters):
     """
-    Prints frequency of maps played between each team as a table
+    Prints the top_n most frequent matchups of maps played between teams.
+    filters are passed to MatchupIndex.mask (map_name, start_date,
+    end_date, lan), the lan filter needs match_dict
     """
-    # Map team ids to array indicies
-    team_to_idx = {}
-    for i, team in enumerate(team_dict.keys()):
-        team_to_idx[int(team)] = i
-    
-    # Create table
-    freq = np.zeros((len(team_dict), len(team_dict)), dtype="uint8")
-    for map in map_dict:
-        id1 = int(map_dict[map]["team1_id"])
-        id2 = int(map_dict[map]["team2_id"])
-        idx1 = max(team_to_idx[id1], team_to_idx[id2])
-        idx2 = min(team_to_idx[id1], team_to_idx[id2])
-        assert idx1 != idx2 # Sanity check
-        freq[idx1, idx2] += 1
+    index = MatchupIndex(map_dict, match_dict)
 
-    # Sanity check
-    n = np.sum(freq)
-    assert n == len(map_dict)
-
-    # Print table
-    teamnames = [team_dict[t]["name"] for t in team_dict]
-    string = "      "
-    for name in teamnames:
-        string += f"{name[:5]:5} "
-    print(string)
-    for team in team_dict.keys():
-        string = f"{team_dict[team]['name'][:5]:5}"
-        for idx in range(team_to_idx[int(team)]):
-            string += f"{freq[team_to_idx[int(team)], idx]:6}"
-        print(string)
+    # Sanity check, with nothing filtered every map is counted once
+    if len(filters) == 0:
+        _, _, counts = index.counts()
+        assert np.sum(counts) == len(map_dict)
+
+    print_matchups(index.top(top_n, **filters), team_dict)
 
 def get_team_freq(team_dict, map_dict):
     """
@@ -65,12 +47,13 @@ def get_team_freq(team_dict, map_dict):
     ax.set_xlabel("Team")
     plt.show()
 
-def get_team_map_freq(event_dict, match_dict, map_dict, team_dict, train_set_only=True):
+def get_team_map_freq(event_dict, match_dict, map_dict, team_dict, train_set_only=True,
+    test_event_ids=TEST_EVENT_IDS, storage=None):
     """
     Barchart for each team displaying frequency of each map.
     """
     freq = {}
-    test_maps = [map_id for match_id in event_dict["4866"]["match_ids"] for map_id in match_dict[match_id]["map_ids"]]
+    _, test_maps = split_maps(event_dict, match_dict, map_dict, test_event_ids, storage)
     for team in team_dict:
         maps = {}
         for m in ["Inferno", "Overpass", "Vertigo", "Dust2", "Mirage", "Nuke", "Train", "Ancient"]:
@@ -114,33 +97,27 @@ def get_map_freq(map_dict):
     plt.title("Frequency of each map in dataset")
     plt.show()
 
-def get_major_matchup_freq(team_dict, map_dict, match_dict, event_dict):
+def get_major_matchup_freq(team_dict, map_dict, match_dict, event_dict, event_id=str(MAJOR_EVENT_ID),
+    storage=None):
     """
-    Find the frequency of each matchup in the major
+    Find the frequency of each matchup in the major, or event_id. With a
+    Storage, the maps of the event are found by its event index
     """
-    matchups = {}
-    major_maps = []
-    for match in event_dict["4866"]["match_ids"]:
-        t1 = match_dict[match]["team1_id"]
-        t2 = match_dict[match]["team2_id"]
-        matchups[(t1, t2)] = 0
-        major_maps.extend(match_dict[match]["map_ids"])
-
-    for map in map_dict:
-        if map in major_maps:
-            continue
-        t1 = map_dict[map]["team1_id"]
-        t2 = map_dict[map]["team2_id"]
-        if (t1, t2) in matchups:
-            matchups[(t1, t2)] += 1
-
-    matchups_list = []
-    for (t1, t2) in matchups:
-        matchups_list.append((f"{team_dict[t1]['name'][:5]:5}", f"{team_dict[t2]['name'][:5]:5}", matchups[(t1, t2)]))
-
-    matchups_list.sort(key=lambda x: x[2], reverse=True)
-    for t1, t2, freq in matchups_list:
-        print(f"{t1} vs {t2}: {freq}")
+    if storage is not None:
+        event_maps = storage.maps_by_event(event_id)
+        teams = [(m["team1_id"], m["team2_id"]) for m in event_maps.values()]
+        major_maps = list(event_maps)
+    else:
+        teams = [(match_dict[m]["team1_id"], match_dict[m]["team2_id"]) for m in event_dict[event_id]["match_ids"]]
+        major_maps = [map_id for m in event_dict[event_id]["match_ids"] for map_id in match_dict[m]["map_ids"]]
+    pairs = []
+    for pair in teams:
+        if pair not in pairs:
+            pairs.append(pair)
+
+    counts = MatchupIndex(map_dict).pair_counts(pairs, exclude_maps=major_maps)
+    order = np.argsort(-counts, kind="stable")
+    print_matchups([(pairs[i][0], pairs[i][1], counts[i]) for i in order], team_dict)
 
 def get_map_biases(map_dict):
     """
@@ -0,0 +1,338 @@
+import argparse
+import collections
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+
+from datetime import datetime
+
+from artifact_cache import file_hash
+from fixtures import FixtureResponse
+from scrape_stats import url_type
+
+ARCHIVE_DIR = "html_archive"
+ARCHIVE_DB = "pages.db"
+REPARSE_STATE_FILE = "reparse_state.json"
+
+# A dictionary is trained once this many pages are archived without one
+TRAIN_AFTER = 200
+ZSTD_DICT_SIZE = 112640
+ZSTD_LEVEL = 19
+# zlib only looks back 32KB, so that is all of a dictionary it can use
+ZLIB_DICT_SIZE = 32768
+ZLIB_LEVEL = 9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page (
+    id              INTEGER PRIMARY KEY,
+    url             TEXT NOT NULL,
+    page_key        TEXT NOT NULL,
+    url_type        TEXT NOT NULL,
+    fetched_at      REAL NOT NULL,
+    codec           TEXT NOT NULL,
+    dict_id         INTEGER,
+    size            INTEGER NOT NULL,
+    data            BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS page_by_key ON page (page_key, fetched_at);
+CREATE TABLE IF NOT EXISTS dictionary (
+    id              INTEGER PRIMARY KEY,
+    codec           TEXT NOT NULL,
+    created_at      REAL NOT NULL,
+    data            BLOB NOT NULL
+);
+"""
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is required for the zstd codec")
+    return zstandard
+
+def default_codec():
+    """
+    zstd if zstandard is installed, otherwise zlib
+    """
+    try:
+        _zstandard()
+    except ImportError:
+        return "zlib"
+    return "zstd"
+
+def page_key(url):
+    """
+    Path and query of url without its name slugs, the path segment after
+    each id, so a page is found whichever spelling of the names it was
+    requested with
+    """
+    query = ""
+    if "?" in url:
+        url, query = url.split("?", 1)
+        query = "?" + query
+    # The host is left out too, so "www." makes no difference
+    segments = url.split("://", 1)[-1].split("/")[1:]
+    kept = [s for i, s in enumerate(segments) if i == 0 or s.isdigit() or not segments[i - 1].isdigit()]
+    return "/" + "/".join(kept) + query
+
+def _compressor(codec, dict_data=None, level=None):
+    """
+    Returns a function compressing bytes with codec and the dictionary
+    """
+    if codec == "zstd":
+        zstandard = _zstandard()
+        d = zstandard.ZstdCompressionDict(dict_data) if dict_data is not None else None
+        return zstandard.ZstdCompressor(level=level or ZSTD_LEVEL, dict_data=d).compress
+    if codec == "zlib":
+        def compress(data):
+            c = (zlib.compressobj(level or ZLIB_LEVEL, zdict=dict_data) if dict_data is not None
+                else zlib.compressobj(level or ZLIB_LEVEL))
+            return c.compress(data) + c.flush()
+        return compress
+    raise ValueError(f"Unknown codec {codec}")
+
+def _decompressor(codec, dict_data=None):
+    if codec == "zstd":
+        zstandard = _zstandard()
+        d = zstandard.ZstdCompressionDict(dict_data) if dict_data is not None else None
+        return zstandard.ZstdDecompressor(dict_data=d).decompress
+    if codec == "zlib":
+        def decompress(data):
+            d = zlib.decompressobj(zdict=dict_data) if dict_data is not None else zlib.decompressobj()
+            return d.decompress(data) + d.flush()
+        return decompress
+    raise ValueError(f"Unknown codec {codec}")
+
+def train_dictionary(codec, samples):
+    """
+    Trains a dictionary on sample pages. zstd trains its own, for zlib the
+    lines shared by the most samples are joined, most shared last since
+    zlib reaches the end of its dictionary most cheaply
+    """
+    if codec == "zstd":
+        return _zstandard().train_dictionary(ZSTD_DICT_SIZE, list(samples)).as_bytes()
+    counts = collections.Counter(line for page in samples for line in set(page.splitlines(True))
+        if len(line.strip()) > 0)
+    lines = []
+    size = 0
+    for line, n in counts.most_common():
+        if n < 2 or size + len(line) > ZLIB_DICT_SIZE:
+            break
+        lines.append(line)
+        size += len(line)
+    return b"".join(reversed(lines))
+
+class HtmlArchive():
+    """
+    Every fetched page, compressed with a dictionary trained on earlier
+    pages and kept in sqlite by url and fetch time. Pages are looked up by
+    page_key, the latest fetch at or before a time
+    """
+
+    def __init__(self, dirname=ARCHIVE_DIR, codec=None, level=None, train_after=TRAIN_AFTER):
+        """
+        Params:
+            codec:          "zstd" or "zlib", default_codec() if None. Pages
+                            archived with either can always be read back
+            train_after:    pages archived without a dictionary before one
+                            is trained, None to only train with train()
+        """
+        os.makedirs(dirname, exist_ok=True)
+        self.codec = codec if codec is not None else default_codec()
+        self.level = level
+        self.train_after = train_after
+        # Pages are added from the stages' threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(dirname, ARCHIVE_DB), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.decompressors = {}
+        self.dict_id, dict_data = self._latest_dictionary()
+        self.compress = _compressor(self.codec, dict_data, level)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _latest_dictionary(self):
+        row = self.conn.execute("SELECT id, data FROM dictionary WHERE codec = ? ORDER BY id DESC LIMIT 1",
+            (self.codec,)).fetchone()
+        return (None, None) if row is None else (row[0], row[1])
+
+    def put(self, url, content, fetched_at=None):
+        """
+        Archives the content (bytes) of url
+        """
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        with self.lock:
+            with self.conn:
+                self.conn.execute("INSERT INTO page (url, page_key, url_type, fetched_at, codec, dict_id, size, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (url, page_key(url), url_type(url), fetched_at,
+                    self.codec, self.dict_id, len(content), self.compress(content)))
+            if self.dict_id is None and self.train_after is not None:
+                n = self.conn.execute("SELECT COUNT(*) FROM page WHERE dict_id IS NULL").fetchone()[0]
+                if n >= self.train_after:
+                    self._train()
+
+    def _decompress(self, codec, dict_id, data):
+        if (codec, dict_id) not in self.decompressors:
+            dict_data = None
+            if dict_id is not None:
+                dict_data = self.conn.execute("SELECT data FROM dictionary WHERE id = ?", (dict_id,)).fetchone()[0]
+            self.decompressors[(codec, dict_id)] = _decompressor(codec, dict_data)
+        return self.decompressors[(codec, dict_id)](data)
+
+    def get(self, url, as_of=None):
+        """
+        Returns the content of the latest fetch of url at or before as_of (a
+        timestamp, any time if None), None if it was never archived
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT codec, dict_id, data FROM page WHERE page_key = ? AND fetched_at <= ? "
+                "ORDER BY fetched_at DESC LIMIT 1", (page_key(url), as_of if as_of is not None else float("inf"))
+                ).fetchone()
+            return None if row is None else self._decompress(*row)
+
+    def urls(self, kind=None):
+        """
+        Returns the archived urls, optionally only those of the given url type
+        """
+        query = "SELECT DISTINCT url FROM page" + (" WHERE url_type = ?" if kind is not None else "")
+        with self.lock:
+            return [r[0] for r in self.conn.execute(query, () if kind is None else (kind,))]
+
+    def train(self, n_samples=1000):
+        """
+        Trains a dictionary on the latest n_samples pages, spread over the
+        url types, and recompresses the archive with it
+        Returns:
+            id of the new dictionary
+        """
+        with self.lock:
+            return self._train(n_samples)
+
+    def _train(self, n_samples=1000):
+        kinds = [r[0] for r in self.conn.execute("SELECT DISTINCT url_type FROM page")]
+        per_kind = max(n_samples // max(len(kinds), 1), 1)
+        samples = []
+        for kind in kinds:
+            rows = self.conn.execute("SELECT codec, dict_id, data FROM page WHERE url_type = ? "
+                "ORDER BY fetched_at DESC LIMIT ?", (kind, per_kind)).fetchall()
+            samples += [self._decompress(*row) for row in rows]
+        dict_data = train_dictionary(self.codec, samples)
+        with self.conn:
+            self.dict_id = self.conn.execute("INSERT INTO dictionary (codec, created_at, data) VALUES (?, ?, ?)",
+                (self.codec, time.time(), dict_data)).lastrowid
+        self.compress = _compressor(self.codec, dict_data, self.level)
+        self._recompress()
+        return self.dict_id
+
+    def _recompress(self):
+        rows = self.conn.execute("SELECT id, codec, dict_id, data FROM page "
+            "WHERE codec != ? OR dict_id IS NULL OR dict_id != ?", (self.codec, self.dict_id)).fetchall()
+        with self.conn:
+            for page_id, codec, dict_id, data in rows:
+                self.conn.execute("UPDATE page SET codec = ?, dict_id = ?, data = ? WHERE id = ?",
+                    (self.codec, self.dict_id, self.compress(self._decompress(codec, dict_id, data)), page_id))
+
+    def stats(self):
+        """
+        Returns:
+            dictionary {(url_type: {pages, size, stored})}, sizes in bytes
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT url_type, COUNT(*), SUM(size), SUM(LENGTH(data)) FROM page "
+                "GROUP BY url_type").fetchall()
+        return {kind: {"pages": n, "size": size, "stored": stored} for kind, n, size, stored in rows}
+
+class ArchiveSession():
+    """
+    Session which fetches pages with the wrapped session and archives each
+    one. Pass as HLTV(..., session=ArchiveSession(HtmlArchive()))
+    """
+
+    def __init__(self, archive, session=requests):
+        self.archive = archive
+        self.session = session
+
+    def get(self, url):
+        response = self.session.get(url)
+        # Don't archive rate limit pages, the client will retry anyway
+        if b"Access denied" not in response.content:
+            self.archive.put(url, response.content)
+        return response
+
+class ArchiveReplaySession():
+    """
+    Session which serves archived pages without touching the network, as
+    they were at as_of (a timestamp) if given
+    """
+
+    def __init__(self, archive, as_of=None):
+        self.archive = archive
+        self.as_of = as_of
+
+    def get(self, url):
+        content = self.archive.get(url, self.as_of)
+        if content is None:
+            raise KeyError(f"No archived page for {url}")
+        return FixtureResponse(url, content)
+
+def reparse(archive, workers=os.cpu_count(), as_of=None, only=None):
+    """
+    Regenerates the scraped tables from the archive by running every scrape
+    stage on archived pages, with no wait between requests and pages
+    parsed in workers processes. Every listing and map is refetched, so
+    nothing is kept from tables parsed by the old parsers
+    Returns:
+        dictionary {(stage: "ran" or "failed")}, dictionary {(output:
+        whether the reparse changed it)}
+    """
+    # stages.py imports main, which archives pages with this module
+    from HLTV import HLTV
+    from stages import Pipeline, scrape_stages
+
+    hltv = HLTV("hltv.org", timeout=0, session=ArchiveReplaySession(archive, as_of), records=True)
+    pipeline = Pipeline(scrape_stages(hltv, workers=workers, refetch=True), state_file=REPARSE_STATE_FILE)
+    outputs = [f for name, stage in pipeline.stages.items() if only is None or name in only for f in stage.outputs]
+    before = {f: file_hash(f) for f in outputs}
+    # The parsers are what changed, so nothing is current
+    results = pipeline.run(only=only, force=set(pipeline.stages))
+    return results, {f: file_hash(f) != before[f] for f in outputs}
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive of fetched HLTV pages")
+    parser.add_argument("command", choices=["stats", "train", "reparse"])
+    parser.add_argument("--dir", default=ARCHIVE_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parser processes for reparse")
+    parser.add_argument("--as-of", default=None, help="reparse pages as fetched by this \"%%Y-%%m-%%d %%H:%%M\"")
+    parser.add_argument("--stages", nargs="*", default=None, help="only reparse these stages")
+    args = parser.parse_args()
+
+    with HtmlArchive(args.dir) as archive:
+        if args.command == "stats":
+            for kind, s in sorted(archive.stats().items()):
+                print(f"{kind:16} {s['pages']:8} pages {s['size'] / 1e6:10.1f}MB -> "
+                    f"{s['stored'] / 1e6:8.1f}MB ({s['size'] / max(s['stored'], 1):.1f}x)")
+        elif args.command == "train":
+            print(f"Trained dictionary {archive.train()}")
+        else:
+            as_of = datetime.strptime(args.as_of, "%Y-%m-%d %H:%M").timestamp() if args.as_of else None
+            start = time.perf_counter()
+            results, changed = reparse(archive, args.workers, as_of, args.stages)
+            for name, result in results.items():
+                print(f"    {name:20} {result}")
+            print(f"Changed: {', '.join(f for f in changed if changed[f]) or 'nothing'}")
+            print(f"Reparsed in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
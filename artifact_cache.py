@@ -0,0 +1,153 @@
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+CACHE_DIR = "artifact_cache"
+# Least recently used entries beyond this are removed on each store
+MAX_ENTRIES = 32
+ARRAYS_FILE = "arrays.npz"
+
+def file_hash(filename):
+    """
+    Returns the sha256 of a file's content, None if it doesn't exist
+    """
+    if not os.path.exists(filename):
+        return None
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def code_hash(dirname=None):
+    """
+    Hash of every .py file of the repository, so entries made by older code
+    are never returned
+    """
+    dirname = os.path.dirname(os.path.abspath(__file__)) if dirname is None else dirname
+    sha = hashlib.sha256()
+    for filename in sorted(glob.glob(os.path.join(dirname, "*.py"))):
+        sha.update(os.path.basename(filename).encode())
+        sha.update(file_hash(filename).encode())
+    return sha.hexdigest()
+
+class ArtifactCache():
+    """
+    Generated files and arrays stored under a key hashing the content of
+    the input files, the parameters used and the code. A hit copies the
+    stored files back in place of running the generator again
+    """
+
+    def __init__(self, dirname=CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.dirname = dirname
+        self.max_entries = max_entries
+        self.code = code_hash()
+        os.makedirs(dirname, exist_ok=True)
+
+    def key(self, name, inputs, params=None):
+        """
+        Params:
+            name:   what is generated, like the generator's name
+            inputs: files the outputs are generated from
+            params: dictionary of the parameters that change the outputs
+        """
+        sha = hashlib.sha256()
+        sha.update(name.encode())
+        sha.update(repr(sorted((params or {}).items())).encode())
+        for filename in inputs:
+            sha.update(f"{filename}:{file_hash(filename)}".encode())
+        sha.update(self.code.encode())
+        return sha.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.dirname, key)
+
+    def _hit(self, key, filenames):
+        entry = self._entry(key)
+        if not all(os.path.exists(os.path.join(entry, os.path.basename(f))) for f in filenames):
+            return None
+        # Marks the entry as recently used
+        os.utime(entry)
+        return entry
+
+    def restore(self, key, outputs):
+        """
+        Copies the files stored under key to outputs
+        Returns:
+            whether key had all of outputs
+        """
+        entry = self._hit(key, outputs)
+        if entry is None:
+            return False
+        for f in outputs:
+            shutil.copyfile(os.path.join(entry, os.path.basename(f)), f)
+        return True
+
+    def store(self, key, outputs):
+        """
+        Copies outputs into the cache under key
+        """
+        tmp = tempfile.mkdtemp(dir=self.dirname)
+        for f in outputs:
+            shutil.copyfile(f, os.path.join(tmp, os.path.basename(f)))
+        self._commit(tmp, key)
+
+    def _commit(self, tmp, key):
+        # Renamed into place whole, so a half written entry is never read
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.replace(tmp, entry)
+        self.prune()
+
+    def run(self, name, inputs, outputs, build, params=None):
+        """
+        Restores outputs from the cache, or calls build() to write them and
+        stores them
+        Returns:
+            whether outputs came from the cache
+        """
+        key = self.key(name, inputs, params)
+        if self.restore(key, outputs):
+            return True
+        build()
+        self.store(key, outputs)
+        return False
+
+    def load_arrays(self, key):
+        """
+        Returns:
+            dictionary {(name: array)} stored under key, None if there is none
+        """
+        entry = self._hit(key, [ARRAYS_FILE])
+        if entry is None:
+            return None
+        with np.load(os.path.join(entry, ARRAYS_FILE), allow_pickle=False) as arrays:
+            return {name: arrays[name] for name in arrays.files}
+
+    def save_arrays(self, key, **arrays):
+        """
+        Stores arrays under key, uncompressed so they load at disk speed
+        """
+        tmp = tempfile.mkdtemp(dir=self.dirname)
+        np.savez(os.path.join(tmp, ARRAYS_FILE), **arrays)
+        self._commit(tmp, key)
+
+    def entries(self):
+        """
+        Returns [key] from most to least recently used
+        """
+        keys = [k for k in os.listdir(self.dirname) if not k.startswith("tmp")]
+        return sorted(keys, key=lambda k: os.path.getmtime(self._entry(k)), reverse=True)
+
+    def prune(self):
+        for key in self.entries()[self.max_entries:]:
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+
+    def clear(self):
+        for key in self.entries():
+            shutil.rmtree(self._entry(key), ignore_errors=True)
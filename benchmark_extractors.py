@@ -0,0 +1,249 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+from fixtures import RecordingSession, ReplaySession
+from HLTV import HLTV, parse_map_page, parse_map_player_page
+from main import MAJOR_END_DATE, MAJOR_EVENT_ID, read_json
+
+MAJOR_EVENT_NAME = "pgl-major-stockholm-2021"
+
+def load_inputs(n_matches=20):
+    """
+    Loads the dictionaries the extractors are run with from the .json files,
+    restricted to the first n_matches matches
+    """
+    team_dict = read_json("team.json")
+    player_dict = read_json("player.json")
+    match_dict = read_json("match.json")
+    match_dict = {k: match_dict[k] for k in list(match_dict)[:n_matches]}
+
+    map_ids = {}
+    for match in match_dict.values():
+        for map_id in match["map_ids"]:
+            map_ids[map_id] = [match["team1_id"], match["team2_id"]]
+    map_picks = {map_id: None for map_id in map_ids}
+
+    return {
+        "team_dict": team_dict,
+        "player_dict": player_dict,
+        "match_dict": match_dict,
+        "map_ids": map_ids,
+        "map_picks": map_picks
+    }
+
+def synthetic_inputs(inputs, n_maps):
+    """
+    Returns inputs with n_maps synthetic map ids, each a copy of one of the
+    maps in inputs, and the aliases for ReplaySession to serve them
+    """
+    recorded = [(match, map_id) for match in inputs["match_dict"]
+        for map_id in inputs["match_dict"][match]["map_ids"]]
+    match_dict = {}
+    map_picks = {}
+    aliases = {}
+    for i in range(n_maps):
+        match, recorded_id = recorded[i % len(recorded)]
+        map_id = str(10_000_000 + i)
+        match_dict[str(20_000_000 + i)] = dict(inputs["match_dict"][match], map_ids=[map_id])
+        map_picks[map_id] = inputs["map_picks"][recorded_id]
+        aliases[map_id] = recorded_id
+    return dict(inputs, match_dict=match_dict, map_picks=map_picks), aliases
+
+def extractor_calls(inputs, workers=0):
+    """
+    Returns [(extractor name, function(hltv))] running each extractor over
+    the inputs. workers is passed to the extractors that parse in a pool
+    """
+    team_dict = inputs["team_dict"]
+    team_ids = list(team_dict)
+
+    def event_teams(hltv):
+        return hltv.get_event_teams(MAJOR_EVENT_ID, MAJOR_EVENT_NAME)
+
+    def event_team_players(hltv):
+        return [hltv.get_event_team_players(t, team_dict[t]["name"], MAJOR_EVENT_ID)
+            for t in team_ids]
+
+    def map_ids(hltv):
+        return [hltv.get_map_ids(team_dict[t]["players"], t, team_ids,
+            latest_date=MAJOR_END_DATE, min_players=4) for t in team_ids]
+
+    def match_info(hltv):
+        return hltv.get_match_info(inputs["map_ids"], team_dict, use_tqdm=False)
+
+    def match_page(hltv):
+        return [hltv._get_match_info(m,
+            team_dict[inputs["match_dict"][m]["team1_id"]]["name"],
+            team_dict[inputs["match_dict"][m]["team2_id"]]["name"])
+            for m in inputs["match_dict"]]
+
+    def map_info(hltv):
+        return hltv.get_map_info(team_dict, inputs["match_dict"],
+            inputs["map_picks"], use_tqdm=False, workers=workers)
+
+    # get_map_player_info only reads the teams of each map, which the
+    # matches have, so no map pages are fetched in the timed call
+    map_teams = {map_id: {"team1_id": match["team1_id"], "team2_id": match["team2_id"]}
+        for match in inputs["match_dict"].values() for map_id in match["map_ids"]}
+
+    def map_player_info(hltv):
+        return hltv.get_map_player_info(map_teams, dict(inputs["player_dict"]),
+            json.loads(json.dumps(team_dict)), use_tqdm=False, workers=workers)
+
+    return [
+        ("get_event_teams", event_teams),
+        ("get_event_team_players", event_team_players),
+        ("get_map_ids", map_ids),
+        ("get_match_info", match_info),
+        ("_get_match_info", match_page),
+        ("get_map_info", map_info),
+        ("get_map_player_info", map_player_info),
+    ]
+
+def record(n_matches=20):
+    """
+    Fetches the pages needed by every extractor into the fixture corpus
+    """
+    with RecordingSession() as session:
+        hltv = HLTV("hltv.org", session=session)
+        for name, call in extractor_calls(load_inputs(n_matches)):
+            print(f"Recording {name}...")
+            call(hltv)
+
+def benchmark(calls, session, repeat=3):
+    """
+    Times each extractor against the replayed pages
+    Returns:
+        dictionary {(extractor: {seconds, pages, pages_per_sec, peak_kib,
+                                 live_blocks})}, live_blocks counting the
+        blocks allocated by the call still live after it
+    """
+    results = {}
+    for name, call in calls:
+        hltv = HLTV("hltv.org", timeout=0, session=session)
+
+        # Timing, best of repeat
+        best = None
+        try:
+            for _ in range(repeat):
+                hltv.stats.reset()
+                start = time.perf_counter()
+                call(hltv)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        except KeyError as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        pages = sum(hltv.stats.pages.values())
+
+        # Allocations in a separate run as tracing slows everything down
+        tracemalloc.start()
+        call(hltv)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+        results[name] = {
+            "seconds": best,
+            "pages": pages,
+            "pages_per_sec": pages / best if best > 0 else 0.,
+            "peak_kib": peak / 1024,
+            "live_blocks": blocks
+        }
+    return results
+
+def benchmark_parsers(session, inputs, repeat=3):
+    """
+    Times the page parsers alone on the recorded map pages of the maps in
+    inputs, without any of the client's fetching overhead
+    Returns:
+        dictionary {(parser: {pages, ms_per_page, pages_per_sec})}
+    """
+    pages = []
+    for url in session.urls("map_overview"):
+        map_id = url.split("/mapstatsid/")[1].split("/")[0]
+        econ_url = url.replace("/stats/matches/mapstatsid/", "/stats/matches/economy/mapstatsid/")
+        if map_id in inputs["map_ids"] and econ_url in session.index:
+            # The team ids and pick of the match, as get_map_info parses with
+            team1_id, team2_id = inputs["map_ids"][map_id]
+            pages.append((session.get(url).text, session.get(econ_url).text, team1_id, team2_id,
+                inputs["map_picks"][map_id]))
+
+    parsers = [
+        ("parse_map_page", lambda html, econ, *match: parse_map_page(html, econ, *match)),
+        ("parse_map_player_page", lambda html, econ, *match: parse_map_player_page(html)),
+    ]
+    results = {}
+    for name, parse in parsers:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for page in pages:
+                parse(*page)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {
+            "pages": len(pages),
+            "ms_per_page": 1000 * best / len(pages) if len(pages) > 0 else 0.,
+            "pages_per_sec": len(pages) / best if best > 0 else 0.
+        }
+    return results
+
+def print_results(results):
+    print(f"{'extractor':25} {'seconds':>9} {'pages':>7} {'pages/s':>9} {'peak KiB':>10} {'live blks':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:25} {r['seconds']:9.3f} {r['pages']:7} {r['pages_per_sec']:9.1f} "
+            f"{r['peak_kib']:10.0f} {r['live_blocks']:9}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HLTV extractors offline")
+    parser.add_argument("mode", choices=["record", "run"])
+    parser.add_argument("--matches", type=int, default=20,
+        help="number of matches from match.json to record / replay")
+    parser.add_argument("--scale", type=int, default=0,
+        help="also run the map extractors over this many synthetic map pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0,
+        help="number of parser processes for the map extractors")
+    parser.add_argument("--extractors", nargs="*", default=None,
+        help="only run these extractors")
+    parser.add_argument("--output", default=None, help="write results as json")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        record(args.matches)
+        return
+
+    def selected(calls):
+        return [c for c in calls if args.extractors is None or c[0] in args.extractors]
+
+    inputs = load_inputs(args.matches)
+    results = benchmark(selected(extractor_calls(inputs, args.workers)), ReplaySession(), args.repeat)
+    print_results(results)
+
+    parser_results = benchmark_parsers(ReplaySession(), inputs, args.repeat)
+    print(f"\n{'parser':25} {'pages':>7} {'ms/page':>9} {'pages/s':>9}")
+    for name, r in parser_results.items():
+        print(f"{name:25} {r['pages']:7} {r['ms_per_page']:9.2f} {r['pages_per_sec']:9.1f}")
+    results.update(parser_results)
+
+    if args.scale > 0:
+        scaled, aliases = synthetic_inputs(inputs, args.scale)
+        calls = [c for c in selected(extractor_calls(scaled, args.workers))
+            if c[0] in ("get_map_info", "get_map_player_info")]
+        scaled_results = benchmark(calls, ReplaySession(aliases=aliases), repeat=1)
+        print(f"\nSynthetic scale-up: {args.scale} maps")
+        print_results(scaled_results)
+        results.update({f"{k}[scale={args.scale}]": v for k, v in scaled_results.items()})
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
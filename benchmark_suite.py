@@ -0,0 +1,255 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+import analytics
+import dataset_generation
+
+from main import read_json, write_dict
+from synthetic import SyntheticDataset, write_dataset
+
+SCALES = [1, 10]
+SEED = 0
+DATA_DIR = "synthetic"
+RESULTS_DIR = "bench_results"
+THRESHOLD = 0.1
+# Timings shorter than this are too noisy to flag
+MIN_SECONDS = 0.01
+
+TABLES = [("team", "team.json", False), ("player", "player.json", False),
+    ("event", "event.json", False), ("match", "match.json", False),
+    ("map", "map.json", False), ("map_player", "map_player.json", True)]
+
+def dataset_dir(scale, seed=SEED, dirname=DATA_DIR):
+    """
+    Returns the directory of the synthetic dataset of scale, generating it
+    the first time
+    """
+    path = os.path.join(dirname, f"{scale:g}x" if seed == SEED else f"{scale:g}x-seed{seed}")
+    if not all(os.path.exists(os.path.join(path, f)) for _, f, _ in TABLES):
+        print(f"Generating the {scale:g}x dataset in {path}...")
+        write_dataset(path, *SyntheticDataset(scale, seed).generate())
+    return path
+
+def load_tables(path):
+    return {name: read_json(os.path.join(path, f), is_tuple_key) for name, f, is_tuple_key in TABLES}
+
+def cases(path, tables):
+    """
+    Returns [(name, function())] for every benchmarked entry point over the
+    dataset in path, already loaded into tables
+    """
+    team_dict = tables["team"]
+    player_dict = tables["player"]
+    event_dict = tables["event"]
+    match_dict = tables["match"]
+    map_dict = tables["map"]
+    map_player_dict = tables["map_player"]
+
+    def read(filename, is_tuple_key):
+        return lambda: read_json(os.path.join(path, filename), is_tuple_key)
+
+    def write(table):
+        return lambda: write_dict(tables[table], f"{table}.json")
+
+    calls = [(f"read_json[{name}]", read(f, is_tuple_key)) for name, f, is_tuple_key in TABLES]
+    calls += [(f"write_dict[{name}]", write(name)) for name in ("match", "map", "map_player")]
+
+    calls += [
+        ("get_matchup_frequencies", lambda: analytics.get_matchup_frequencies(team_dict, map_dict, match_dict)),
+        ("get_team_freq", lambda: analytics.get_team_freq(team_dict, map_dict)),
+        ("get_map_freq", lambda: analytics.get_map_freq(map_dict)),
+        ("get_major_matchup_freq", lambda: analytics.get_major_matchup_freq(team_dict, map_dict, match_dict, event_dict)),
+        ("get_map_biases", lambda: analytics.get_map_biases(map_dict)),
+        ("get_map_dates", lambda: analytics.get_map_dates(map_dict)),
+        ("maps_without_econ_stats", lambda: analytics.maps_without_econ_stats(map_dict)),
+    ]
+    # One subplot per team on a 4x4 grid
+    if len(team_dict) <= 16:
+        calls.append(("get_team_map_freq", lambda: analytics.get_team_map_freq(
+            event_dict, match_dict, map_dict, team_dict, train_set_only=False)))
+
+    calls += [
+        ("round_prediction_generator", lambda: dataset_generation.round_prediction_generator(
+            event_dict, match_dict, map_dict, team_dict)),
+        ("rating_prediction_generator", lambda: dataset_generation.rating_prediction_generator(
+            event_dict, match_dict, map_dict, map_player_dict, player_dict)),
+        ("map_prediction_simple_generator", lambda: dataset_generation.map_prediction_simple_generator(
+            event_dict, match_dict, map_dict, team_dict)),
+        ("map_prediction_generator", lambda: dataset_generation.map_prediction_generator(
+            event_dict, match_dict, map_dict, team_dict)),
+    ]
+    return calls
+
+def _run(call):
+    """
+    Runs call without its printing or plot windows
+    """
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        # plt.show is a no-op under Agg and warns about it
+        warnings.simplefilter("ignore", UserWarning)
+        call()
+    plt.close("all")
+
+def benchmark(calls, repeat=3, memory=True):
+    """
+    Times each call, best of repeat, and measures its peak allocations in a
+    separate run. Files the calls write go to a temporary directory
+    Returns:
+        dictionary {(name: {seconds, peak_kib})}
+    """
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for name, call in calls:
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    _run(call)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                results[name] = {"seconds": best}
+
+                # Allocations in a separate run as tracing slows everything down
+                if memory:
+                    tracemalloc.start()
+                    _run(call)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    results[name]["peak_kib"] = peak / 1024
+        finally:
+            os.chdir(cwd)
+    return results
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def current_commit():
+    """
+    Returns the HEAD commit hash and whether tracked files have changes
+    """
+    commit = _git("rev-parse", "HEAD")
+    dirty = bool(_git("status", "--porcelain", "--untracked-files=no"))
+    return commit, dirty
+
+def results_file(commit, dirname=RESULTS_DIR):
+    return os.path.join(dirname, f"{commit}.json")
+
+def save_results(results, commit, dirty, dirname=RESULTS_DIR):
+    os.makedirs(dirname, exist_ok=True)
+    filename = results_file(commit, dirname)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({"commit": commit, "dirty": dirty, "date": time.strftime("%Y-%m-%d %H:%M"),
+            "python": sys.version.split()[0], "results": results}, f, indent=4)
+    return filename
+
+def find_baseline(commit, dirname=RESULTS_DIR):
+    """
+    Returns the most recent ancestor of commit with saved results, or None
+    """
+    ancestors = _git("rev-list", "--max-count=1000", f"{commit}~1") if commit is not None else None
+    for ancestor in (ancestors or "").split():
+        if os.path.exists(results_file(ancestor, dirname)):
+            return ancestor
+    return None
+
+def load_results(commit, dirname=RESULTS_DIR):
+    """
+    Reads the results saved for commit, which may be an abbreviated hash
+    """
+    full = _git("rev-parse", commit) or commit
+    with open(results_file(full, dirname)) as handle:
+        return json.loads(handle.read())
+
+def compare(results, baseline, threshold=THRESHOLD, min_seconds=MIN_SECONDS):
+    """
+    Compares each result against the baseline
+    Returns:
+        [(case, metric, baseline value, value, relative change)] of every
+        metric more than threshold worse than the baseline
+    """
+    regressions = []
+    for case, r in results.items():
+        if case not in baseline:
+            continue
+        for metric, value in r.items():
+            old = baseline[case].get(metric)
+            if old is None or old <= 0 or (metric == "seconds" and old < min_seconds):
+                continue
+            change = value / old - 1
+            if change > threshold:
+                regressions.append((case, metric, old, value, change))
+    return regressions
+
+def print_results(results, baseline=None):
+    print(f"{'case':45} {'seconds':>9} {'peak KiB':>11} {'change':>8}")
+    for case, r in results.items():
+        change = ""
+        if baseline is not None and case in baseline and baseline[case]["seconds"] > 0:
+            change = f"{100 * (r['seconds'] / baseline[case]['seconds'] - 1):+7.1f}%"
+        peak = f"{r['peak_kib']:11.0f}" if "peak_kib" in r else f"{'-':>11}"
+        print(f"{case:45} {r['seconds']:9.3f} {peak} {change:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the loaders, analytics and dataset generators")
+    parser.add_argument("--scales", type=float, nargs="*", default=SCALES,
+        help="synthetic dataset sizes, as multiples of the current dataset")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--cases", nargs="*", default=None, help="only run these cases")
+    parser.add_argument("--baseline", default=None,
+        help="commit to compare against, default the latest ancestor with results")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+        help="relative slowdown or memory growth counted as a regression")
+    parser.add_argument("--no-save", action="store_true", help="don't save the results")
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scales:
+        path = dataset_dir(scale, args.seed)
+        calls = cases(os.path.abspath(path), load_tables(path))
+        calls = [c for c in calls if args.cases is None or c[0] in args.cases]
+        print(f"Running {len(calls)} cases on the {scale:g}x dataset...")
+        scale_results = benchmark(calls, args.repeat, not args.no_memory)
+        results.update({f"{k}[scale={scale:g}]": v for k, v in scale_results.items()})
+
+    commit, dirty = current_commit()
+    baseline_commit = args.baseline if args.baseline is not None else find_baseline(commit)
+    baseline = load_results(baseline_commit)["results"] if baseline_commit is not None else None
+
+    print()
+    print_results(results, baseline)
+    if commit is not None and not args.no_save:
+        print(f"\nResults saved to {save_results(results, commit, dirty)}"
+            + (" (uncommitted changes)" if dirty else ""))
+
+    if baseline is None:
+        print("No baseline to compare against")
+        return
+    regressions = compare(results, baseline, args.threshold)
+    print(f"\n{len(regressions)} regressions against {baseline_commit[:10]} (threshold {100 * args.threshold:.0f}%)")
+    for case, metric, old, value, change in regressions:
+        print(f"    {case:45} {metric:8} {old:12.3f} -> {value:12.3f} {100 * change:+7.1f}%")
+    if len(regressions) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
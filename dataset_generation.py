@@ -1,36 +1,124 @@
+import inspect
+import os
+
+from contextlib import nullcontext
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from datetime import datetime
-
-from main import read_json
-
-def round_prediction_generator(event_dict, match_dict, map_dict, team_dict):
+from artifact_cache import ArtifactCache
+from economy import TEAM_FEATURES as ECONOMY_FEATURES, economy_features, round_table
+from export import export_splits
+from feature_store import FeatureStore
+from main import MAJOR_EVENT_ID, read_json
+from momentum import TEAM_FEATURES as MOMENTUM_FEATURES, momentum_features
+from player_stats import player_form_features
+from storage import DB_FILENAME, Storage
+from ratings import chrono_map_ids, rating_features
+from validation import RULES, load_valid_maps
+
+# Maps of these events form the test sets, the rest the train sets
+TEST_EVENT_IDS = [str(MAJOR_EVENT_ID)]
+
+# Files written by each generator
+OUTPUTS = {
+    "round_prediction_generator": ["round_prediction_no_round_type_train.csv",
+        "round_prediction_no_round_type_test.csv"],
+    "rating_prediction_generator": ["map_player_train.csv", "map_player_test.csv"],
+    "map_prediction_simple_generator": ["map_prediction_train.csv", "map_prediction_test.csv"],
+    "map_prediction_generator": ["map_prediction_train.csv", "map_prediction_test.csv"],
+}
+
+# Validation rules the maps of each generator are loaded with. Only the
+# round generator reads buys, so the others keep maps without econ stats
+MAP_RULES = [r for r in RULES if r != "econ"]
+GENERATOR_RULES = {"round_prediction_generator": RULES}
+
+# File each generator argument is read from. The maps are validated
+# against the teams, events and matches, so depend on those too
+TABLE_FILES = {
+    "team_dict": ["team.json"],
+    "player_dict": ["player.json"],
+    "event_dict": ["event.json"],
+    "match_dict": ["match.json"],
+    "map_dict": ["map.json", "team.json", "event.json", "match.json"],
+    "map_player_dict": ["map_player.json"],
+}
+
+def split_maps(event_dict, match_dict, map_dict, test_event_ids=TEST_EVENT_IDS, storage=None):
+    """
+    Splits the maps in map_dict into maps of the test events and the rest
+    Params:
+        storage:    Storage holding the same tables, whose event index
+                    finds the test maps in place of event_dict and
+                    match_dict
+    Returns:
+        train_maps, test_maps
+    """
+    if storage is not None:
+        test_maps = [map_id for event_id in test_event_ids for map_id in storage.map_ids_by_event(event_id)
+            if map_id in map_dict]
+    else:
+        test_maps = [map_id for event_id in test_event_ids for match_id in event_dict[event_id]["match_ids"]
+            for map_id in match_dict[match_id]["map_ids"] if map_id in map_dict]
+    test_set = set(test_maps)
+    train_maps = [map_id for map_id in map_dict if map_id not in test_set]
+    return train_maps, test_maps
+
+def round_prediction_generator(event_dict, match_dict, map_dict, team_dict, economy=False,
+    momentum=False, test_event_ids=TEST_EVENT_IDS, storage=None):
     """
     Create train and test sets of
     (map, ct_team_name, t_team_name, ct_buy, t_buy, round_type, round_winner)
-    round_winner == 0 if ct win else 1
+    round_winner == 0 if ct win else 1. If economy is True, each row also
+    gets both teams' economy state from economy.py, and if momentum is
+    True their streaks and scores from momentum.py, as ct_ and t_ columns
+    inserted before round_winner
     """
-    test_maps = [map_id for match_id in event_dict["4866"]["match_ids"] for map_id in match_dict[match_id]["map_ids"]]
-    train_maps = [map_id for map_id in map_dict if map_id not in test_maps]
-
-    train_dict = _round_prediction_generator(train_maps, map_dict, team_dict)
-    test_dict = _round_prediction_generator(test_maps, map_dict, team_dict)
+    train_maps, test_maps = split_maps(event_dict, match_dict, map_dict, test_event_ids, storage)
 
     columns = ["map", "ct_team_name", "t_team_name", "ct_buy", "t_buy", "round_winner"]
-    train = pd.DataFrame.from_dict(train_dict, orient="index", columns=columns)
-    test = pd.DataFrame.from_dict(test_dict, orient="index", columns=columns)
-
-    train.to_csv("round_prediction_no_round_type_train.csv", index=False)
-    test.to_csv("round_prediction_no_round_type_test.csv", index=False)
+    # Rows are streamed to the files rather than collected first
+    train = _round_prediction_generator(train_maps, map_dict, team_dict)
+    test = _round_prediction_generator(test_maps, map_dict, team_dict)
+
+    if economy or momentum:
+        train = _join_round_features(pd.DataFrame(list(train), columns=columns), train_maps, map_dict,
+            economy, momentum)
+        test = _join_round_features(pd.DataFrame(list(test), columns=columns), test_maps, map_dict,
+            economy, momentum)
+        columns = list(train.columns)
+
+    export_splits({
+        "round_prediction_no_round_type_train.csv": train,
+        "round_prediction_no_round_type_test.csv": test
+    }, columns)
+
+def _join_round_features(df, map_ids, map_dict, economy, momentum):
+    # Rows are in the same (map, round) order as the features. The ct team
+    # is chosen as in _round_prediction_generator
+    rounds = round_table(map_dict, map_ids)
+    t1_is_ct = rounds["t1_ct_start"].to_numpy() == (rounds["round"].to_numpy() < 15)
+    features = []
+    if economy:
+        features.append((economy_features(map_dict, rounds=rounds), ECONOMY_FEATURES))
+    if momentum:
+        m = momentum_features(map_dict, rounds=rounds)
+        df["rounds_since_pistol"] = m["rounds_since_pistol"].to_numpy()
+        df["prev_round_type"] = m["prev_round_type"].to_numpy()
+        features.append((m, MOMENTUM_FEATURES))
+    for f, names in features:
+        for name in names:
+            t1 = f[f"t1_{name}"].to_numpy()
+            t2 = f[f"t2_{name}"].to_numpy()
+            df[f"ct_{name}"] = np.where(t1_is_ct, t1, t2)
+            df[f"t_{name}"] = np.where(t1_is_ct, t2, t1)
+    cols = [c for c in df.columns if c != "round_winner"] + ["round_winner"]
+    return df[cols]
 
 def _round_prediction_generator(map_ids, map_dict, team_dict):
-    output = {}
     for id in map_ids:
-        if id == "113205":
-            # map without econ stats
-            continue
         for i, round in enumerate(map_dict[id]["rounds"]):
             row = []
             row.append(map_dict[id]["map_name"])
@@ -51,27 +139,39 @@ def _round_prediction_generator(map_ids, map_dict, team_dict):
             row.append(t2_buy if ct_team == t1_id else t1_buy)
             # row.append(round["round_type"])
             row.append(0 if round["round_winner"] == ct_team else 1)
-            output[f"{id}-round-{i}"] = row
-    return output
+            yield row
 
-def rating_prediction_generator(event_dict, match_dict, map_dict, map_player_dict, player_dict):
-    test_maps = [map_id for match_id in event_dict["4866"]["match_ids"] for map_id in match_dict[match_id]["map_ids"]]
-    train_maps = [map_id for map_id in map_dict if map_id not in test_maps]
+def rating_prediction_generator(event_dict, match_dict, map_dict, map_player_dict, player_dict, form_features=False,
+    test_event_ids=TEST_EVENT_IDS, storage=None):
+    """
+    Create train and test sets of the per map player stats. If form_features
+    is True, each row also gets the player's prior form from player_stats,
+    inserted before the rating column
+    """
+    train_maps, test_maps = split_maps(event_dict, match_dict, map_dict, test_event_ids, storage)
 
-    train_dict = _rating_prediction_generator(train_maps, map_player_dict, player_dict)
-    test_dict = _rating_prediction_generator(test_maps, map_player_dict, player_dict)
+    train = _rating_prediction_generator(train_maps, map_player_dict, player_dict)
+    test = _rating_prediction_generator(test_maps, map_player_dict, player_dict)
 
     columns = ["map_id", "player_id", "player_name", "kills", "headshots", 
         "assists", "flash_assists", "deaths", "kast", "adr", "first_kills", 
         "first_deaths", "rating"]
-    train = pd.DataFrame.from_dict(train_dict, orient="index", columns=columns)
-    test = pd.DataFrame.from_dict(test_dict, orient="index", columns=columns)
 
-    train.to_csv("map_player_train.csv", index=False)
-    test.to_csv("map_player_test.csv", index=False)
+    if form_features:
+        features = player_form_features(map_player_dict, map_dict)
+        train = _join_form_features(pd.DataFrame(list(train), columns=columns), features)
+        test = _join_form_features(pd.DataFrame(list(test), columns=columns), features)
+        columns = list(train.columns)
+
+    export_splits({"map_player_train.csv": train, "map_player_test.csv": test}, columns)
+
+def _join_form_features(df, features):
+    df = df.join(features, on=["map_id", "player_id"])
+    cols = [c for c in df.columns if c != "rating"] + ["rating"]
+    return df[cols]
 
 def _rating_prediction_generator(map_ids, map_player_dict, player_dict):
-    output = {}
+    map_ids = set(map_ids)
     for (map, player), mp_dict in map_player_dict.items():
         if map not in map_ids:
             continue
@@ -80,12 +180,11 @@ def _rating_prediction_generator(map_ids, map_player_dict, player_dict):
         row.append(player)
         row.append(player_dict[player]["name"])
         row.extend(list(mp_dict.values()))
-        output[f"{map}, {player}"] = row
-    return output
+        yield row
 
-def map_prediction_simple_generator(event_dict, match_dict, map_dict, team_dict):
-    test_maps = [map_id for match_id in event_dict["4866"]["match_ids"] for map_id in match_dict[match_id]["map_ids"]]
-    train_maps = [map_id for map_id in map_dict if map_id not in test_maps]
+def map_prediction_simple_generator(event_dict, match_dict, map_dict, team_dict, test_event_ids=TEST_EVENT_IDS,
+    storage=None):
+    train_maps, test_maps = split_maps(event_dict, match_dict, map_dict, test_event_ids, storage)
 
     train_dict = _map_prediction_simple_generator(train_maps, map_dict, team_dict)
     test_dict = _map_prediction_simple_generator(test_maps, map_dict, team_dict)
@@ -96,11 +195,10 @@ def map_prediction_simple_generator(event_dict, match_dict, map_dict, team_dict)
         "team2_name", "team2_rating", "team2_first_kill_win", "team2_clutches", 
         "team2_buy_vs_buy", "team2_buy_vs_eco", "team2_eco_vs_buy", "team2_eco_vs_eco",
         "map_winner"]
-    train = pd.DataFrame.from_dict(train_dict, orient="index", columns=columns)
-    test = pd.DataFrame.from_dict(test_dict, orient="index", columns=columns)
-
-    train.to_csv("map_prediction_train.csv", index=False)
-    test.to_csv("map_prediction_test.csv", index=False)
+    export_splits({
+        "map_prediction_train.csv": train_dict.values(),
+        "map_prediction_test.csv": test_dict.values()
+    }, columns)
 
 def _map_prediction_simple_generator(map_ids, map_dict, team_dict):
     output = {}
@@ -138,39 +236,21 @@ def _map_prediction_simple_generator(map_ids, map_dict, team_dict):
         output[map] = row
     return output
 
-def map_prediction_generator(event_dict, match_dict, map_dict, team_dict):
-    test_maps = [map_id for match_id in event_dict["4866"]["match_ids"] for map_id in match_dict[match_id]["map_ids"]]
-    train_maps = [map_id for map_id in map_dict if map_id not in test_maps]
+def map_prediction_generator(event_dict, match_dict, map_dict, team_dict, rating_method=None,
+    test_event_ids=TEST_EVENT_IDS, storage=None):
+    """
+    Create train and test sets of each team's cumulative form before each
+    map. If rating_method is "elo" or "glicko", each row also gets the
+    teams' ratings before the map from ratings.RatingEngine
+    """
+    train_maps, test_maps = split_maps(event_dict, match_dict, map_dict, test_event_ids, storage)
     test_maps = chrono_order_maps(test_maps, map_dict)
     train_maps = chrono_order_maps(train_maps, map_dict)
 
-    tracking_dict = {}
-    for team in team_dict:
-        team_tracking_dict = {
-            "counter": 0,
-            "sum_rating": 0.,
-            "wins": 0.,
-            "sum_round_diff": 0,
-            "sum_opponent_rating": 0.,
-            "sum_fk_success": 0.,
-            "sum_fk_diff": 0
-        }
-        for m in ["Inferno", "Overpass", "Vertigo", "Dust2", "Mirage", "Nuke", "Train", "Ancient"]:
-            team_tracking_dict.update({
-                m: {
-                    "counter": 0,
-                    "sum_rating": 0.,
-                    "wins": 0.,
-                    "sum_round_diff": 0,
-                    "sum_opponent_rating": 0.,
-                    "sum_fk_success": 0.,
-                    "sum_fk_diff": 0
-                }
-            })
-        tracking_dict[team_dict[team]["name"].replace(" ", "_")] = team_tracking_dict
-
-    train_dict, tracking_dict = _map_prediction_generator(train_maps, tracking_dict, map_dict, team_dict)
-    test_dict, _ = _map_prediction_generator(test_maps, tracking_dict, map_dict, team_dict)
+    # Each map only sees maps played before it, whichever split it is in
+    store = FeatureStore(map_dict, team_dict)
+    train_dict = store.map_prediction_rows(train_maps, map_dict)
+    test_dict = store.map_prediction_rows(test_maps, map_dict)
 
     cols = [
         "map_name", "picked_by_t1", "t1_starts_ct",
@@ -185,128 +265,98 @@ def map_prediction_generator(event_dict, match_dict, map_dict, team_dict):
         "winner"
     ]
 
-    train = pd.DataFrame.from_dict(train_dict, orient="index", columns=cols)
-    test = pd.DataFrame.from_dict(test_dict, orient="index", columns=cols)
-
-    train.to_csv("map_prediction_train.csv", index=False)
-    test.to_csv("map_prediction_test.csv", index=False)
+    if rating_method is not None:
+        # Ratings are computed over all maps in date order, before each map
+        ratings = rating_features(map_dict, rating_method)
+        for d in (train_dict, test_dict):
+            for map in d:
+                d[map][-1:-1] = ratings[map]
+        cols[-1:-1] = [f"t1_{rating_method}", f"t2_{rating_method}",
+            f"t1_map_{rating_method}", f"t2_map_{rating_method}",
+            f"t1_{rating_method}_win_prob"]
+
+    export_splits({
+        "map_prediction_train.csv": train_dict.values(),
+        "map_prediction_test.csv": test_dict.values()
+    }, cols)
     
 
 def chrono_order_maps(map_ids, map_dict):
     # Chronologically order map_ids
-    map_date_list = []
-    for map in map_ids:
-        dt = datetime.strptime(map_dict[map]["date"], "%Y-%m-%d %H:%M")
-        map_date_list.append((map, dt))
-    map_date_list.sort(key=lambda x: x[1])
-    return [x[0] for x in map_date_list]
-
-def _map_prediction_generator(map_ids, tracking_dict, map_dict, team_dict):
-    output = {}
-    for map in map_ids:
-        map_name = map_dict[map]["map_name"]
-        t1_name = team_dict[map_dict[map]["team1_id"]]["name"].replace(" ", "_")
-        t2_name = team_dict[map_dict[map]["team2_id"]]["name"].replace(" ", "_")
-        t1 = tracking_dict[t1_name]
-        t2 = tracking_dict[t2_name]
-        
-        # Add to output
-        with np.errstate(divide='ignore', invalid='ignore'):
-            row = np.array([
-                np.true_divide(t1["sum_rating"], float(t1["counter"])),
-                np.true_divide(t1["wins"], float(t1["counter"])),
-                np.true_divide(t1["sum_round_diff"], float(t1["counter"])),
-                np.true_divide(t1["sum_opponent_rating"], float(t1["counter"])),
-                np.true_divide(t1["sum_fk_success"], float(t1["counter"])),
-                np.true_divide(t1["sum_fk_diff"], float(t1["counter"])),
-                np.true_divide(t1[map_name]["sum_rating"], float(t1[map_name]["counter"])),
-                np.true_divide(t1[map_name]["wins"], float(t1[map_name]["counter"])),
-                np.true_divide(t1[map_name]["sum_round_diff"], float(t1[map_name]["counter"])),
-                np.true_divide(t1[map_name]["sum_opponent_rating"], float(t1[map_name]["counter"])),
-                np.true_divide(t1[map_name]["sum_fk_success"], float(t1[map_name]["counter"])),
-                np.true_divide(t1[map_name]["sum_fk_diff"], float(t1[map_name]["counter"])),
-                np.true_divide(t2["sum_rating"], float(t2["counter"])),
-                np.true_divide(t2["wins"], float(t2["counter"])),
-                np.true_divide(t2["sum_round_diff"], float(t2["counter"])),
-                np.true_divide(t2["sum_opponent_rating"], float(t2["counter"])),
-                np.true_divide(t2["sum_fk_success"], float(t2["counter"])),
-                np.true_divide(t2["sum_fk_diff"], float(t2["counter"])),
-                np.true_divide(t2[map_name]["sum_rating"], float(t2[map_name]["counter"])),
-                np.true_divide(t2[map_name]["wins"], float(t2[map_name]["counter"])),
-                np.true_divide(t2[map_name]["sum_round_diff"], float(t2[map_name]["counter"])),
-                np.true_divide(t2[map_name]["sum_opponent_rating"], float(t2[map_name]["counter"])),
-                np.true_divide(t2[map_name]["sum_fk_success"], float(t2[map_name]["counter"])),
-                np.true_divide(t2[map_name]["sum_fk_diff"], float(t2[map_name]["counter"]))
-            ])
-            row[row == np.inf] = 0
-            row = np.nan_to_num(row)
-            row = row.tolist()
-        row.insert(0, map_name)
-        if map_dict[map]["map_picked_by"] == map_dict[map]["team1_id"]:
-            picked_by = "t1"
-        elif map_dict[map]["map_picked_by"] == map_dict[map]["team2_id"]:
-            picked_by = "t2"
+    return chrono_map_ids(map_dict, map_ids)
+
+def generator_rules(generator):
+    """
+    Validation rules the maps passed to generator are loaded with
+    """
+    return GENERATOR_RULES.get(generator.__name__, MAP_RULES)
+
+def load_tables(names, tables=None, rules=MAP_RULES):
+    """
+    Reads the tables named as generator arguments, like "map_dict", into
+    tables, skipping those already there. The maps are kept per rule set,
+    under ("map_dict", rules)
+    """
+    tables = {} if tables is None else tables
+    for name in names:
+        key = (name, tuple(rules)) if name == "map_dict" else name
+        if key in tables:
+            continue
+        if name == "map_dict":
+            # Maps failing validation are left out
+            load_tables(["match_dict", "event_dict", "team_dict"], tables)
+            tables[key] = load_valid_maps(match_dict=tables["match_dict"],
+                event_dict=tables["event_dict"], team_dict=tables["team_dict"], rules=rules)
         else:
-            picked_by = "decider"
-        row.insert(1, picked_by)
-        row.insert(2, map_dict[map]["ct_start_team"] == map_dict[map]["team1_id"])
-        row.insert(3, t1_name)
-        row.insert(4, t1["counter"])
-        row.insert(11, t1[map_name]["counter"])
-        row.insert(18, t2_name)
-        row.insert(19, t2["counter"])
-        row.insert(26, t2[map_name]["counter"])
-        row.append("t1" if int(map_dict[map]["score"][0]) > int(map_dict[map]["score"][1]) else "t2")
-        output[map] = row
+            tables[key] = read_json(TABLE_FILES[name][0], is_tuple_key=name == "map_player_dict")
+    return tables
 
-        # Update tracking_dict
-        score = (int(map_dict[map]["score"][0]), int(map_dict[map]["score"][1]))
-        rating = (float(map_dict[map]["team_rating"][0]), float(map_dict[map]["team_rating"][1]))
-        fk = (int(map_dict[map]["first_kills"][0]), int(map_dict[map]["first_kills"][1]))
-
-        t1["counter"] += 1
-        t1["sum_rating"] += rating[0]
-        t1["wins"] += (1 if score[0] > score[1] else 0)
-        t1["sum_round_diff"] += (score[0] - score[1])
-        t1["sum_opponent_rating"] += rating[1]
-        t1["sum_fk_success"] += (fk[0] / float(fk[0] + fk[1]))
-        t1["sum_fk_diff"] += (fk[0] - fk[1])
-        t1[map_name]["counter"] += 1
-        t1[map_name]["sum_rating"] += rating[0]
-        t1[map_name]["wins"] += (1 if score[0] > score[1] else 0)
-        t1[map_name]["sum_round_diff"] += (score[0] - score[1])
-        t1[map_name]["sum_opponent_rating"] += rating[1]
-        t1[map_name]["sum_fk_success"] += (fk[0] / float(fk[0] + fk[1]))
-        t1[map_name]["sum_fk_diff"] += (fk[0] - fk[1])
-        t2["counter"] += 1
-        t2["sum_rating"] += rating[1]
-        t2["wins"] += (0 if score[0] > score[1] else 1)
-        t2["sum_round_diff"] += (score[1] - score[0])
-        t2["sum_opponent_rating"] += rating[0]
-        t2["sum_fk_success"] += (fk[1] / float(fk[0] + fk[1]))
-        t2["sum_fk_diff"] += (fk[1] - fk[0])
-        t2[map_name]["counter"] += 1
-        t2[map_name]["sum_rating"] += rating[1]
-        t2[map_name]["wins"] += (0 if score[0] > score[1] else 1)
-        t2[map_name]["sum_round_diff"] += (score[1] - score[0])
-        t2[map_name]["sum_opponent_rating"] += rating[0]
-        t2[map_name]["sum_fk_success"] += (fk[1] / float(fk[0] + fk[1]))
-        t2[map_name]["sum_fk_diff"] += (fk[1] - fk[0])
-    
-    return output, tracking_dict
+def generate(generator, cache=None, tables=None, storage=None, **params):
+    """
+    Runs generator on the .json tables with params. With an ArtifactCache,
+    the outputs are restored without reading any table when the input
+    files, params, validation rules and code are unchanged since they were
+    cached
+    Params:
+        tables:     dictionary of tables already read, shared between calls
+        storage:    Storage the test maps are split off with. Its test
+                    maps are part of the cache key
+    Returns:
+        whether the outputs came from the cache
+    """
+    names = [p for p in inspect.signature(generator).parameters if p in TABLE_FILES]
+    rules = generator_rules(generator)
+    tables = {} if tables is None else tables
+
+    def build():
+        load_tables(names, tables, rules)
+        generator(*[tables[(n, tuple(rules)) if n == "map_dict" else n] for n in names], storage=storage,
+            **params)
+
+    if cache is None:
+        build()
+        return False
+    inputs = sorted({f for n in names for f in TABLE_FILES[n]})
+    key_params = dict(params, rules=rules)
+    if storage is not None:
+        # The database decides which maps are test maps, so they are part
+        # of the key. The indexed query only reads the test events' rows
+        key_params["test_maps"] = [storage.map_ids_by_event(e)
+            for e in params.get("test_event_ids", TEST_EVENT_IDS)]
+    hit = cache.run(generator.__name__, inputs, OUTPUTS[generator.__name__], build, key_params)
+    if hit:
+        print(f"{generator.__name__}: outputs restored from cache")
+    return hit
 
 def main():
-    team_dict = read_json("team.json")
-    player_dict = read_json("player.json")
-    event_dict = read_json("event.json")
-    match_dict = read_json("match.json")
-    map_dict = read_json("map.json")
-    map_player_dict = read_json("map_player.json", is_tuple_key=True)
-
-    # round_prediction_generator(event_dict, match_dict, map_dict, team_dict)
-    # rating_prediction_generator(event_dict, match_dict, map_dict, map_player_dict, player_dict)
-    # map_prediction_simple_generator(event_dict, match_dict, map_dict, team_dict)
-    map_prediction_generator(event_dict, match_dict, map_dict, team_dict)
+    cache = ArtifactCache()
+    tables = {}
+    # The database written by main.py, when there is one, finds the test maps
+    with Storage() if os.path.exists(DB_FILENAME) else nullcontext() as storage:
+        # generate(round_prediction_generator, cache, tables, storage)
+        # generate(rating_prediction_generator, cache, tables, storage)
+        # generate(map_prediction_simple_generator, cache, tables, storage)
+        generate(map_prediction_generator, cache, tables, storage)
     
     # ratings = np.array([float(map_player_dict[map]["rating"]) for map in map_player_dict])
     # mean = np.mean(ratings)
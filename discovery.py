@@ -0,0 +1,108 @@
+import argparse
+
+from datetime import date
+from tqdm import tqdm
+
+from HLTV import HLTV
+from main import get_map_ids, write_dict
+from urls import REDIRECT_FILE
+
+def event_priority(event):
+    """
+    Sort key for events, biggest and most recent first
+    """
+    return (event["n_teams"], event["end_date"] or "")
+
+def discover_events(hltv, start_date, end_date, min_teams=0, max_events=None, max_pages=None):
+    """
+    Lists the events in the archive between start_date and end_date
+    Params:
+        min_teams:  int. Ignore events with fewer teams listed. Events with
+                    an unknown number of teams are kept
+        max_events: int. Only keep the highest priority events
+    Returns:
+        [(event_id, event)] highest priority first, as in HLTV.get_events
+    """
+    events = hltv.get_events(start_date, end_date, max_pages=max_pages)
+    events = [(id, e) for id, e in events.items() if e["n_teams"] == 0 or e["n_teams"] >= min_teams]
+    events.sort(key=lambda x: event_priority(x[1]), reverse=True)
+    return events if max_events is None else events[:max_events]
+
+def discover_teams(hltv, events, max_teams=None, use_tqdm=True):
+    """
+    Finds the teams attending events, deduplicated across events, and each
+    team's roster at the latest event it attended
+    Params:
+        events:     [(event_id, event)] as returned by discover_events
+        max_teams:  int. Stop once this many teams are found
+    Returns:
+        team_dict   {(team_id: {name, players, events, roster_event})}
+        player_dict {(player_id: {name})}
+    """
+    team_dict = {}
+    items = tqdm(events, unit="events") if use_tqdm else events
+    for event_id, event in items:
+        for team_id, team in hltv.get_event_participants(event_id, event["slug"]).items():
+            if team_id not in team_dict:
+                if max_teams is not None and len(team_dict) >= max_teams:
+                    continue
+                team_dict[team_id] = {"name": team["name"], "players": [], "events": [],
+                    "roster_event": event_id, "roster_date": event["end_date"] or ""}
+            team = team_dict[team_id]
+            team["events"].append(event_id)
+            if (event["end_date"] or "") > team["roster_date"]:
+                team["roster_event"] = event_id
+                team["roster_date"] = event["end_date"]
+
+    player_dict = {}
+    items = tqdm(team_dict.items(), unit="teams") if use_tqdm else team_dict.items()
+    for team_id, team in items:
+        players = hltv.get_event_team_players(team_id, team["name"], team["roster_event"])
+        team["players"] = list(players)
+        del team["roster_date"]
+        for player_id, player in players.items():
+            if player_id not in player_dict:
+                player_dict[player_id] = player
+
+    return team_dict, player_dict
+
+def discover(hltv, start_date, end_date, min_teams=0, max_events=None, max_teams=None,
+    min_players=4, use_tqdm=True):
+    """
+    Runs discovery then the existing map id stage over the found teams
+    Returns:
+        team_dict, player_dict, event_dict as in discover_teams and
+        discover_events, and map_ids as in main.get_map_ids
+    """
+    events = discover_events(hltv, start_date, end_date, min_teams, max_events)
+    team_dict, player_dict = discover_teams(hltv, events, max_teams, use_tqdm)
+    # Teams without a known roster can't be searched for by lineup
+    searchable = {t: v for t, v in team_dict.items() if len(v["players"]) >= min_players}
+    map_ids = get_map_ids(hltv, searchable, latest_date=end_date, min_players=min_players)
+    return team_dict, player_dict, dict(events), map_ids
+
+def main():
+    parser = argparse.ArgumentParser(description="Discover events, teams and maps on HLTV")
+    parser.add_argument("--start", default="2021-01-01", help="first event date (YYYY-MM-DD)")
+    parser.add_argument("--end", default="2021-11-07", help="last event date (YYYY-MM-DD)")
+    parser.add_argument("--min-teams", type=int, default=8, help="ignore smaller events")
+    parser.add_argument("--max-events", type=int, default=None)
+    parser.add_argument("--max-teams", type=int, default=None)
+    parser.add_argument("--min-players", type=int, default=4,
+        help="players of a roster that must play for a map to be included")
+    args = parser.parse_args()
+
+    hltv = HLTV("hltv.org", redirect_file=REDIRECT_FILE)
+    team_dict, player_dict, event_dict, map_ids = discover(hltv,
+        date.fromisoformat(args.start), date.fromisoformat(args.end), args.min_teams,
+        args.max_events, args.max_teams, args.min_players)
+
+    write_dict(team_dict, "discovered_teams.json")
+    write_dict(player_dict, "discovered_players.json")
+    write_dict(event_dict, "discovered_events.json")
+    write_dict(map_ids, "discovered_map_ids.json")
+    hltv.urls.save()
+    hltv.stats.to_json("scrape_stats.json")
+
+if __name__ == "__main__":
+    main()
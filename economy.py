@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from main import read_json
+
+BUY_TYPES = ["eco", "semi_eco", "semi_buy", "full_buy"]
+ECO_TYPES = [BUY_TYPES.index("eco"), BUY_TYPES.index("semi_eco")]
+FULL_BUY = BUY_TYPES.index("full_buy")
+
+# Loss bonus per player is LOSS_BONUS_BASE + LOSS_BONUS_STEP * level. The
+# level starts each half at 1, goes up on a loss and down on a win
+LOSS_BONUS_BASE = 1400
+LOSS_BONUS_STEP = 500
+LOSS_BONUS_START = 1
+LOSS_BONUS_MAX = 4
+
+# Per team columns of economy_features, prefixed t1_ and t2_
+TEAM_FEATURES = ["loss_streak", "loss_bonus", "eco_streak", "rounds_since_full_buy",
+    "prev_buy", "buy_diff"]
+
+def round_halves(round_numbers):
+    """
+    Half of each round from its 0 based number in the map: 0 and 1 for
+    regulation, then 2, 3, ... for each 3 round half of overtime
+    """
+    round_numbers = np.asarray(round_numbers, dtype="int64")
+    return np.where(round_numbers < 30, round_numbers // 15, 2 + (round_numbers - 30) // 3)
+
+def round_table(map_dict, map_ids=None):
+    """
+    Flattens the rounds of map_ids (all maps if None) into columns, the
+    only pass over the round dictionaries
+    Returns:
+        DataFrame with a row per round in map order: map_id, round, half,
+        round_in_half, t1_ct_start, t1_ct, t1_won, round_type, t1_buy, t2_buy (NaN
+        without econ stats) and t1_buy_type, t2_buy_type (codes into
+        BUY_TYPES, -1 without econ stats)
+    """
+    map_ids = list(map_dict.keys()) if map_ids is None else list(map_ids)
+    buy_codes = {b: i for i, b in enumerate(BUY_TYPES)}
+    n_rounds = np.array([len(map_dict[m]["rounds"]) for m in map_ids], dtype="int64")
+    rounds = [r for m in map_ids for r in map_dict[m]["rounds"]]
+    team1 = np.repeat(np.array([map_dict[m]["team1_id"] for m in map_ids], dtype=object), n_rounds)
+    t1_starts_ct = np.repeat(np.array([map_dict[m]["ct_start_team"] == map_dict[m]["team1_id"]
+        for m in map_ids], dtype=bool), n_rounds)
+
+    starts = np.cumsum(n_rounds) - n_rounds
+    round_numbers = np.arange(len(rounds)) - np.repeat(starts, n_rounds)
+    halves = round_halves(round_numbers)
+    half_starts = np.where(halves < 2, 15 * halves, 30 + 3 * (halves - 2))
+    # Sides swap at half time, and overtime starts on the sides of the second half
+    swapped = (halves == 1) | ((halves >= 2) & (halves % 2 == 0))
+
+    def buys(key):
+        return np.array([r.get(key, np.nan) for r in rounds], dtype="float64")
+
+    def buy_types(key):
+        return np.array([buy_codes.get(r.get(key), -1) for r in rounds], dtype="int8")
+
+    return pd.DataFrame({
+        "map_id":        np.repeat(np.array(map_ids, dtype=object), n_rounds),
+        "round":         round_numbers,
+        "half":          halves,
+        "round_in_half": round_numbers - half_starts,
+        "t1_ct_start":   t1_starts_ct,
+        "t1_ct":         t1_starts_ct ^ swapped,
+        "t1_won":        np.array([r["round_winner"] for r in rounds], dtype=object) == team1,
+        "round_type":    np.array([r["round_type"] for r in rounds], dtype=object),
+        "t1_buy":        buys("team1_buy"),
+        "t2_buy":        buys("team2_buy"),
+        "t1_buy_type":   buy_types("team1_buy_type"),
+        "t2_buy_type":   buy_types("team2_buy_type"),
+    })
+
+def run_length_before(flags, starts):
+    """
+    Number of consecutive True flags immediately before each row, counting
+    back no further than the row's group start
+    Params:
+        flags:  bool array, rows sorted by group
+        starts: index of the first row of each row's group
+    """
+    flags = np.asarray(flags, dtype=bool)
+    idx = np.arange(len(flags))
+    # Index after the latest False before each row
+    after_false = np.zeros(len(flags), dtype="int64")
+    after_false[1:] = np.maximum.accumulate(np.where(~flags, idx + 1, 0))[:-1]
+    return idx - np.maximum(after_false, starts)
+
+def _loss_bonus_levels(t1_won, round_in_half):
+    """
+    Loss bonus level of team1 and team2 before each round. The level is a
+    clamped walk, so it is stepped one round of the half at a time across
+    every half of every map at once
+    """
+    n = len(t1_won)
+    levels = np.full((n, 2), LOSS_BONUS_START, dtype="int64")
+    steps = np.where(np.asarray(t1_won, dtype=bool)[:, None], [-1, 1], [1, -1])
+    for k in range(1, int(round_in_half.max(initial=0)) + 1):
+        rows = np.flatnonzero(round_in_half == k)
+        levels[rows] = np.clip(levels[rows - 1] + steps[rows - 1], 0, LOSS_BONUS_MAX)
+    return levels
+
+def economy_features(map_dict, map_ids=None, rounds=None):
+    """
+    Reconstructs each team's economy across every map, before each round:
+    loss streaks and loss bonus, eco runs, rounds since the last full buy,
+    the previous round's buy and the buy difference. Everything resets at
+    each half, including overtime halves
+    Params:
+        rounds: frame from round_table, built from map_dict if None
+    Returns:
+        DataFrame with the columns of round_table and, for each of t1 and
+        t2, {t}_loss_streak, {t}_loss_bonus, {t}_eco_streak (eco rounds in
+        a row up to and including this one, pistols excluded),
+        {t}_rounds_since_full_buy, {t}_prev_buy and {t}_buy_diff, plus
+        pistol. Buy features are NaN on maps without econ stats
+    """
+    df = round_table(map_dict, map_ids) if rounds is None else rounds.copy()
+    round_in_half = df["round_in_half"].to_numpy()
+    idx = np.arange(len(df))
+    starts = idx - round_in_half
+    pistol = round_in_half == 0
+    df["pistol"] = pistol
+
+    t1_won = df["t1_won"].to_numpy(dtype=bool)
+    levels = _loss_bonus_levels(t1_won, round_in_half)
+    for i, (t, o) in enumerate([("t1", "t2"), ("t2", "t1")]):
+        won = t1_won if i == 0 else ~t1_won
+        buy = df[f"{t}_buy"].to_numpy()
+        buy_type = df[f"{t}_buy_type"].to_numpy()
+        has_econ = buy_type >= 0
+
+        df[f"{t}_loss_streak"] = run_length_before(~won, starts)
+        df[f"{t}_loss_bonus"] = LOSS_BONUS_BASE + LOSS_BONUS_STEP * levels[:, i]
+
+        eco = np.isin(buy_type, ECO_TYPES) & ~pistol
+        df[f"{t}_eco_streak"] = np.where(has_econ,
+            np.where(eco, run_length_before(eco, starts) + 1, 0), np.nan)
+        df[f"{t}_rounds_since_full_buy"] = np.where(has_econ,
+            run_length_before(buy_type != FULL_BUY, starts), np.nan)
+
+        prev_buy = np.full(len(df), np.nan)
+        prev_buy[1:] = buy[:-1]
+        df[f"{t}_prev_buy"] = np.where(pistol, np.nan, prev_buy)
+        df[f"{t}_buy_diff"] = buy - df[f"{o}_buy"].to_numpy()
+    return df
+
+def main():
+    map_dict = read_json("map.json")
+    features = economy_features(map_dict)
+    features.to_csv("economy.csv", index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import csv
+import gzip
+
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 50000
+
+def _format(filename):
+    """
+    Output format from the file extension: .parquet, .csv.gz, .csv.zst or csv
+    """
+    if filename.endswith(".parquet"):
+        return "parquet"
+    if filename.endswith(".gz"):
+        return "gzip"
+    if filename.endswith(".zst"):
+        return "zstd"
+    return "csv"
+
+class ChunkedWriter():
+    """
+    Writes rows to a csv (optionally gzip or zstd compressed) or parquet
+    file a chunk at a time, so memory is bounded by chunk_size whatever the
+    number of rows. Csv chunks of rows or columns go straight to csv.writer,
+    DataFrames and parquet chunks through pandas / pyarrow. pyarrow is
+    needed for parquet and zstandard for zstd
+    """
+
+    def __init__(self, filename, columns, chunk_size=CHUNK_SIZE, lineterminator="\n"):
+        self.filename = filename
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.lineterminator = lineterminator
+        self.format = _format(filename)
+        self.rows = []
+        self.header = True
+        self.n_rows = 0
+
+        if self.format == "parquet":
+            try:
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("pyarrow is required to export parquet files")
+            self.parquet = pyarrow.parquet
+            self.handle = None
+        elif self.format == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstandard is required to export .zst files")
+            self.handle = zstandard.open(filename, "wt", newline="", encoding="utf-8")
+        elif self.format == "gzip":
+            self.handle = gzip.open(filename, "wt", newline="", encoding="utf-8")
+        else:
+            self.handle = open(filename, "w", newline="", encoding="utf-8")
+        if self.handle is not None:
+            self.writer = csv.writer(self.handle, lineterminator=lineterminator)
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def write_columns(self, columns):
+        """
+        Writes a chunk given as a dictionary {(column: [values])}
+        """
+        self.flush()
+        self._write_chunk(list(zip(*[columns[c] for c in self.columns])))
+
+    def write_frame(self, df):
+        """
+        Writes a DataFrame in slices of chunk_size rows
+        """
+        self.flush()
+        for start in range(0, len(df), self.chunk_size):
+            self._write_frame(df.iloc[start:start + self.chunk_size])
+
+    def flush(self):
+        if len(self.rows) > 0:
+            self._write_chunk(self.rows)
+            self.rows = []
+
+    def _write_chunk(self, rows):
+        if self.format == "parquet":
+            self._write_frame(pd.DataFrame(rows, columns=self.columns))
+            return
+        if self.header:
+            self.writer.writerow(self.columns)
+            self.header = False
+        self.writer.writerows(rows)
+        self.n_rows += len(rows)
+
+    def _write_frame(self, df):
+        if self.format == "parquet":
+            import pyarrow
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            if self.handle is None:
+                self.handle = self.parquet.ParquetWriter(self.filename, table.schema)
+            self.handle.write_table(table)
+        else:
+            df.to_csv(self.handle, header=self.header, index=False,
+                lineterminator=self.lineterminator)
+        self.header = False
+        self.n_rows += len(df)
+
+    def close(self):
+        self.flush()
+        if self.header:
+            # Nothing was written, still write the header
+            self._write_frame(pd.DataFrame([], columns=self.columns))
+        if self.handle is not None:
+            self.handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def export_rows(rows, filename, columns, chunk_size=CHUNK_SIZE):
+    """
+    Writes rows, any iterable of lists or a DataFrame, to filename
+    Returns:
+        number of rows written
+    """
+    with ChunkedWriter(filename, columns, chunk_size) as writer:
+        if isinstance(rows, pd.DataFrame):
+            writer.write_frame(rows)
+        else:
+            writer.write_rows(rows)
+    return writer.n_rows
+
+def export_splits(splits, columns, chunk_size=CHUNK_SIZE):
+    """
+    Writes each split on its own thread, so compressing and writing the
+    train set overlaps with the test set
+    Params:
+        splits:  dictionary {(filename: rows)}, rows as in export_rows
+        columns: column names, shared by every split
+    Returns:
+        dictionary {(filename: number of rows written)}
+    """
+    with ThreadPoolExecutor(max_workers=max(len(splits), 1)) as executor:
+        futures = {f: executor.submit(export_rows, rows, f, columns, chunk_size)
+            for f, rows in splits.items()}
+        return {f: future.result() for f, future in futures.items()}
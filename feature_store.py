@@ -0,0 +1,200 @@
+import numpy as np
+
+from main import read_json
+from ratings import MAP_NAMES, chrono_map_ids
+
+STATS = ["counter", "sum_rating", "wins", "sum_round_diff", "sum_opponent_rating",
+    "sum_fk_success", "sum_fk_diff"]
+
+# Bits of the int64 sort key used for a map's chronological rank
+_RANK_BITS = 32
+
+def _to_minutes(dates):
+    """
+    Converts "%Y-%m-%d %H:%M" strings to int64 minutes since the epoch
+    """
+    dates = np.char.replace(np.asarray(dates, dtype=str), " ", "T")
+    return dates.astype("datetime64[m]").astype("int64")
+
+class _CumulativeTable():
+    """
+    Rows of per team stats sorted by (group, rank) with the cumulative sum
+    of the stats restarted at each group, so the total of a group over any
+    range of ranks is two binary searches and at most one subtraction, and
+    a total from the group's first map is summed exactly as a replay would
+    """
+
+    def __init__(self, group_keys, ranks, values):
+        self.group_idx = {}
+        codes = np.empty(len(group_keys), dtype="int64")
+        for i, key in enumerate(group_keys):
+            codes[i] = self.group_idx.setdefault(key, len(self.group_idx))
+
+        keys = (codes << _RANK_BITS) | ranks
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        values = values[order]
+        # Row i + 1 is the total of its group up to and including row i
+        self.cumsum = np.zeros((len(values) + 1, values.shape[1]))
+        bounds = np.flatnonzero(np.diff(self.keys >> _RANK_BITS)) + 1
+        for start, end in zip(np.append(0, bounds), np.append(bounds, len(values))):
+            np.cumsum(values[start:end], axis=0, out=self.cumsum[start + 1:end + 1])
+
+    def totals(self, group_keys, ranks, since=None):
+        """
+        Sum of the stats of each group over ranks in [since, ranks),
+        vectorized over the queries. Unknown groups get zeros
+        """
+        codes = np.array([self.group_idx.get(k, -1) for k in group_keys], dtype="int64")
+        known = codes >= 0
+        codes = np.where(known, codes, 0) << _RANK_BITS
+        start = np.searchsorted(self.keys, codes, side="left")
+        hi = np.searchsorted(self.keys, codes | ranks, side="left")
+        lo = np.minimum(np.searchsorted(self.keys, codes | (0 if since is None else since), side="left"), hi)
+        # Totals up to hi and lo, zero when they're at the group's start
+        totals = np.where((hi > start)[:, None], self.cumsum[hi], 0.)
+        totals -= np.where((lo > start)[:, None], self.cumsum[lo], 0.)
+        totals[~known] = 0
+        return totals
+
+class FeatureStore():
+    """
+    Point in time store of the cumulative per team and per team per map
+    stats behind dataset_generation.map_prediction_generator. Each map
+    gets a rank in chrono_map_ids order and as-of queries only see maps of
+    lower rank, so features for any split of maps match replaying every map
+    in order, without the replay
+    """
+
+    def __init__(self, map_dict, team_dict, map_names=MAP_NAMES):
+        """
+        Params:
+            map_dict:   dictionary. Maps to build the store from
+            team_dict:  dictionary. Used for team names, which are the keys
+                        of every query as in map_prediction_generator
+            map_names:  map names to keep per map stats for
+        """
+        self.team_dict = team_dict
+        self.map_ids = chrono_map_ids(map_dict)
+        self.map_rank = {m: i for i, m in enumerate(self.map_ids)}
+        maps = [map_dict[m] for m in self.map_ids]
+        n = len(maps)
+        self.minutes = _to_minutes([m["date"] for m in maps])
+
+        score = np.array([m["score"] for m in maps], dtype="int64").reshape(n, 2)
+        rating = np.array([m["team_rating"] for m in maps], dtype="float64").reshape(n, 2)
+        fk = np.array([m["first_kills"] for m in maps], dtype="int64").reshape(n, 2)
+        t1_won = score[:, 0] > score[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fk_success = fk / fk.sum(axis=1, keepdims=True).astype("float64")
+
+        values = np.concatenate([np.column_stack([
+            np.ones(n),
+            rating[:, side],
+            t1_won if side == 0 else ~t1_won,
+            score[:, side] - score[:, 1 - side],
+            rating[:, 1 - side],
+            np.nan_to_num(fk_success[:, side]),
+            fk[:, side] - fk[:, 1 - side]
+        ]) for side in range(2)])
+
+        ranks = np.tile(np.arange(n, dtype="int64"), 2)
+        team_names = [self.team_name(m[f"team{side + 1}_id"]) for side in range(2) for m in maps]
+        self.team_table = _CumulativeTable(team_names, ranks, values)
+
+        map_rows = np.array([m["map_name"] in map_names for m in maps] * 2, dtype=bool)
+        map_keys = [(t, m["map_name"]) for t, m in zip(team_names, maps * 2)]
+        self.team_map_table = _CumulativeTable([k for k, keep in zip(map_keys, map_rows) if keep],
+            ranks[map_rows], values[map_rows])
+
+    def team_name(self, team_id):
+        return self.team_dict[team_id]["name"].replace(" ", "_")
+
+    def rank_as_of(self, dates):
+        """
+        Rank of the first map played at or after each "%Y-%m-%d %H:%M" date
+        """
+        return np.searchsorted(self.minutes, _to_minutes(dates), side="left")
+
+    def as_of(self, team_names, ranks, map_names=None, since=None):
+        """
+        Cumulative stats of each team over maps ranked before ranks
+        Params:
+            team_names: [string] team names, as returned by team_name
+            ranks:      [int] ranks from map_rank or rank_as_of
+            map_names:  [string] to only count maps of these names
+            since:      int. Only count maps of at least this rank
+        Returns:
+            np.array (len(team_names), len(STATS)) of stat totals
+        """
+        ranks = np.asarray(ranks, dtype="int64")
+        if map_names is None:
+            return self.team_table.totals(team_names, ranks, since)
+        return self.team_map_table.totals(list(zip(team_names, map_names)), ranks, since)
+
+    def averages(self, team_names, ranks, map_names=None, since=None):
+        """
+        Returns (counters, averages) where averages are the other STATS
+        divided by the counter, 0 where the team has no maps
+        """
+        totals = self.as_of(team_names, ranks, map_names, since)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            averages = np.nan_to_num(totals[:, 1:] / totals[:, :1], posinf=0., neginf=0.)
+        return totals[:, 0].astype("int64"), averages
+
+    def team_form(self, team_id, date, map_name=None, since=None):
+        """
+        Live lookup of a team's form before date, as a dictionary of STATS
+        averages. since is an optional date to only count later maps
+        """
+        rank = self.rank_as_of([date])
+        since = None if since is None else int(self.rank_as_of([since])[0])
+        counters, averages = self.averages([self.team_name(team_id)], rank,
+            None if map_name is None else [map_name], since)
+        form = {"counter": int(counters[0])}
+        form.update({f"av_{s[4:] if s.startswith('sum_') else s}": float(a)
+            for s, a in zip(STATS[1:], averages[0])})
+        return form
+
+    def map_prediction_rows(self, map_ids, map_dict):
+        """
+        Returns dictionary {(map_id: row)} in the format of
+        dataset_generation.map_prediction_generator, for any maps in the store
+        """
+        maps = [map_dict[m] for m in map_ids]
+        ranks = [self.map_rank[m] for m in map_ids]
+        map_names = [m["map_name"] for m in maps]
+        names = [[self.team_name(m[f"team{side + 1}_id"]) for m in maps] for side in range(2)]
+        features = [(self.averages(names[side], ranks), self.averages(names[side], ranks, map_names))
+            for side in range(2)]
+
+        output = {}
+        for i, (map, m) in enumerate(zip(map_ids, maps)):
+            if m["map_picked_by"] == m["team1_id"]:
+                picked_by = "t1"
+            elif m["map_picked_by"] == m["team2_id"]:
+                picked_by = "t2"
+            else:
+                picked_by = "decider"
+            row = [map_names[i], picked_by, m["ct_start_team"] == m["team1_id"]]
+            for side in range(2):
+                row.append(names[side][i])
+                for counters, averages in features[side]:
+                    row.append(int(counters[i]))
+                    row.extend(averages[i].tolist())
+            row.append("t1" if int(m["score"][0]) > int(m["score"][1]) else "t2")
+            output[map] = row
+        return output
+
+def main():
+    team_dict = read_json("team.json")
+    map_dict = read_json("map.json")
+    store = FeatureStore(map_dict, team_dict)
+    date = map_dict[store.map_ids[-1]]["date"] if len(store.map_ids) > 0 else "2100-01-01 00:00"
+    for team in team_dict:
+        form = store.team_form(team, date)
+        print(f"{team_dict[team]['name'][:15]:15} maps: {form['counter']:4} " \
+            f"win proportion: {form['av_wins']:.2f} av rating: {form['av_rating']:.2f}")
+
+if __name__ == "__main__":
+    main()
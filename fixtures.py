@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import requests
+
+from scrape_stats import url_type
+
+FIXTURE_VERSION = 1
+FIXTURE_DIR = "fixtures"
+# Pages recorded between writes of the index
+SAVE_EVERY = 100
+
+class FixtureResponse():
+    """
+    Minimal stand in for requests.Response for replayed pages
+    """
+
+    def __init__(self, url, content, status_code=200):
+        self.url = url
+        self.content = content
+        self.status_code = status_code
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+def fixture_path(dirname=FIXTURE_DIR, version=FIXTURE_VERSION):
+    return os.path.join(dirname, f"v{version}")
+
+def _url_key(url):
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+def _read_index(path):
+    index_file = os.path.join(path, "index.json")
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file) as handle:
+        return json.loads(handle.read())
+
+class RecordingSession():
+    """
+    Session which fetches pages with the wrapped session and saves each one
+    into the fixture corpus. Pass as HLTV(..., session=RecordingSession()).
+    The index is written every save_every pages and on close
+    """
+
+    def __init__(self, dirname=FIXTURE_DIR, version=FIXTURE_VERSION, session=requests,
+        save_every=SAVE_EVERY):
+        self.path = fixture_path(dirname, version)
+        self.session = session
+        self.save_every = save_every
+        os.makedirs(self.path, exist_ok=True)
+        self.index = _read_index(self.path)
+        self.unsaved = 0
+
+    def get(self, url):
+        response = self.session.get(url)
+        # Don't record rate limit pages, the client will retry anyway
+        if b"Access denied" in response.content:
+            return response
+        key = _url_key(url)
+        with open(os.path.join(self.path, f"{key}.html"), "wb") as f:
+            f.write(response.content)
+        self.index[url] = {"file": f"{key}.html", "url_type": url_type(url)}
+        self.unsaved += 1
+        if self.unsaved >= self.save_every:
+            self.save()
+        return response
+
+    def save(self):
+        with open(os.path.join(self.path, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=4)
+        self.unsaved = 0
+
+    def close(self):
+        if self.unsaved > 0:
+            self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class ReplaySession():
+    """
+    Session which serves pages from the fixture corpus without touching the
+    network. aliases is a dictionary {(synthetic_id: recorded_id)}, any url 
+    containing a synthetic id as a path segment is served the recorded page
+    for the recorded id, so extractors can be run over any number of ids
+    """
+
+    def __init__(self, dirname=FIXTURE_DIR, version=FIXTURE_VERSION, aliases=None):
+        self.path = fixture_path(dirname, version)
+        self.index = _read_index(self.path)
+        if len(self.index) == 0:
+            raise FileNotFoundError(f"No fixtures recorded in {self.path}")
+        self.aliases = aliases if aliases is not None else {}
+        self.cache = {}
+
+    def _load(self, filename):
+        if filename not in self.cache:
+            with open(os.path.join(self.path, filename), "rb") as handle:
+                self.cache[filename] = handle.read()
+        return self.cache[filename]
+
+    def _resolve(self, url):
+        if url in self.index or len(self.aliases) == 0:
+            return url
+        segments = url.split("/")
+        return "/".join(self.aliases.get(seg, seg) for seg in segments)
+
+    def get(self, url):
+        recorded = self._resolve(url)
+        if recorded not in self.index:
+            raise KeyError(f"No fixture recorded for {url}")
+        return FixtureResponse(url, self._load(self.index[recorded]["file"]))
+
+    def urls(self, kind=None):
+        """
+        Returns recorded urls, optionally only those of the given url type
+        """
+        return [u for u in self.index if kind is None or self.index[u]["url_type"] == kind]
@@ -1,23 +1,32 @@
 import ast
 import collections
-import csv
 import json
+import os
 
 from datetime import date
 from re import match
 from tqdm import tqdm
 
+from archive import ArchiveSession, HtmlArchive
+from export import CHUNK_SIZE, ChunkedWriter
 from HLTV import HLTV
+from storage import Storage
+from urls import REDIRECT_FILE
 
 MAJOR_EVENT_ID = 4866
 MAJOR_END_DATE = date(2021, 11, 7)
+# Scraped tables upserted into the database after a scrape
+DB_TABLES = ["team.json", "map_player_teams.json", "player.json", "new_players.json", "event.json",
+    "match.json", "map_picks.json", "map.json", "map_player.json", "invalid_maps.json"]
 
 def write_dict(dict_to_write, filename):
     """
     Writes a dictionary to the filename
     """
     with open(filename, 'w', encoding='utf-8') as f:
-        json.dump({str(k): v for k, v in dict_to_write.items()}, f, ensure_ascii=False, indent=4)
+        # Records from records.py are written in their dictionary format
+        json.dump({str(k): v for k, v in dict_to_write.items()}, f, ensure_ascii=False, indent=4,
+            default=lambda record: record.to_dict())
         # json.dump(dict_to_write, f, ensure_ascii=False, indent=4)
 
 def read_json(filename, is_tuple_key=False):
@@ -28,6 +37,38 @@ def read_json(filename, is_tuple_key=False):
         dictdump = json.loads(handle.read())
     return dictdump if not is_tuple_key else {ast.literal_eval(k): v for k, v in dictdump.items()}
 
+def changed_rows(before, after):
+    """
+    Rows of after that aren't in before or differ from it
+    """
+    return {k: v for k, v in after.items() if k not in before or before[k] != v}
+
+def read_scraped(filenames=DB_TABLES):
+    """
+    Returns dictionary {(filename: table)}, empty for files not written yet
+    """
+    return {f: read_json(f, is_tuple_key=f == "map_player.json") if os.path.exists(f) else {}
+        for f in filenames}
+
+def upsert_changed(storage, before, after):
+    """
+    Upserts the rows of the scraped tables that are new or changed between
+    two read_scraped() and deletes the maps found invalid, so the database
+    is written in proportion to what the scrape changed
+    """
+    changed = {f: changed_rows(before[f], after[f]) for f in after}
+    # map_player_teams.json is team.json with the players found on maps added
+    storage.upsert_teams(dict(changed["team.json"], **changed["map_player_teams.json"]))
+    storage.upsert_players(dict(changed["player.json"], **changed["new_players.json"]))
+    # A match is rewritten with its maps, so also when only its map picks changed
+    match_ids = set(changed["match.json"]) | {m for m, match in after["match.json"].items()
+        if any(map_id in changed["map_picks.json"] for map_id in match["map_ids"])}
+    storage.upsert_matches({m: after["match.json"][m] for m in match_ids}, after["map_picks.json"])
+    storage.upsert_events(changed["event.json"])
+    storage.upsert_maps(changed["map.json"])
+    storage.upsert_map_players(changed["map_player.json"])
+    storage.delete_maps(changed["invalid_maps.json"])
+
 def get_major_teams(hltv):
     """
     Queries HLTV for teams that played in final 16 of the 2021 PGL major
@@ -48,11 +89,15 @@ def get_major_players(hltv, team_dict):
         players.update(player_dict)
     return players
 
-def get_map_ids(hltv, team_dict, latest_date=None, min_players=5):
+def get_map_ids(hltv, team_dict, latest_date=None, min_players=5, index=None):
     """
     Gets all map ids between teams in team_dict where the players in the 
     map were exactly the players specified in team_dict. Ignores maps
     after latest_date if not None
+    Params:
+        index:  roster_index.RosterIndex of maps already scraped. Teams it
+                covers up to latest_date are looked up locally instead of
+                requesting their lineup listing, other teams are requested
     Returns:
         dictionary {map_id: [team1_id, team2_id]}
     """
@@ -61,7 +106,8 @@ def get_map_ids(hltv, team_dict, latest_date=None, min_players=5):
     confirmed_map_ids = {}  # IDs which have appeared for both teams
 
     for team in tqdm(team_dict, unit="teams"):
-        ids = hltv.get_map_ids(
+        source = index if index is not None and index.covers(team, latest_date) else hltv
+        ids = source.get_map_ids(
             team_dict[team]["players"], 
             team, 
             team_ids,
@@ -107,56 +153,50 @@ def remove_invalid_maps(map_ids, match_dict, event_dict):
 
     return match_dict, event_dict
 
-def map_player_dict_to_csv(map_player_dict, player_dict):
+def map_player_dict_to_csv(map_player_dict, player_dict, filename="map_player.csv", chunk_size=CHUNK_SIZE):
+    """
+    Writes map_player_dict with player names, building each chunk a column
+    at a time. The extension of filename picks the format, see export.py
+    """
     keylist = list(map_player_dict.keys())
-    with open('map_player.csv', 'w', newline='') as csvfile:
-        fieldnames = ['map_id', 'player_id', 'player_name']
-        fieldnames.extend(list(map_player_dict[keylist[0]].keys()))
-
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for (map_id, player_id) in keylist:
-            player_name = player_dict[player_id]["name"]
-            dict_to_write = {
-                "map_id": map_id,
-                "player_id": player_id,
-                "player_name": player_name
+    stat_names = list(map_player_dict[keylist[0]].keys())
+    fieldnames = ["map_id", "player_id", "player_name"] + stat_names
+    player_names = {player_id: player_dict[player_id]["name"] for player_id in {k[1] for k in keylist}}
+
+    with ChunkedWriter(filename, fieldnames, lineterminator="\r\n") as writer:
+        for start in range(0, len(keylist), chunk_size):
+            keys = keylist[start:start + chunk_size]
+            values = [map_player_dict[k] for k in keys]
+            columns = {
+                "map_id": [k[0] for k in keys],
+                "player_id": [k[1] for k in keys],
+                "player_name": [player_names[k[1]] for k in keys]
             }
-            dict_to_write.update(map_player_dict[(map_id, player_id)])
-            writer.writerow(dict_to_write)
+            columns.update({stat: [v[stat] for v in values] for stat in stat_names})
+            writer.write_columns(columns)
 
 def main():
-    hltv = HLTV("hltv.org")
-
-    team_dict = read_json("team.json")
-    player_dict = read_json("player.json")
-    event_dict = read_json("event.json")
-    match_dict = read_json("match.json")
-    # map_dict = read_json("map.json")
-    map_player_dict = read_json("map_player.json", is_tuple_key=True)
-    map_pick_dict = read_json("./other_jsons/map_picks.json")
-    # map_ids = read_json("map_ids.json")
-
-    # team_dict = get_major_teams(hltv)
-    # player_dict = get_major_players(hltv, team_dict)
-    # map_ids = get_map_ids(hltv, team_dict, latest_date=MAJOR_END_DATE, min_players=4)
-    # match_dict, map_pick_dict, events_dict = hltv.get_match_ids(map_dict, team_dict)
-    map_info_dict, invalid_map_ids = hltv.get_map_info(team_dict, match_dict, map_pick_dict)
-    # print(f"{len(invalid_map_ids)} invalid maps found")
-    # match_dict, event_dict = remove_invalid_maps(invalid_map_ids, match_dict, event_dict)
-    # map_player_dict, player_dict, team_dict = hltv.get_map_player_info(map_dict, player_dict, team_dict)
-
-    # write_dict(team_dict, "teams_new.json")
-    # write_dict(player_dict, "players_new.json")
-    # write_dict(map_ids, "map_ids.json")
-    # write_dict(match_dict, "matches.json")
-    # write_dict(map_pick_dict, "map_picks.json")
-    # write_dict(event_dict, "events.json")
-    write_dict(map_info_dict, "map.json")
-    # write_dict(map_player_dict, "map_player.json")
+    # The scrape stages and their inputs and outputs are declared in
+    # stages.py, which imports this module
+    from stages import Pipeline, scrape_stages
+
+    # Every page is archived so the tables can be reparsed offline
+    hltv = HLTV("hltv.org", session=ArchiveSession(HtmlArchive()), records=True,
+        redirect_file=REDIRECT_FILE)
+    before = read_scraped()
+    results = Pipeline(scrape_stages(hltv, latest_date=MAJOR_END_DATE, min_players=4)).run()
+    for name, result in results.items():
+        print(f"    {name:20} {result}")
+
+    # Only the rows that are new or changed since the last run are written
+    # to the database
+    with Storage() as storage:
+        upsert_changed(storage, before, read_scraped())
 
     # map_player_dict_to_csv(map_player_dict, player_dict)
+
+    hltv.urls.save()
+    hltv.stats.to_json("scrape_stats.json")
   
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,147 @@
+import numpy as np
+
+from main import read_json
+
+class MatchupIndex():
+    """
+    Integer coded team pairs of every map, so the number of maps played
+    between each pair of teams is counted with np.unique / np.bincount over
+    int64 pair keys. Counts are kept sparse as (team1, team2, count) arrays,
+    never as a team x team matrix, so any number of teams is fine
+    """
+
+    def __init__(self, map_dict, match_dict=None):
+        """
+        Params:
+            map_dict:   dictionary. Maps to index
+            match_dict: dictionary. Needed for the LAN filter, maps not in
+                        any match are neither LAN nor online
+        """
+        self.map_ids = np.array(list(map_dict.keys()))
+        maps = list(map_dict.values())
+        team_ids = np.array([m["team1_id"] for m in maps] + [m["team2_id"] for m in maps])
+        self.team_ids, codes = np.unique(team_ids, return_inverse=True)
+        self.team_idx = {t: i for i, t in enumerate(self.team_ids.tolist())}
+        n = len(maps)
+        self.team1 = codes[:n].astype("int64")
+        self.team2 = codes[n:].astype("int64")
+
+        self.map_names, self.map_name_codes = np.unique(
+            np.array([m["map_name"] for m in maps], dtype=str), return_inverse=True)
+        # Zero padded dates compare correctly as strings
+        self.dates = np.array([m["date"] for m in maps], dtype=str)
+
+        # 1 LAN, 0 online, -1 unknown
+        self.lan = np.full(n, -1, dtype="int8")
+        if match_dict is not None:
+            map_idx = {m: i for i, m in enumerate(map_dict)}
+            for match in match_dict.values():
+                for map in match["map_ids"]:
+                    if map in map_idx:
+                        self.lan[map_idx[map]] = 1 if match["LAN"] else 0
+
+    def mask(self, map_name=None, start_date=None, end_date=None, lan=None, exclude_maps=None):
+        """
+        Returns a boolean mask of the maps passing every given filter
+        Params:
+            map_name:     string. Only maps of this name
+            start_date:   string. Only maps on or after this date
+            end_date:     string. Only maps before this date
+            lan:          bool. Only LAN (True) or online (False) maps
+            exclude_maps: [string] map ids to leave out
+        """
+        mask = np.ones(len(self.map_ids), dtype=bool)
+        if map_name is not None:
+            code = np.searchsorted(self.map_names, map_name)
+            if code >= len(self.map_names) or self.map_names[code] != map_name:
+                return np.zeros_like(mask)
+            mask &= self.map_name_codes == code
+        if start_date is not None:
+            mask &= self.dates >= start_date
+        if end_date is not None:
+            mask &= self.dates < end_date
+        if lan is not None:
+            mask &= self.lan == (1 if lan else 0)
+        if exclude_maps is not None:
+            # Compared as objects, a fixed width string array would cut longer ids short
+            mask &= ~np.isin(self.map_ids.astype(object), list(exclude_maps))
+        return mask
+
+    def _pair_keys(self, mask, ordered):
+        t1, t2 = self.team1[mask], self.team2[mask]
+        if not ordered:
+            t1, t2 = np.minimum(t1, t2), np.maximum(t1, t2)
+        return t1 * len(self.team_ids) + t2
+
+    def counts(self, ordered=False, **filters):
+        """
+        Sparse counts of maps between each pair of teams
+        Params:
+            ordered:  if True (a, b) and (b, a) are counted separately by
+                      which team was team1 of the map
+            filters:  as in mask
+        Returns:
+            (team1 codes, team2 codes, counts) int64 arrays, codes index
+            self.team_ids
+        """
+        keys, counts = np.unique(self._pair_keys(self.mask(**filters), ordered), return_counts=True)
+        n = len(self.team_ids)
+        return keys // n, keys % n, counts.astype("int64")
+
+    def pair_counts(self, pairs, ordered=True, **filters):
+        """
+        Returns an int64 array of the number of maps between each
+        (team1_id, team2_id) in pairs
+        """
+        keys, counts = np.unique(self._pair_keys(self.mask(**filters), ordered), return_counts=True)
+        c1 = np.array([self.team_idx.get(t1, -1) for t1, _ in pairs], dtype="int64")
+        c2 = np.array([self.team_idx.get(t2, -1) for _, t2 in pairs], dtype="int64")
+        if not ordered:
+            c1, c2 = np.minimum(c1, c2), np.maximum(c1, c2)
+        if len(keys) == 0:
+            return np.zeros(len(pairs), dtype="int64")
+        query = c1 * len(self.team_ids) + c2
+        idx = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        found = (c1 >= 0) & (c2 >= 0) & (keys[idx] == query)
+        return np.where(found, counts[idx], 0).astype("int64")
+
+    def team_counts(self, **filters):
+        """
+        Returns an int64 array of the number of maps played by each team
+        """
+        mask = self.mask(**filters)
+        return np.bincount(np.concatenate([self.team1[mask], self.team2[mask]]),
+            minlength=len(self.team_ids)).astype("int64")
+
+    def top(self, n=20, ordered=False, **filters):
+        """
+        Returns the n most played pairs as [(team1_id, team2_id, count)]
+        """
+        t1, t2, counts = self.counts(ordered, **filters)
+        n = min(n, len(counts))
+        # Partition before sorting so only the top n are sorted
+        top = np.argpartition(-counts, n - 1)[:n] if 0 < n < len(counts) else np.arange(n)
+        top = top[np.lexsort((t2[top], t1[top], -counts[top]))]
+        return [(str(self.team_ids[t1[i]]), str(self.team_ids[t2[i]]), int(counts[i])) for i in top]
+
+def print_matchups(matchups, team_dict):
+    """
+    Prints [(team1_id, team2_id, count)] one matchup per line
+    """
+    for t1, t2, freq in matchups:
+        name1 = team_dict[t1]["name"] if t1 in team_dict else t1
+        name2 = team_dict[t2]["name"] if t2 in team_dict else t2
+        print(f"{name1[:5]:5} vs {name2[:5]:5}: {freq}")
+
+def main():
+    team_dict = read_json("team.json")
+    match_dict = read_json("match.json")
+    map_dict = read_json("map.json")
+    index = MatchupIndex(map_dict, match_dict)
+    print("All maps:")
+    print_matchups(index.top(10), team_dict)
+    print("LAN maps:")
+    print_matchups(index.top(10, lan=True), team_dict)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import numpy as np
+
+from economy import round_table, run_length_before
+from main import read_json
+
+# Per team columns of momentum_features, prefixed t1_ and t2_
+TEAM_FEATURES = ["win_streak", "won_prev", "won_pistol", "score", "half_score"]
+
+def _shift(values, starts, fill=np.nan):
+    """
+    Each row's previous value within its group, fill on the first row
+    """
+    idx = np.arange(len(values))
+    shifted = np.empty(len(values), dtype=np.result_type(values, type(fill)))
+    shifted[1:] = values[:-1]
+    shifted[idx == starts] = fill
+    return shifted
+
+def momentum_features(map_dict, map_ids=None, rounds=None):
+    """
+    Streak and momentum state of both teams before every round, from the
+    sequence of round winners and win types
+    Params:
+        rounds: frame from economy.round_table, built from map_dict if None
+    Returns:
+        DataFrame with the columns of round_table and rounds_since_pistol,
+        prev_round_type ("" on a map's first round) and, for each of t1 and
+        t2, {t}_win_streak (rounds won in a row, across halves),
+        {t}_won_prev (NaN on the first round), {t}_won_pistol (NaN on and
+        before this half's pistol, and in overtime), {t}_score and
+        {t}_half_score (rounds won in the map and in this half)
+    """
+    df = round_table(map_dict, map_ids) if rounds is None else rounds.copy()
+    round_numbers = df["round"].to_numpy()
+    idx = np.arange(len(df))
+    map_starts = idx - round_numbers
+    half_starts = idx - df["round_in_half"].to_numpy()
+    t1_won = df["t1_won"].to_numpy(dtype=bool)
+
+    # Rounds since the start of the half, carried through overtime
+    since = np.where(round_numbers < 15, round_numbers, round_numbers - 15)
+    df["rounds_since_pistol"] = since
+    df["prev_round_type"] = _shift(df["round_type"].to_numpy(dtype=object), map_starts, "")
+
+    in_regulation = round_numbers < 30
+    pistol_idx = idx - since
+    for t, won in [("t1", t1_won), ("t2", ~t1_won)]:
+        df[f"{t}_win_streak"] = run_length_before(won, map_starts)
+        df[f"{t}_won_prev"] = _shift(won.astype("float64"), map_starts)
+        df[f"{t}_won_pistol"] = np.where(in_regulation & (since > 0), won[pistol_idx], np.nan)
+
+        # Wins before each round, from a cumulative sum
+        wins = np.zeros(len(df) + 1, dtype="int64")
+        np.cumsum(won, out=wins[1:])
+        df[f"{t}_score"] = wins[idx] - wins[map_starts]
+        df[f"{t}_half_score"] = wins[idx] - wins[half_starts]
+    return df
+
+def main():
+    map_dict = read_json("map.json")
+    features = momentum_features(map_dict)
+    features.to_csv("momentum.csv", index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+from main import read_json
+
+STATS = ["kills", "headshots", "assists", "flash_assists", "deaths", "kast",
+    "adr", "first_kills", "first_deaths", "rating"]
+
+def map_player_frame(map_player_dict, map_dict):
+    """
+    Converts map_player_dict into a DataFrame of numeric stats joined with
+    the date, map name and team of each map, sorted by (player_id, date)
+    """
+    keys = list(map_player_dict.keys())
+    df = pd.DataFrame({
+        "map_id":    np.array([k[0] for k in keys]),
+        "player_id": np.array([k[1] for k in keys]),
+    })
+    values = [map_player_dict[k] for k in keys]
+    for stat in STATS:
+        df[stat] = pd.to_numeric(np.array([v[stat] for v in values]))
+
+    maps = pd.DataFrame({
+        "map_id":   list(map_dict.keys()),
+        "date":     [map_dict[m]["date"] for m in map_dict],
+        "map_name": [map_dict[m]["map_name"] for m in map_dict],
+    })
+    maps["date"] = pd.to_datetime(maps["date"], format="%Y-%m-%d %H:%M")
+    df = df.merge(maps, on="map_id", how="inner")
+
+    return df.sort_values(["player_id", "date", "map_id"], kind="stable").reset_index(drop=True)
+
+def _group_starts(*keys):
+    """
+    Returns, for each row of key arrays sorted by group, the index of the
+    first row of its group
+    """
+    n = len(keys[0])
+    new_group = np.zeros(n, dtype=bool)
+    if n > 0:
+        new_group[0] = True
+    for key in keys:
+        key = np.asarray(key)
+        new_group[1:] |= key[1:] != key[:-1]
+    starts = np.where(new_group, np.arange(n), 0)
+    return np.maximum.accumulate(starts)
+
+def prior_rolling_mean(values, starts, window=None):
+    """
+    Mean of the previous window values in the same group (all previous
+    values if window is None), excluding the current row so features never
+    see the map they describe. NaN where there are no previous values
+    Returns:
+        (means, counts)
+    """
+    values = np.asarray(values, dtype="float64")
+    idx = np.arange(len(values))
+    cumsum = np.zeros(len(values) + 1)
+    np.cumsum(values, out=cumsum[1:])
+    lo = starts if window is None else np.maximum(starts, idx - window)
+    counts = idx - lo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = (cumsum[idx] - cumsum[lo]) / counts
+    return means, counts
+
+def _sort_by(df, keys):
+    """
+    Stable sort of df by keys, using integer codes for the string keys
+    """
+    codes = [df[k].to_numpy() if k == "date" else pd.factorize(df[k])[0] for k in keys]
+    order = np.lexsort(codes[::-1])
+    return order, df.iloc[order]
+
+def player_form_features(map_player_dict, map_dict, stats=STATS, windows=(5, 20),
+    halflife=10, df=None):
+    """
+    Computes prior form features for every (map, player) row at once
+    Params:
+        stats:     stats to compute features for
+        windows:   rolling window sizes, in maps
+        halflife:  halflife, in maps, of the exponentially weighted means
+        df:        frame from map_player_frame, built if None
+    Returns:
+        DataFrame indexed by (map_id, player_id) with, for each stat,
+        {stat}_mean_{window}, {stat}_career, {stat}_ewm, and the same over
+        maps of the same map name as {stat}_map_mean_{window} and
+        {stat}_map_career, plus maps_played and map_maps_played
+    """
+    if df is None:
+        df = map_player_frame(map_player_dict, map_dict)
+    out = pd.DataFrame(index=pd.MultiIndex.from_arrays(
+        [df["map_id"], df["player_id"]], names=["map_id", "player_id"]))
+
+    # Per player, df is already sorted by (player_id, date)
+    player_codes = pd.factorize(df["player_id"])[0]
+    starts = _group_starts(player_codes)
+    for stat in stats:
+        values = df[stat].to_numpy(dtype="float64")
+        for w in windows:
+            out[f"{stat}_mean_{w}"], _ = prior_rolling_mean(values, starts, w)
+        out[f"{stat}_career"], counts = prior_rolling_mean(values, starts)
+    out["maps_played"] = counts if len(stats) > 0 else np.arange(len(df)) - starts
+
+    shifted = df[stats].groupby(player_codes, sort=False).shift(1)
+    ewm = shifted.groupby(player_codes, sort=False).ewm(halflife=halflife).mean()
+    ewm = ewm.reset_index(level=0, drop=True).sort_index()
+    for stat in stats:
+        out[f"{stat}_ewm"] = ewm[stat].to_numpy()
+
+    # Per player per map name
+    order, map_df = _sort_by(df, ["player_id", "map_name", "date"])
+    starts = _group_starts(player_codes[order], pd.factorize(map_df["map_name"])[0])
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    counts = np.arange(len(map_df)) - starts
+    for stat in stats:
+        values = map_df[stat].to_numpy(dtype="float64")
+        for w in windows:
+            means, _ = prior_rolling_mean(values, starts, w)
+            out[f"{stat}_map_mean_{w}"] = means[inverse]
+        means, counts = prior_rolling_mean(values, starts)
+        out[f"{stat}_map_career"] = means[inverse]
+    out["map_maps_played"] = counts[inverse]
+
+    return out
+
+def main():
+    map_dict = read_json("map.json")
+    map_player_dict = read_json("map_player.json", is_tuple_key=True)
+    features = player_form_features(map_player_dict, map_dict)
+    features.reset_index().to_csv("player_form.csv", index=False)
+
+if __name__ == "__main__":
+    main()
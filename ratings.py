@@ -0,0 +1,258 @@
+import bisect
+import math
+
+import numpy as np
+
+from datetime import datetime
+
+from main import read_json
+
+MAP_NAMES = ["Inferno", "Overpass", "Vertigo", "Dust2", "Mirage", "Nuke", "Train", "Ancient"]
+
+GLICKO_Q = math.log(10) / 400
+
+def chrono_map_ids(map_dict, map_ids=None):
+    """
+    Returns map_ids (all maps if None) in date order. Dates are zero padded
+    "%Y-%m-%d %H:%M" strings so they sort correctly without parsing
+    """
+    map_ids = list(map_dict.keys()) if map_ids is None else map_ids
+    return sorted(map_ids, key=lambda m: map_dict[m]["date"])
+
+def glicko_g(rd):
+    """
+    Glicko's weight on a rating difference with deviation rd, which also
+    works elementwise on arrays
+    """
+    return 1. / np.sqrt(1. + 3. * GLICKO_Q ** 2 * rd ** 2 / math.pi ** 2)
+
+def _days_between(date1, date2):
+    return (datetime.fromisoformat(date2) - datetime.fromisoformat(date1)).total_seconds() / 86400.
+
+class RatingEngine():
+    """
+    Elo or Glicko ratings for each team, and for each team on each map,
+    updated map by map in date order. Ratings are held in dense arrays
+    indexed by team, and every update is also appended to a per team
+    history so the rating at any past date can be looked up
+    """
+
+    def __init__(self, method="elo", k=32., base=1500., map_names=MAP_NAMES,
+        rd_init=350., rd_min=30., rd_growth=5.):
+        """
+        Params:
+            method:     "elo" or "glicko"
+            k:          Elo K factor
+            base:       initial rating
+            map_names:  map names to keep per map ratings for
+            rd_init:    Glicko initial rating deviation
+            rd_min:     Glicko minimum rating deviation
+            rd_growth:  Glicko rating deviation growth per day of inactivity
+        """
+        if method not in ("elo", "glicko"):
+            raise ValueError(f"Unknown rating method {method}")
+        self.method = method
+        self.k = k
+        self.base = base
+        self.rd_init = rd_init
+        self.rd_min = rd_min
+        self.rd_growth = rd_growth
+        self.map_idx = {m: i for i, m in enumerate(map_names)}
+
+        self.team_idx = {}
+        self.ratings = np.zeros(0)
+        self.rds = np.zeros(0)
+        self.map_ratings = np.zeros((0, len(map_names)))
+        self.map_rds = np.zeros((0, len(map_names)))
+        self.last_played = []
+        # Per team: date each map was last played, for the per map deviations
+        self.map_last_played = []
+        self.last_date = None
+
+        # Per team: dates of updates and the ratings after each of them
+        self.history_dates = []
+        self.history_ratings = []
+        self.history_map_ratings = []
+
+    def _team(self, team_id):
+        """
+        Returns the array index of team_id, growing the arrays if it is new
+        """
+        if team_id not in self.team_idx:
+            idx = len(self.team_idx)
+            self.team_idx[team_id] = idx
+            if idx >= len(self.ratings):
+                size = max(16, 2 * len(self.ratings))
+                self.ratings = np.resize(self.ratings, size)
+                self.rds = np.resize(self.rds, size)
+                self.map_ratings = np.resize(self.map_ratings, (size, len(self.map_idx)))
+                self.map_rds = np.resize(self.map_rds, (size, len(self.map_idx)))
+            self.ratings[idx] = self.base
+            self.rds[idx] = self.rd_init
+            self.map_ratings[idx] = self.base
+            self.map_rds[idx] = self.rd_init
+            self.last_played.append(None)
+            self.map_last_played.append([None] * len(self.map_idx))
+            self.history_dates.append([])
+            self.history_ratings.append([])
+            self.history_map_ratings.append([])
+        return self.team_idx[team_id]
+
+    def _inflate_rd(self, rd, last, date):
+        if last is None or self.method != "glicko":
+            return rd
+        days = max(_days_between(last, date), 0.)
+        return min(math.sqrt(rd * rd + self.rd_growth * self.rd_growth * days), self.rd_init)
+
+    def _update_pair(self, r1, rd1, r2, rd2, s1):
+        """
+        Returns the new ratings and deviations of two teams after team 1
+        scored s1 (1 win, 0 loss) against team 2
+        """
+        if self.method == "elo":
+            e1 = 1. / (1. + 10 ** ((r2 - r1) / 400.))
+            delta = self.k * (s1 - e1)
+            return r1 + delta, rd1, r2 - delta, rd2
+
+        new = []
+        for r, rd, ro, rdo, s in [(r1, rd1, r2, rd2, s1), (r2, rd2, r1, rd1, 1 - s1)]:
+            g = glicko_g(rdo)
+            e = 1. / (1. + 10 ** (-g * (r - ro) / 400.))
+            d2 = 1. / (GLICKO_Q ** 2 * g ** 2 * e * (1. - e))
+            denom = 1. / rd ** 2 + 1. / d2
+            new.append((r + GLICKO_Q / denom * g * (s - e), max(math.sqrt(1. / denom), self.rd_min)))
+        return new[0][0], new[0][1], new[1][0], new[1][1]
+
+    def expected(self, r1, r2, rd1=None, rd2=None):
+        """
+        Probability team with rating r1 beats team with rating r2. With
+        Glicko, both teams' deviations make the prediction less certain,
+        combined as sqrt(rd1 ** 2 + rd2 ** 2)
+        """
+        if self.method == "glicko" and rd1 is not None and rd2 is not None:
+            g = glicko_g(math.sqrt(rd1 * rd1 + rd2 * rd2))
+            return 1. / (1. + 10 ** (-g * (r1 - r2) / 400.))
+        return 1. / (1. + 10 ** ((r2 - r1) / 400.))
+
+    def update(self, date, map_name, team1_id, team2_id, team1_won):
+        """
+        Adds a map. Maps must be added in date order, call recompute to add
+        older maps
+        Returns:
+            [team1 rating, team2 rating, team1 map rating, team2 map rating,
+             team1 win probability] before the map
+        """
+        if self.last_date is not None and date < self.last_date:
+            raise ValueError(f"Map on {date} is before the last map ({self.last_date})")
+        self.last_date = date
+
+        i1 = self._team(team1_id)
+        i2 = self._team(team2_id)
+        m = self.map_idx.get(map_name)
+
+        rd1 = self._inflate_rd(self.rds[i1], self.last_played[i1], date)
+        rd2 = self._inflate_rd(self.rds[i2], self.last_played[i2], date)
+        r1, r2 = float(self.ratings[i1]), float(self.ratings[i2])
+        pre = [r1, r2, self.base, self.base, self.expected(r1, r2, rd1, rd2)]
+
+        s1 = 1. if team1_won else 0.
+        self.ratings[i1], self.rds[i1], self.ratings[i2], self.rds[i2] = \
+            self._update_pair(r1, rd1, r2, rd2, s1)
+
+        if m is not None:
+            mr1, mr2 = float(self.map_ratings[i1, m]), float(self.map_ratings[i2, m])
+            mrd1 = self._inflate_rd(self.map_rds[i1, m], self.map_last_played[i1][m], date)
+            mrd2 = self._inflate_rd(self.map_rds[i2, m], self.map_last_played[i2][m], date)
+            pre[2], pre[3] = mr1, mr2
+            self.map_ratings[i1, m], self.map_rds[i1, m], self.map_ratings[i2, m], self.map_rds[i2, m] = \
+                self._update_pair(mr1, mrd1, mr2, mrd2, s1)
+            self.map_last_played[i1][m] = date
+            self.map_last_played[i2][m] = date
+
+        for i in (i1, i2):
+            self.last_played[i] = date
+            self.history_dates[i].append(date)
+            self.history_ratings[i].append(float(self.ratings[i]))
+            self.history_map_ratings[i].append(self.map_ratings[i].copy())
+
+        return pre
+
+    def update_maps(self, map_dict, map_ids=None):
+        """
+        Adds maps from map_dict, sorting them by date first
+        Returns:
+            dictionary {(map_id: pre map ratings, as returned from update)}
+        """
+        features = {}
+        for map in chrono_map_ids(map_dict, map_ids):
+            m = map_dict[map]
+            team1_won = int(m["score"][0]) > int(m["score"][1])
+            features[map] = self.update(m["date"], m["map_name"], m["team1_id"],
+                m["team2_id"], team1_won)
+        return features
+
+    def recompute(self, map_dict):
+        """
+        Resets every rating and replays all maps in map_dict
+        """
+        self.__init__(self.method, self.k, self.base, list(self.map_idx),
+            self.rd_init, self.rd_min, self.rd_growth)
+        return self.update_maps(map_dict)
+
+    def rating(self, team_id, map_name=None):
+        """
+        Current rating of team_id, overall or on map_name
+        """
+        if team_id not in self.team_idx:
+            return self.base
+        i = self.team_idx[team_id]
+        return self.ratings[i] if map_name is None else self.map_ratings[i, self.map_idx[map_name]]
+
+    def deviation(self, team_id):
+        """
+        Current Glicko rating deviation of team_id, as of its last map
+        """
+        if team_id not in self.team_idx:
+            return self.rd_init
+        return float(self.rds[self.team_idx[team_id]])
+
+    def rating_as_of(self, team_id, date, map_name=None):
+        """
+        Rating of team_id before any maps played at or after date
+        """
+        if team_id not in self.team_idx:
+            return self.base
+        i = self.team_idx[team_id]
+        n = bisect.bisect_left(self.history_dates[i], date)
+        if n == 0:
+            return self.base
+        if map_name is None:
+            return self.history_ratings[i][n - 1]
+        return self.history_map_ratings[i][n - 1][self.map_idx[map_name]]
+
+    def table(self):
+        """
+        Returns [(team_id, rating)] sorted best first
+        """
+        return sorted(((t, float(self.ratings[i])) for t, i in self.team_idx.items()),
+            key=lambda x: x[1], reverse=True)
+
+def rating_features(map_dict, method="elo", **kwargs):
+    """
+    Returns dictionary {(map_id: [t1_rating, t2_rating, t1_map_rating,
+    t2_map_rating, t1_win_prob])} of ratings before each map
+    """
+    return RatingEngine(method, **kwargs).update_maps(map_dict)
+
+def main():
+    team_dict = read_json("team.json")
+    map_dict = read_json("map.json")
+    for method in ["elo", "glicko"]:
+        engine = RatingEngine(method)
+        engine.update_maps(map_dict)
+        print(f"{method}:")
+        for team, rating in engine.table():
+            print(f"    {team_dict[team]['name'][:15]:15} {rating:7.1f}")
+
+if __name__ == "__main__":
+    main()
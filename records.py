@@ -0,0 +1,204 @@
+import sys
+
+# Decimal places HLTV displays for each float stat
+FLOAT_FORMATS = {"kast": "{:.1f}", "adr": "{:.1f}", "rating": "{:.2f}",
+    "team_rating": "{:.2f}"}
+
+def _ints(pair):
+    return tuple(int(x) for x in pair)
+
+def _floats(pair):
+    return tuple(float(x) for x in pair)
+
+def _intern(val):
+    return None if val is None else sys.intern(str(val))
+
+def _str(val, key=None):
+    """
+    Values are strings in the .json tables, as in storage
+    """
+    if val is None:
+        return None
+    if key in FLOAT_FORMATS:
+        return FLOAT_FORMATS[key].format(val)
+    return str(val)
+
+class Record():
+    """
+    Base of the slotted record types. Numbers are converted once from the
+    scraped strings, ids and other repeated strings are interned, and
+    to_dict / from_dict convert to and from the .json table format
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        """
+        Read access as if the record were its dictionary, with typed values
+        """
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        """
+        Write access to a field, as the code written for dictionaries does
+        """
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self else default
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            all(getattr(self, s) == getattr(other, s) for s in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{s}={getattr(self, s)!r}" for s in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __getstate__(self):
+        return tuple(getattr(self, s) for s in self.__slots__)
+
+    def __setstate__(self, state):
+        for s, v in zip(self.__slots__, state):
+            setattr(self, s, v)
+
+class Round(Record):
+    __slots__ = ("round_winner", "round_type", "team1_buy", "team2_buy",
+        "team1_buy_type", "team2_buy_type")
+
+    def __init__(self, round_winner, round_type, team1_buy=None, team2_buy=None,
+        team1_buy_type=None, team2_buy_type=None):
+        self.round_winner = _intern(round_winner)
+        self.round_type = _intern(round_type)
+        self.team1_buy = None if team1_buy is None else int(team1_buy)
+        self.team2_buy = None if team2_buy is None else int(team2_buy)
+        self.team1_buy_type = _intern(team1_buy_type)
+        self.team2_buy_type = _intern(team2_buy_type)
+
+    def __contains__(self, key):
+        # Rounds without econ stats have no buy keys
+        if self.team1_buy is None and key.startswith(("team1_buy", "team2_buy")):
+            return False
+        return key in self.__slots__
+
+    def to_dict(self):
+        d = {"round_winner": self.round_winner, "round_type": self.round_type}
+        if self.team1_buy is not None:
+            d.update({
+                "team1_buy": _str(self.team1_buy),
+                "team2_buy": _str(self.team2_buy),
+                "team1_buy_type": self.team1_buy_type,
+                "team2_buy_type": self.team2_buy_type
+            })
+        return d
+
+class Map(Record):
+    __slots__ = ("date", "map_name", "team1_id", "team2_id", "map_picked_by",
+        "ct_start_team", "score", "first_half_score", "second_half_score",
+        "overtime_score", "team_rating", "first_kills", "clutches", "rounds",
+        "team1_players", "team2_players")
+
+    def __init__(self, date, map_name, team1_id, team2_id, map_picked_by,
+        ct_start_team, score, first_half_score, second_half_score,
+        overtime_score, team_rating, first_kills, clutches, rounds,
+        team1_players, team2_players):
+        self.date = date
+        self.map_name = _intern(map_name)
+        self.team1_id = _intern(team1_id)
+        self.team2_id = _intern(team2_id)
+        self.map_picked_by = _intern(map_picked_by)
+        self.ct_start_team = _intern(ct_start_team)
+        self.score = _ints(score)
+        self.first_half_score = _ints(first_half_score)
+        self.second_half_score = _ints(second_half_score)
+        self.overtime_score = _ints(overtime_score)
+        self.team_rating = _floats(team_rating)
+        self.first_kills = _ints(first_kills)
+        self.clutches = _ints(clutches)
+        self.rounds = [r if isinstance(r, Round) else Round.from_dict(r) for r in rounds]
+        self.team1_players = tuple(_intern(p) for p in team1_players)
+        self.team2_players = tuple(_intern(p) for p in team2_players)
+
+    def to_dict(self):
+        return {
+            "date":              self.date,
+            "map_name":          self.map_name,
+            "team1_id":          self.team1_id,
+            "team2_id":          self.team2_id,
+            "map_picked_by":     self.map_picked_by,
+            "ct_start_team":     self.ct_start_team,
+            "score":             [_str(x) for x in self.score],
+            "first_half_score":  [_str(x) for x in self.first_half_score],
+            "second_half_score": [_str(x) for x in self.second_half_score],
+            "overtime_score":    [_str(x) for x in self.overtime_score],
+            "team_rating":       [_str(x, "team_rating") for x in self.team_rating],
+            "first_kills":       [_str(x) for x in self.first_kills],
+            "clutches":          [_str(x) for x in self.clutches],
+            "rounds":            [r.to_dict() for r in self.rounds],
+            "team1_players":     list(self.team1_players),
+            "team2_players":     list(self.team2_players)
+        }
+
+class Match(Record):
+    __slots__ = ("team1_id", "team2_id", "format", "LAN", "score", "map_ids")
+
+    def __init__(self, team1_id, team2_id, format, LAN, score, map_ids):
+        self.team1_id = _intern(team1_id)
+        self.team2_id = _intern(team2_id)
+        self.format = _intern(format)
+        self.LAN = bool(LAN)
+        self.score = _ints(score)
+        self.map_ids = tuple(map_ids)
+
+    def to_dict(self):
+        return {
+            "team1_id": self.team1_id,
+            "team2_id": self.team2_id,
+            "format":   self.format,
+            "LAN":      self.LAN,
+            "score":    [_str(x) for x in self.score],
+            "map_ids":  list(self.map_ids)
+        }
+
+class MapPlayerStats(Record):
+    __slots__ = ("kills", "headshots", "assists", "flash_assists", "deaths",
+        "kast", "adr", "first_kills", "first_deaths", "rating")
+
+    def __init__(self, kills, headshots, assists, flash_assists, deaths, kast,
+        adr, first_kills, first_deaths, rating):
+        self.kills = int(kills)
+        self.headshots = int(headshots)
+        self.assists = int(assists)
+        self.flash_assists = int(flash_assists)
+        self.deaths = int(deaths)
+        self.kast = float(kast)
+        self.adr = float(adr)
+        self.first_kills = int(first_kills)
+        self.first_deaths = int(first_deaths)
+        self.rating = float(rating)
+
+    def to_dict(self):
+        return {s: _str(getattr(self, s), s) for s in self.__slots__}
+
+def records_from_dict(record_type, table):
+    """
+    Converts a table as read by read_json, {(key: dict)}, to records
+    """
+    return {k: record_type.from_dict(v) for k, v in table.items()}
+
+def records_to_dict(table):
+    """
+    Converts {(key: record)} back to the .json table format
+    """
+    return {k: v.to_dict() for k, v in table.items()}
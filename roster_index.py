@@ -0,0 +1,173 @@
+import bisect
+
+import numpy as np
+
+from datetime import date, datetime
+
+from main import read_json
+
+def date_key(d, end=False):
+    """
+    Converts a date, datetime or "%Y-%m-%d %H:%M" string into the zero
+    padded string map dates are compared as. A date is the start of the
+    day, or its end if end is True
+    """
+    if d is None or isinstance(d, str):
+        return d
+    if isinstance(d, datetime):
+        return d.strftime("%Y-%m-%d %H:%M")
+    if isinstance(d, date):
+        return f"{d.isoformat()} {'23:59' if end else '00:00'}"
+    raise TypeError(f"Can't compare {d!r} with map dates")
+
+class RosterIndex():
+    """
+    Lineup history of every team from the players listed on each map. Each
+    team's maps are held in date order and split into intervals of
+    unchanged lineup, so "which lineup played on this date" is a binary
+    search over interval starts, and "which maps had at least k of these
+    players" checks each interval once rather than each map
+    """
+
+    def __init__(self, map_dict, missing=None):
+        """
+        Params:
+            missing:    dictionary {(map_id: [team1_id, team2_id])} of maps
+                        known to exist that map_dict doesn't have, like the
+                        maps of the last lineup listing still to crawl or
+                        found invalid. Their teams are never covered
+        """
+        self.incomplete = {t for teams in (missing or {}).values() for t in teams}
+        self.teams = {}
+        rows = {}
+        for map_id, m in map_dict.items():
+            for side, other in [("team1", "team2"), ("team2", "team1")]:
+                rows.setdefault(m[f"{side}_id"], []).append(
+                    (m["date"], map_id, m[f"{other}_id"], frozenset(m.get(f"{side}_players", []))))
+
+        for team_id, team_rows in rows.items():
+            team_rows.sort(key=lambda r: (r[0], r[1]))
+            dates = [r[0] for r in team_rows]
+            lineups = [r[3] for r in team_rows]
+            # A new interval starts whenever the lineup differs from the map before
+            new = np.array([i == 0 or lineups[i] != lineups[i - 1] for i in range(len(lineups))], dtype=bool)
+            starts = np.flatnonzero(new)
+            ends = np.append(starts[1:], len(lineups))
+            self.teams[team_id] = {
+                "dates":     dates,
+                "map_ids":   np.array([r[1] for r in team_rows], dtype=object),
+                "opponents": np.array([r[2] for r in team_rows], dtype=object),
+                "interval":  np.cumsum(new) - 1,
+                "lineups":   [lineups[s] for s in starts],
+                "starts":    [dates[i] for i in starts],
+                "ends":      [dates[i - 1] for i in ends],
+            }
+
+    def __contains__(self, team_id):
+        return team_id in self.teams
+
+    def covers(self, team_id, latest_date):
+        """
+        Whether every map of team_id up to latest_date is in the index, that
+        is none of its maps are missing and its last indexed map is on or
+        after latest_date's day. Maps played after the last scrape can't
+        be, so a later or missing latest_date needs the site
+        """
+        if team_id not in self.teams or team_id in self.incomplete or latest_date is None:
+            return False
+        return date_key(latest_date)[:10] <= self.teams[team_id]["dates"][-1][:10]
+
+    def intervals(self, team_id):
+        """
+        Returns [(first map date, last map date, sorted lineup, n maps)] of
+        each interval of team_id in date order
+        """
+        team = self.teams[team_id]
+        counts = np.bincount(team["interval"], minlength=len(team["lineups"]))
+        return [(s, e, sorted(l), int(c)) for s, e, l, c in
+            zip(team["starts"], team["ends"], team["lineups"], counts)]
+
+    def lineup_on(self, team_id, when):
+        """
+        Returns the sorted lineup team_id last played with at or before
+        when, None if it had no maps by then
+        """
+        if team_id not in self.teams:
+            return None
+        team = self.teams[team_id]
+        i = bisect.bisect_right(team["starts"], date_key(when, end=True)) - 1
+        return sorted(team["lineups"][i]) if i >= 0 else None
+
+    def roster_changes(self, team_id):
+        """
+        Returns [(date, players in, players out)] of every lineup change,
+        dated by the first map of the new lineup
+        """
+        team = self.teams[team_id]
+        return [(team["starts"][i], sorted(new - old), sorted(old - new)) for i, (old, new)
+            in enumerate(zip(team["lineups"], team["lineups"][1:]), start=1)]
+
+    def maps_with_players(self, team_id, player_ids, min_players=5, start_date=None,
+        end_date=None, opponent_ids=None):
+        """
+        Maps team_id played with at least min_players of player_ids, as the
+        lineup search on the site does with minLineupMatch
+        Params:
+            start_date, end_date:   inclusive bounds, dates, datetimes or
+                                    map date strings
+            opponent_ids:           only maps against these teams
+        Returns:
+            [map_id] in date order
+        """
+        if team_id not in self.teams:
+            return []
+        return list(self.teams[team_id]["map_ids"][self._mask(team_id, player_ids, min_players,
+            start_date, end_date, opponent_ids)])
+
+    def _mask(self, team_id, player_ids, min_players, start_date=None, end_date=None,
+        opponent_ids=None):
+        team = self.teams[team_id]
+        players = set(player_ids)
+        overlap = np.array([len(l & players) for l in team["lineups"]], dtype="int64")
+        ok = (overlap >= min_players)[team["interval"]]
+
+        lo = 0 if start_date is None else bisect.bisect_left(team["dates"], date_key(start_date))
+        hi = len(ok) if end_date is None else bisect.bisect_right(team["dates"], date_key(end_date, end=True))
+        ok[:lo] = False
+        ok[hi:] = False
+        if opponent_ids is not None:
+            ok &= np.isin(team["opponents"], list(opponent_ids))
+        return ok
+
+    def get_map_ids(self, player_ids, team_id, opponent_ids, latest_date=None, min_players=5):
+        """
+        Local equivalent of HLTV.get_map_ids, so main.get_map_ids can use
+        either
+        Returns:
+            dictionary {(map_id: [team_id, opponent_id])}
+        """
+        if team_id not in self.teams:
+            return {}
+        team = self.teams[team_id]
+        mask = self._mask(team_id, player_ids, min_players, end_date=latest_date,
+            opponent_ids=opponent_ids)
+        return {m: [team_id, o] for m, o in zip(team["map_ids"][mask], team["opponents"][mask])}
+
+def main():
+    team_dict = read_json("team.json")
+    player_dict = read_json("player.json")
+    map_dict = read_json("map.json")
+    index = RosterIndex(map_dict)
+
+    def names(players):
+        return ", ".join(player_dict.get(p, {"name": p})["name"] for p in players)
+
+    for team_id, team in team_dict.items():
+        if team_id not in index:
+            continue
+        print(team["name"])
+        for start, end, lineup, n in index.intervals(team_id):
+            print(f"    {start[:10]} - {end[:10]} {n:4} maps  {names(lineup)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 import tensorflow as tf
 
 from pandas.api.types import CategoricalDtype
 
+from artifact_cache import ArtifactCache
+
 from tensorflow.keras.layers import BatchNormalization, Dense, Dropout, Input
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.regularizers import l1, l1_l2, l2
 
+TRAIN_FILE = "round_prediction_no_round_type_train.csv"
+TEST_FILE = "round_prediction_no_round_type_test.csv"
+
 def get_model(dropout=0):
     """
     Returns model to train
@@ -56,15 +62,43 @@ def one_hot_encode_data(data):
         data = data.join(one_hot)
     return data
 
-def main():
-    train = pd.read_csv("round_prediction_no_round_type_train.csv")
-    test = pd.read_csv("round_prediction_no_round_type_test.csv")
-
-    train_data, train_targets = split_targets(train)
-    test_data, test_targets = split_targets(test)
-
+def encode_splits(train_file=TRAIN_FILE, test_file=TEST_FILE):
+    """
+    Reads and one hot encodes the train and test sets
+    Returns:
+        dictionary of float32 arrays train_data, train_targets, test_data,
+        test_targets and the encoded column names
+    """
+    train_data, train_targets = split_targets(pd.read_csv(train_file))
+    test_data, test_targets = split_targets(pd.read_csv(test_file))
     train_data = one_hot_encode_data(train_data)
     test_data = one_hot_encode_data(test_data)
+    return {
+        "train_data": train_data.to_numpy(dtype="float32"),
+        "train_targets": train_targets.to_numpy(dtype="float32"),
+        "test_data": test_data.to_numpy(dtype="float32"),
+        "test_targets": test_targets.to_numpy(dtype="float32"),
+        "columns": np.array(train_data.columns, dtype=str),
+    }
+
+def load_encoded(cache=None, train_file=TRAIN_FILE, test_file=TEST_FILE):
+    """
+    encode_splits, loaded from cache while the csv files and the code are
+    unchanged
+    """
+    if cache is None:
+        return encode_splits(train_file, test_file)
+    key = cache.key("round_prediction_encoded", [train_file, test_file])
+    arrays = cache.load_arrays(key)
+    if arrays is None:
+        arrays = encode_splits(train_file, test_file)
+        cache.save_arrays(key, **arrays)
+    return arrays
+
+def main():
+    arrays = load_encoded(ArtifactCache())
+    train_data, train_targets = arrays["train_data"], arrays["train_targets"]
+    test_data, test_targets = arrays["test_data"], arrays["test_targets"]
 
     model = get_model()
     print(model.summary())
@@ -0,0 +1,194 @@
+import argparse
+import os
+
+import numpy as np
+
+from archive import ArchiveSession, HtmlArchive
+from HLTV import HLTV
+from main import MAJOR_EVENT_ID, read_json, write_dict
+from urls import REDIRECT_FILE
+
+REMAINING_FILE = "crawl_remaining.json"
+
+# Pages fetched per map by get_map_info, the overview and the economy page.
+# Invalid maps only cost the overview, so this is an upper bound
+MAP_INFO_REQUESTS = 2
+
+# A map's priority is the weighted sum of its components, each in [0, 1]
+WEIGHTS = {"recency": 1., "event": 2., "econ": 1., "fill_in": .5}
+# Importance of the maps of each event, others are 0
+EVENT_WEIGHTS = {str(MAJOR_EVENT_ID): 1.}
+# Scraped maps either side of a map id its econ likelihood is estimated from
+ECON_WINDOW = 50
+
+def has_econ(map_info):
+    """
+    Whether every round of a scraped map has econ stats
+    """
+    return len(map_info["rounds"]) > 0 and all("team1_buy" in r for r in map_info["rounds"])
+
+def econ_likelihood(map_ids, map_dict, window=ECON_WINDOW):
+    """
+    Estimated chance each map has econ stats, the fraction of the scraped
+    maps nearest in id that did. Ids grow with time and econ stats are only
+    kept for later maps, so nearby ids are a good guide. 1 with nothing
+    scraped
+    """
+    if len(map_dict) == 0:
+        return np.ones(len(map_ids))
+    known = np.array([int(m) for m in map_dict], dtype="int64")
+    order = np.argsort(known)
+    known = known[order]
+    econ = np.array([has_econ(m) for m in map_dict.values()], dtype="float64")[order]
+    counts = np.zeros(len(econ) + 1)
+    np.cumsum(econ, out=counts[1:])
+
+    pos = np.searchsorted(known, np.array([int(m) for m in map_ids], dtype="int64"))
+    lo = np.maximum(pos - window, 0)
+    hi = np.minimum(pos + window, len(known))
+    return (counts[hi] - counts[lo]) / (hi - lo)
+
+def pending_map_ids(matches_dict, map_dict, invalid_map_ids=()):
+    """
+    Maps of matches_dict that are neither scraped nor known to be invalid
+    """
+    done = set(map_dict) | set(invalid_map_ids)
+    return [m for match in matches_dict.values() for m in match["map_ids"] if m not in done]
+
+class CrawlScheduler():
+    """
+    Orders the maps left to fetch by priority, so a crawl with a bounded
+    number of requests gets the most useful maps first: recent maps, maps
+    of important events, maps likely to have econ stats and the missing
+    maps of partly scraped matches
+    """
+
+    def __init__(self, weights=None, event_weights=None, econ_window=ECON_WINDOW):
+        """
+        Params:
+            weights:        dictionary {(component: weight)}, missing
+                            components keep their weight in WEIGHTS
+            event_weights:  dictionary {(event_id: importance in [0, 1])}
+        """
+        self.weights = dict(WEIGHTS, **(weights or {}))
+        self.event_weights = event_weights if event_weights is not None else EVENT_WEIGHTS
+        self.econ_window = econ_window
+
+    def components(self, map_ids, matches_dict, events_dict, map_dict):
+        """
+        Returns:
+            dictionary {(component: array)} over map_ids
+        """
+        n = len(map_ids)
+        ids = np.array([int(m) for m in map_ids], dtype="int64")
+        # Ids are assigned in date order, so the rank of the id is its recency
+        ranks = np.empty(n)
+        ranks[np.argsort(ids, kind="stable")] = np.arange(n)
+
+        map_matches = {m: match_id for match_id, match in matches_dict.items() for m in match["map_ids"]}
+        match_events = {match_id: event_id for event_id, event in events_dict.items()
+            for match_id in event["match_ids"]}
+        scraped = {match_id: sum(m in map_dict for m in match["map_ids"])
+            for match_id, match in matches_dict.items()}
+
+        return {
+            "recency": ranks / max(n - 1, 1),
+            "event": np.array([self.event_weights.get(match_events.get(map_matches[m]), 0.)
+                for m in map_ids]),
+            "econ": econ_likelihood(map_ids, map_dict, self.econ_window),
+            "fill_in": np.array([scraped[map_matches[m]] > 0 for m in map_ids], dtype="float64"),
+        }
+
+    def priorities(self, map_ids, matches_dict, events_dict, map_dict):
+        components = self.components(map_ids, matches_dict, events_dict, map_dict)
+        return sum(self.weights[c] * v for c, v in components.items())
+
+    def plan(self, map_ids, matches_dict, events_dict, map_dict, budget=None,
+        requests_per_map=MAP_INFO_REQUESTS):
+        """
+        Params:
+            budget: number of requests the crawl may send, None for no limit
+        Returns:
+            [map_id] to fetch in priority order within budget, [map_id] left
+            for later in priority order
+        """
+        priority = self.priorities(map_ids, matches_dict, events_dict, map_dict)
+        order = [map_ids[i] for i in np.argsort(-priority, kind="stable")]
+        n = len(order) if budget is None else min(budget // requests_per_map, len(order))
+        return order[:n], order[n:]
+
+def crawl_maps(hltv, scheduler, team_dict, matches_dict, map_picks_dict, events_dict, map_dict,
+    invalid_map_ids, budget=None, workers=0):
+    """
+    Fetches the highest priority maps of matches_dict that aren't in
+    map_dict or invalid_map_ids within budget requests
+    Returns:
+        map_dict and invalid_map_ids with the fetched maps added,
+        dictionary {(map_id: {(component: value)})} of the maps left in
+        priority order
+    """
+    pending = pending_map_ids(matches_dict, map_dict, invalid_map_ids)
+    scheduled, remaining = scheduler.plan(pending, matches_dict, events_dict, map_dict, budget)
+    new_maps, new_invalid = hltv.get_map_info(team_dict, matches_dict, map_picks_dict,
+        workers=workers, map_ids=scheduled)
+
+    map_dict = dict(map_dict)
+    map_dict.update(new_maps)
+    invalid_map_ids = dict(invalid_map_ids)
+    invalid_map_ids.update({m: None for m in new_invalid})
+
+    components = scheduler.components(remaining, matches_dict, events_dict, map_dict)
+    return map_dict, invalid_map_ids, {m: {c: float(v[i]) for c, v in components.items()}
+        for i, m in enumerate(remaining)}
+
+def crawl(hltv, scheduler, budget, remaining_file=REMAINING_FILE, workers=0):
+    """
+    Fetches the highest priority maps of matches.json that aren't in
+    map.json or invalid_maps.json within budget requests, adds them to
+    those files and writes the maps left, with their priority components,
+    to remaining_file
+    Returns:
+        number of maps fetched, [map_id] left
+    """
+    map_dict = read_json("map.json") if os.path.exists("map.json") else {}
+    invalid = read_json("invalid_maps.json") if os.path.exists("invalid_maps.json") else {}
+    scraped = len(map_dict) + len(invalid)
+
+    map_dict, invalid, remaining = crawl_maps(hltv, scheduler, read_json("team.json"),
+        read_json("matches.json"), read_json("map_picks.json"), read_json("events.json"),
+        map_dict, invalid, budget, workers)
+    write_dict(map_dict, "map.json")
+    write_dict(invalid, "invalid_maps.json")
+    write_dict(remaining, remaining_file)
+    return len(map_dict) + len(invalid) - scraped, list(remaining)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch the most useful missing maps within a request budget")
+    parser.add_argument("--budget", type=int, default=None, help="requests to send, no limit if not given")
+    parser.add_argument("--weight", nargs="*", default=[], metavar="COMPONENT=WEIGHT",
+        help=f"priority weights, default {WEIGHTS}")
+    parser.add_argument("--workers", type=int, default=0, help="processes to parse pages in")
+    args = parser.parse_args()
+
+    weights = {c: float(w) for c, w in (a.split("=") for a in args.weight)}
+    unknown = set(weights) - set(WEIGHTS)
+    if len(unknown) > 0:
+        parser.error(f"Unknown priority components {sorted(unknown)}")
+
+    hltv = HLTV("hltv.org", session=ArchiveSession(HtmlArchive()), records=True,
+        redirect_file=REDIRECT_FILE)
+    fetched, remaining = crawl(hltv, CrawlScheduler(weights), args.budget, workers=args.workers)
+    requests = sum(hltv.stats.requests.values())
+
+    matches_dict = read_json("matches.json")
+    important = {m for event_id, event in read_json("events.json").items() if event_id in EVENT_WEIGHTS
+        for match_id in event["match_ids"] for m in matches_dict[match_id]["map_ids"]}
+    print(f"{fetched} maps fetched with {requests} requests")
+    print(f"{len(remaining)} maps remaining ({len(important.intersection(remaining))} of events "
+        f"{', '.join(EVENT_WEIGHTS)}), needing {MAP_INFO_REQUESTS * len(remaining)} requests. "
+        f"Listed in {REMAINING_FILE}")
+    hltv.urls.save()
+    hltv.stats.to_json("scrape_stats.json")
+
+if __name__ == "__main__":
+    main()
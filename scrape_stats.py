@@ -0,0 +1,236 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf")]
+
+# (path prefix, url type). Checked in order so longer prefixes come first
+URL_TYPES = [
+    ("/stats/matches/economy/", "map_economy"),
+    ("/stats/matches/performance/", "map_performance"),
+    ("/stats/matches/mapstatsid/", "map_overview"),
+    ("/stats/lineup/", "lineup"),
+    ("/stats/teams/", "team_stats"),
+    ("/matches/", "match"),
+    ("/events/archive", "event_archive"),
+    ("/events/", "event"),
+]
+
+def url_type(url):
+    """
+    Returns the type of HLTV page the url points to
+    """
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else "/"
+    for prefix, name in URL_TYPES:
+        if path.startswith(prefix):
+            return name
+    return "other"
+
+class Histogram():
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, val):
+        for i, upper in enumerate(self.buckets):
+            if val <= upper:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += val
+
+    def to_dict(self):
+        return {
+            "buckets": {("+Inf" if b == float("inf") else str(b)): c
+                for b, c in zip(self.buckets, self.counts)},
+            "count": self.count,
+            "sum": self.sum
+        }
+
+class ScrapeStats():
+    """
+    Counters and timings collected by the HLTV client. Times are in seconds
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start_time = time.time()
+        self.latency = {}       # url type -> Histogram of request latency
+        self.requests = {}      # url type -> number of requests sent
+        self.pages = {}         # url type -> number of pages returned
+        self.bytes = {}         # url type -> bytes received
+        self.parse_time = {}    # url type -> time spent in BeautifulSoup
+        self.redirects = {}     # url type -> requests that were redirected
+        # url type -> requests sent straight to where they were redirected before
+        self.redirects_avoided = {}
+        self.retries = 0
+        self.politeness_sleep = 0.
+        self.rate_limit_sleep = 0.
+        self.extractor_time = {}
+        self.extractor_calls = {}
+        self.profiles = {}      # extractor name -> pstats.Stats
+
+    def record_request(self, url, latency, num_bytes):
+        kind = url_type(url)
+        if kind not in self.latency:
+            self.latency[kind] = Histogram()
+        self.latency[kind].observe(latency)
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+        self.bytes[kind] = self.bytes.get(kind, 0) + num_bytes
+
+    def record_page(self, url, parse_time):
+        kind = url_type(url)
+        self.pages[kind] = self.pages.get(kind, 0) + 1
+        self.parse_time[kind] = self.parse_time.get(kind, 0.) + parse_time
+
+    def record_redirect(self, url):
+        kind = url_type(url)
+        self.redirects[kind] = self.redirects.get(kind, 0) + 1
+
+    def record_redirect_avoided(self, url):
+        kind = url_type(url)
+        self.redirects_avoided[kind] = self.redirects_avoided.get(kind, 0) + 1
+
+    def record_retry(self, sleep_time):
+        self.retries += 1
+        self.rate_limit_sleep += sleep_time
+
+    def record_sleep(self, sleep_time):
+        self.politeness_sleep += sleep_time
+
+    def record_extractor(self, name, elapsed, profile=None):
+        self.extractor_time[name] = self.extractor_time.get(name, 0.) + elapsed
+        self.extractor_calls[name] = self.extractor_calls.get(name, 0) + 1
+        if profile is not None:
+            if name not in self.profiles:
+                self.profiles[name] = pstats.Stats(profile)
+            else:
+                self.profiles[name].add(profile)
+
+    def pages_per_minute(self):
+        elapsed = time.time() - self.start_time
+        return 60. * sum(self.pages.values()) / elapsed if elapsed > 0 else 0.
+
+    def to_dict(self):
+        """
+        Returns a JSON serialisable snapshot of the stats
+        """
+        return {
+            "elapsed": time.time() - self.start_time,
+            "pages_per_minute": self.pages_per_minute(),
+            "requests": dict(self.requests),
+            "pages": dict(self.pages),
+            "bytes": dict(self.bytes),
+            "latency": {k: h.to_dict() for k, h in self.latency.items()},
+            "parse_time": dict(self.parse_time),
+            "redirects": dict(self.redirects),
+            "redirects_avoided": dict(self.redirects_avoided),
+            "retries": self.retries,
+            "politeness_sleep": self.politeness_sleep,
+            "rate_limit_sleep": self.rate_limit_sleep,
+            "extractor_time": dict(self.extractor_time),
+            "extractor_calls": dict(self.extractor_calls)
+        }
+
+    def to_json(self, filename=None):
+        """
+        Returns the stats as a JSON string, also writing it to filename if
+        given
+        """
+        string = json.dumps(self.to_dict(), indent=4)
+        if filename is not None:
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(string)
+        return string
+
+    def to_prometheus(self, prefix="hltv"):
+        """
+        Returns the stats in the Prometheus text exposition format
+        """
+        lines = []
+
+        def counter(name, help, values, label="url_type"):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for k, v in values.items():
+                lines.append(f'{prefix}_{name}{{{label}="{k}"}} {v}')
+
+        counter("requests_total", "HTTP requests sent", self.requests)
+        counter("pages_total", "Pages parsed", self.pages)
+        counter("bytes_total", "Bytes received", self.bytes)
+        counter("parse_seconds_total", "Time spent parsing pages", self.parse_time)
+        counter("redirects_total", "Requests that were redirected", self.redirects)
+        counter("redirects_avoided_total", "Requests sent straight to a learned redirect",
+            self.redirects_avoided)
+        counter("extractor_seconds_total", "Time spent in each extractor",
+            self.extractor_time, label="extractor")
+
+        name = f"{prefix}_request_latency_seconds"
+        lines.append(f"# HELP {name} HTTP request latency")
+        lines.append(f"# TYPE {name} histogram")
+        for kind, hist in self.latency.items():
+            cumulative = 0
+            for upper, c in zip(hist.buckets, hist.counts):
+                cumulative += c
+                le = "+Inf" if upper == float("inf") else upper
+                lines.append(f'{name}_bucket{{url_type="{kind}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{url_type="{kind}"}} {hist.sum}')
+            lines.append(f'{name}_count{{url_type="{kind}"}} {hist.count}')
+
+        for name, help, val in [
+            ("retries_total", "Requests retried after being rate limited", self.retries),
+            ("politeness_sleep_seconds_total", "Time slept between requests", self.politeness_sleep),
+            ("rate_limit_sleep_seconds_total", "Time slept after being rate limited", self.rate_limit_sleep),
+        ]:
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.append(f"{prefix}_{name} {val}")
+
+        lines.append(f"# HELP {prefix}_pages_per_minute Pages parsed per minute")
+        lines.append(f"# TYPE {prefix}_pages_per_minute gauge")
+        lines.append(f"{prefix}_pages_per_minute {self.pages_per_minute()}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump_profiles(self, dirname):
+        """
+        Writes the collected cProfile stats of each extractor to dirname
+        """
+        os.makedirs(dirname, exist_ok=True)
+        for name, stats in self.profiles.items():
+            stats.dump_stats(os.path.join(dirname, f"{name}.prof"))
+
+def instrumented(func):
+    """
+    Decorator for HLTV extractors. Records the time spent in the extractor
+    and, if the client was created with profile=True, a cProfile of it
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        # Only one profiler can be active, so nested extractors are timed
+        # but included in the outer extractor's profile
+        profile = None
+        if self.profile and not self._profiling:
+            profile = cProfile.Profile()
+            self._profiling = True
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            self.stats.record_extractor(func.__name__, time.perf_counter() - start, profile)
+    return wrapper
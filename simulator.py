@@ -0,0 +1,349 @@
+import argparse
+import itertools
+import math
+import time
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+from main import read_json
+from ratings import MAP_NAMES, RatingEngine, glicko_g
+
+# Iterations simulated at once, bounding memory at around 100 MB per process
+CHUNK_SIZE = 100_000
+
+def best_of(format):
+    """
+    Number of maps of a match.json format, "Bo1", "Bo3" or "Bo5"
+    """
+    return int(format[2:])
+
+def wilson_interval(successes, n, z=1.96):
+    """
+    Returns the Wilson score interval (low, high) of a binomial proportion,
+    for scalars or arrays
+    """
+    successes = np.asarray(successes, dtype="float64")
+    if n == 0:
+        return np.zeros_like(successes), np.ones_like(successes)
+    p = successes / n
+    denom = 1. + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * np.sqrt(p * (1. - p) / n + z * z / (4 * n * n)) / denom
+    return centre - half, centre + half
+
+class MapProbabilities():
+    """
+    Probability of each team beating each other team on each map, held as
+    a dense array P[map, team1, team2], and the weights each team picks maps
+    with. Any model can be plugged in through from_function
+    """
+
+    def __init__(self, team_ids, probs, map_names=MAP_NAMES, pick_weights=None):
+        """
+        Params:
+            team_ids:       team ids indexing the team axes of probs
+            probs:          array (len(map_names), n teams, n teams)
+            pick_weights:   array (n teams, len(map_names)) of relative
+                            pick frequencies, uniform if None
+        """
+        self.team_ids = list(team_ids)
+        self.team_idx = {t: i for i, t in enumerate(self.team_ids)}
+        self.map_names = list(map_names)
+        self.probs = np.asarray(probs, dtype="float64")
+        if pick_weights is None:
+            pick_weights = np.ones((len(self.team_ids), len(self.map_names)))
+        pick_weights = np.asarray(pick_weights, dtype="float64")
+        self.picks = pick_weights / pick_weights.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def from_function(cls, func, team_ids, map_names=MAP_NAMES, pick_weights=None):
+        """
+        Builds the array from func(team1_id, team2_id, map_name), returning
+        the probability team1 wins, e.g. a trained map prediction model
+        """
+        n = len(team_ids)
+        probs = np.full((len(map_names), n, n), 0.5)
+        for m, map_name in enumerate(map_names):
+            for i, t1 in enumerate(team_ids):
+                for j, t2 in enumerate(team_ids):
+                    if i != j:
+                        probs[m, i, j] = func(t1, t2, map_name)
+        return cls(team_ids, probs, map_names, pick_weights)
+
+    @classmethod
+    def from_ratings(cls, engine, team_ids, map_names=MAP_NAMES, pick_weights=None):
+        """
+        Probabilities from a ratings.RatingEngine, using each team's overall
+        rating adjusted by how it does on the map. With Glicko, differences
+        are weighted by both teams' overall deviations as in
+        RatingEngine.expected
+        """
+        overall = np.array([engine.rating(t) for t in team_ids], dtype="float64")
+        strength = np.array([[overall[i] + engine.rating(t, m) - engine.base for m in map_names]
+            for i, t in enumerate(team_ids)]).T
+        diff = strength[:, None, :] - strength[:, :, None]
+        if engine.method == "glicko":
+            rds = np.array([engine.deviation(t) for t in team_ids], dtype="float64")
+            diff = diff * glicko_g(np.sqrt(rds[:, None] ** 2 + rds[None, :] ** 2))
+        return cls(team_ids, 1. / (1. + 10 ** (diff / 400.)), map_names, pick_weights)
+
+    def subset(self, team_ids):
+        """
+        Returns the probabilities between team_ids only
+        """
+        idx = np.array([self.team_idx[t] for t in team_ids], dtype="int64")
+        return MapProbabilities(team_ids, self.probs[:, idx[:, None], idx[None, :]],
+            self.map_names, self.picks[idx])
+
+def pick_weights(map_dict, team_ids, map_names=MAP_NAMES, smoothing=1.):
+    """
+    Counts how often each team picked each map from map_picked_by, plus
+    smoothing so every map can still be picked
+    Returns:
+        array (len(team_ids), len(map_names))
+    """
+    team_idx = {t: i for i, t in enumerate(team_ids)}
+    map_idx = {m: i for i, m in enumerate(map_names)}
+    counts = np.full((len(team_ids), len(map_names)), float(smoothing))
+    for m in map_dict.values():
+        if m["map_picked_by"] in team_idx and m["map_name"] in map_idx:
+            counts[team_idx[m["map_picked_by"]], map_idx[m["map_name"]]] += 1
+    return counts
+
+def _veto(probs, team1, team2, n_maps, rng):
+    """
+    Chooses the maps of n series at once. Teams alternate picks, team1
+    first, and the decider is drawn uniformly from the maps left
+    Returns:
+        int array (n, n_maps) of map indices
+    """
+    n = len(team1)
+    available = np.ones((n, len(probs.map_names)), dtype="float64")
+    maps = np.empty((n, n_maps), dtype="int64")
+    rows = np.arange(n)
+    for k in range(n_maps):
+        if k == n_maps - 1:
+            weights = available
+        else:
+            weights = probs.picks[team1 if k % 2 == 0 else team2] * available
+        # Inverse CDF sampling over the maps still available
+        cdf = np.cumsum(weights, axis=1)
+        u = rng.random(n) * cdf[:, -1]
+        maps[:, k] = np.count_nonzero(cdf <= u[:, None], axis=1)
+        available[rows, maps[:, k]] = 0.
+    return maps
+
+def simulate_series(probs, team1, team2, n_maps, rng):
+    """
+    Simulates one series for each pair (team1[i], team2[i]) of team indices
+    Params:
+        n_maps: best of, 1, 3 or 5
+    Returns:
+        team1_won (bool array), maps_played (int array)
+    """
+    maps = _veto(probs, team1, team2, n_maps, rng)
+    p = probs.probs[maps, team1[:, None], team2[:, None]]
+    wins = rng.random(p.shape) < p
+    # Playing every map gives the same winner as stopping at the majority
+    need = n_maps // 2 + 1
+    team1_maps = np.cumsum(wins, axis=1)
+    team2_maps = np.arange(1, n_maps + 1) - team1_maps
+    decided = (team1_maps >= need) | (team2_maps >= need)
+    return team1_maps[:, -1] >= need, np.argmax(decided, axis=1) + 1
+
+def _series_chunk(args):
+    probs, team1, team2, n_maps, n, seed = args
+    rng = np.random.default_rng(seed)
+    i = np.full(n, probs.team_idx[team1])
+    j = np.full(n, probs.team_idx[team2])
+    won, played = simulate_series(probs, i, j, n_maps, rng)
+    return int(won.sum()), np.bincount(played, minlength=n_maps + 1)
+
+def series_matrix(probs, n_maps):
+    """
+    Exact probability of each team beating each other team in a best of
+    n_maps series, summed over every veto order the same way _veto draws
+    them. Vectorized over the veto orders, so memory grows with
+    (number of orders) x (number of teams) ** 2
+    Returns:
+        array (n teams, n teams)
+    """
+    n_pool = len(probs.map_names)
+    orders = np.array(list(itertools.permutations(range(n_pool), n_maps)), dtype="int64")
+    n_teams = len(probs.team_ids)
+
+    # Probability of each order for every pair, team1 picks on even maps
+    veto = np.ones((len(orders), n_teams, n_teams))
+    picked = np.zeros((len(orders), n_teams))
+    for k in range(n_maps):
+        if k == n_maps - 1:
+            veto /= n_pool - k
+            break
+        weights = probs.picks[:, orders[:, k]].T
+        p = weights / (1. - picked)
+        veto *= p[:, :, None] if k % 2 == 0 else p[:, None, :]
+        picked = picked + weights
+
+    # Distribution of team1's map wins after each map
+    wins = np.zeros((n_maps + 1, len(orders), n_teams, n_teams))
+    wins[0] = 1.
+    for k in range(n_maps):
+        p = probs.probs[orders[:, k]]
+        wins[1:k + 2] = wins[1:k + 2] * (1. - p) + wins[:k + 1] * p
+        wins[0] *= 1. - p
+    won = wins[n_maps // 2 + 1:].sum(axis=0)
+    return (veto * won).sum(axis=0)
+
+def simulate_bracket(series, teams, formats, rng):
+    """
+    Simulates single elimination brackets, one per row of teams
+    Params:
+        series:  dictionary {(best of: array as returned by series_matrix)}
+        teams:   int array (n, 2 ** rounds) of team indices in bracket
+                 order, adjacent teams meet in the first round
+        formats: best of for each round
+    Returns:
+        int array (n teams, rounds + 1) counting how often each team
+        reached each round, the last column being wins of the bracket
+    """
+    n, size = teams.shape
+    n_teams = len(next(iter(series.values())))
+    reached = np.zeros((n_teams, len(formats) + 1), dtype="int64")
+    for r, n_maps in enumerate(formats):
+        reached[:, r] += np.bincount(teams.ravel(), minlength=n_teams)
+        team1 = teams[:, 0::2].ravel()
+        team2 = teams[:, 1::2].ravel()
+        won = rng.random(len(team1)) < series[n_maps][team1, team2]
+        teams = np.where(won, team1, team2).reshape(n, -1)
+    reached[:, -1] += np.bincount(teams.ravel(), minlength=n_teams)
+    return reached
+
+def _bracket_chunk(args):
+    series, formats, n, seed = args
+    rng = np.random.default_rng(seed)
+    size = len(next(iter(series.values())))
+    teams = np.tile(np.arange(size), (n, 1))
+    return simulate_bracket(series, teams, formats, rng)
+
+def _run_chunks(func, make_args, n, chunk_size, workers, seed):
+    """
+    Splits n iterations into chunks with independent random streams and
+    runs func over them, in worker processes if workers > 1
+    """
+    sizes = [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [make_args(size, s) for size, s in zip(sizes, seeds)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, args))
+    return [func(a) for a in args]
+
+def series_probability(probs, team1_id, team2_id, format="Bo3", n=1_000_000, seed=0,
+    workers=1, chunk_size=CHUNK_SIZE, z=1.96):
+    """
+    Probability team1 wins a series against team2
+    Returns:
+        dictionary {p, low, high, maps_played} with the confidence interval
+        and the distribution of the number of maps played
+    """
+    n_maps = best_of(format)
+    results = _run_chunks(_series_chunk, lambda size, s: (probs, team1_id, team2_id, n_maps, size, s),
+        n, chunk_size, workers, seed)
+    wins = sum(r[0] for r in results)
+    played = sum(r[1] for r in results)
+    low, high = wilson_interval(wins, n, z)
+    return {
+        "p": wins / n,
+        "low": float(low),
+        "high": float(high),
+        "maps_played": {k: played[k] / n for k in range(1, n_maps + 1) if played[k] > 0}
+    }
+
+def match_probabilities(match_dict, probs, n=100_000, seed=0, workers=1, z=1.96):
+    """
+    Series win probability of team1 for every match in match_dict between
+    teams probs knows, using each match's format
+    Returns:
+        dictionary {(match_id: dictionary as returned by series_probability)}
+    """
+    output = {}
+    for i, (match_id, match) in enumerate(match_dict.items()):
+        if match["team1_id"] in probs.team_idx and match["team2_id"] in probs.team_idx:
+            output[match_id] = series_probability(probs, match["team1_id"], match["team2_id"],
+                match["format"], n, seed + i, workers, z=z)
+    return output
+
+def bracket_probabilities(probs, seeding, formats="Bo3", n=1_000_000, seed=0, workers=1,
+    chunk_size=CHUNK_SIZE, z=1.96):
+    """
+    Simulates a single elimination bracket n times
+    Params:
+        seeding: team ids in bracket order, a power of 2 of them. Adjacent
+                 teams meet in the first round
+        formats: a format for every round, e.g. ["Bo3", "Bo3", "Bo3", "Bo5"],
+                 or one format for all rounds
+    Returns:
+        dictionary {(team_id: {reached: [p of reaching each round],
+                               low, high: interval of the last column})}
+        the last column of reached being the probability of winning the
+        bracket
+    """
+    rounds = int(math.log2(len(seeding)))
+    if 2 ** rounds != len(seeding):
+        raise ValueError(f"Bracket of {len(seeding)} teams isn't a power of 2")
+    if isinstance(formats, str):
+        formats = [formats] * rounds
+    formats = [best_of(f) for f in formats]
+
+    # Series outcomes only depend on the pair of teams, so each series is a
+    # single draw against the exact series probability
+    bracket = probs.subset(seeding)
+    series = {k: series_matrix(bracket, k) for k in set(formats)}
+    results = _run_chunks(_bracket_chunk, lambda size, s: (series, formats, size, s),
+        n, chunk_size, workers, seed)
+    reached = sum(results)
+    low, high = wilson_interval(reached[:, -1], n, z)
+    return {t: {"reached": list(reached[i] / n), "low": float(low[i]), "high": float(high[i])}
+        for i, t in enumerate(seeding)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a bracket of the teams in team.json")
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--format", default="Bo3")
+    parser.add_argument("--method", default="elo", choices=["elo", "glicko"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    team_dict = read_json("team.json")
+    map_dict = read_json("map.json")
+    engine = RatingEngine(args.method)
+    engine.update_maps(map_dict)
+
+    team_ids = list(team_dict)
+    probs = MapProbabilities.from_ratings(engine, team_ids,
+        pick_weights=pick_weights(map_dict, team_ids))
+    # Seed the best rated power of 2 teams, 1 v 16, 8 v 9, ... so the top
+    # seeds meet last
+    ranked = sorted(team_ids, key=lambda t: engine.rating(t), reverse=True)
+    ranked = ranked[:2 ** int(math.log2(len(ranked)))]
+    order = [0]
+    while len(order) < len(ranked):
+        order = [x for i in order for x in (i, 2 * len(order) - 1 - i)]
+    seeding = [ranked[i] for i in order]
+
+    start = time.perf_counter()
+    results = bracket_probabilities(probs, seeding, args.format, args.iterations, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.iterations} brackets in {elapsed:.1f}s")
+    print(f"{'team':20} {'win %':>7} {'95% CI':>16} {'final %':>8}")
+    for team_id in sorted(results, key=lambda t: results[t]["reached"][-1], reverse=True):
+        r = results[team_id]
+        print(f"{team_dict[team_id]['name']:20} {100 * r['reached'][-1]:7.2f} "
+            f"{100 * r['low']:7.2f}-{100 * r['high']:<7.2f} {100 * r['reached'][-2]:8.2f}")
+
+if __name__ == "__main__":
+    main()
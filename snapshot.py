@@ -0,0 +1,300 @@
+import json
+import mmap
+import os
+
+import numpy as np
+
+from main import read_json
+
+SNAPSHOT_VERSION = 1
+
+ROUND_TYPES = ["elimination", "defuse", "bomb", "timeout"]
+BUY_TYPES = ["eco", "semi_eco", "semi_buy", "full_buy"]
+FORMATS = {"Bo1": 1, "Bo2": 2, "Bo3": 3, "Bo5": 5}
+
+class StringTable():
+    """
+    Read-only table of strings backed by a blob of utf-8 bytes and an array
+    of offsets into it. Strings are only decoded when indexed
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def index(self, string):
+        """
+        Returns the code of string, or -1 if it is not in the table
+        """
+        for i, s in enumerate(self):
+            if s == string:
+                return i
+        return -1
+
+class Snapshot():
+    """
+    A dataset snapshot opened with np.load(mmap_mode="r"). Columns are
+    memory mapped so every process reading the same snapshot shares the
+    pages through the page cache rather than holding its own copy
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        with open(os.path.join(dirname, "manifest.json")) as handle:
+            self.manifest = json.loads(handle.read())
+        if self.manifest["version"] != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Snapshot version {self.manifest['version']} != {SNAPSHOT_VERSION}"
+            )
+        self._columns = {}
+        self._strings = {}
+
+    def __getitem__(self, table):
+        return {col: self.column(table, col) for col in self.manifest["tables"][table]["columns"]}
+
+    def __len__(self):
+        return len(self.manifest["tables"])
+
+    def tables(self):
+        return list(self.manifest["tables"].keys())
+
+    def num_rows(self, table):
+        return self.manifest["tables"][table]["rows"]
+
+    def column(self, table, col):
+        """
+        Returns the memory mapped array for table.col
+        """
+        key = (table, col)
+        if key not in self._columns:
+            path = os.path.join(self.dirname, f"{table}.{col}.npy")
+            self._columns[key] = np.load(path, mmap_mode="r")
+        return self._columns[key]
+
+    def strings(self, name):
+        """
+        Returns the StringTable used to decode codes in string columns
+        """
+        if name not in self._strings:
+            offsets = np.load(os.path.join(self.dirname, f"{name}.offsets.npy"), mmap_mode="r")
+            path = os.path.join(self.dirname, f"{name}.strings.bin")
+            if os.path.getsize(path) == 0:
+                blob = b""
+            else:
+                with open(path, "rb") as handle:
+                    blob = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._strings[name] = StringTable(offsets, blob)
+        return self._strings[name]
+
+def _to_int(val, default=-1):
+    return default if val is None else int(val)
+
+def _encode(strings, codes, val):
+    """
+    Returns the code for val in the string table, adding it if needed
+    """
+    if val not in codes:
+        codes[val] = len(strings)
+        strings.append(val)
+    return codes[val]
+
+def dicts_to_tables(team_dict, event_dict, match_dict, map_dict, map_player_dict):
+    """
+    Converts the scraped dictionaries into column arrays
+    Returns:
+        tables:  dictionary {(table: {(column: np.array)})}
+        strings: dictionary {(name: [string])}. String columns are stored as
+                 int32 codes into these lists
+    """
+    names, name_codes = [], {}
+    map_names, map_name_codes = [], {}
+
+    team = {
+        "id":   np.array([int(t) for t in team_dict], dtype="int64"),
+        "name": np.array([_encode(names, name_codes, team_dict[t]["name"]) for t in team_dict], dtype="int32"),
+    }
+
+    match_event = {}
+    for event in event_dict:
+        for match in event_dict[event]["match_ids"]:
+            match_event[match] = int(event)
+
+    map_match = {}
+    match_cols = {c: [] for c in ["id", "event_id", "team1_id", "team2_id",
+        "format", "lan", "score1", "score2"]}
+    for match in match_dict:
+        m = match_dict[match]
+        match_cols["id"].append(int(match))
+        match_cols["event_id"].append(match_event.get(match, -1))
+        match_cols["team1_id"].append(int(m["team1_id"]))
+        match_cols["team2_id"].append(int(m["team2_id"]))
+        match_cols["format"].append(FORMATS.get(m["format"], 0))
+        match_cols["lan"].append(bool(m["LAN"]))
+        match_cols["score1"].append(int(m["score"][0]))
+        match_cols["score2"].append(int(m["score"][1]))
+        for map_id in m["map_ids"]:
+            map_match[map_id] = int(match)
+    match = {
+        "id":       np.array(match_cols["id"], dtype="int64"),
+        "event_id": np.array(match_cols["event_id"], dtype="int64"),
+        "team1_id": np.array(match_cols["team1_id"], dtype="int64"),
+        "team2_id": np.array(match_cols["team2_id"], dtype="int64"),
+        "format":   np.array(match_cols["format"], dtype="uint8"),
+        "lan":      np.array(match_cols["lan"], dtype="bool"),
+        "score1":   np.array(match_cols["score1"], dtype="int16"),
+        "score2":   np.array(match_cols["score2"], dtype="int16"),
+    }
+
+    round_types = {t: i for i, t in enumerate(ROUND_TYPES)}
+    buy_types = {t: i for i, t in enumerate(BUY_TYPES)}
+    map_cols = {c: [] for c in ["id", "match_id", "date", "map_name",
+        "team1_id", "team2_id", "picked_by", "ct_start_team", "score1",
+        "score2", "first_half1", "first_half2", "second_half1", "second_half2",
+        "overtime1", "overtime2", "rating1", "rating2", "first_kills1",
+        "first_kills2", "clutches1", "clutches2", "round_start", "round_count",
+        "has_econ"]}
+    round_cols = {c: [] for c in ["map_idx", "round_winner", "round_type",
+        "team1_buy", "team2_buy", "team1_buy_type", "team2_buy_type"]}
+    for i, map in enumerate(map_dict):
+        m = map_dict[map]
+        rounds = m["rounds"]
+        map_cols["id"].append(int(map))
+        map_cols["match_id"].append(map_match.get(map, -1))
+        map_cols["date"].append(m["date"].replace(" ", "T"))
+        map_cols["map_name"].append(_encode(map_names, map_name_codes, m["map_name"]))
+        map_cols["team1_id"].append(int(m["team1_id"]))
+        map_cols["team2_id"].append(int(m["team2_id"]))
+        map_cols["picked_by"].append(_to_int(m["map_picked_by"]))
+        map_cols["ct_start_team"].append(int(m["ct_start_team"]))
+        for key, col in [("score", "score"), ("first_half_score", "first_half"),
+            ("second_half_score", "second_half"), ("overtime_score", "overtime"),
+            ("first_kills", "first_kills"), ("clutches", "clutches")]:
+            map_cols[f"{col}1"].append(int(m[key][0]))
+            map_cols[f"{col}2"].append(int(m[key][1]))
+        map_cols["rating1"].append(float(m["team_rating"][0]))
+        map_cols["rating2"].append(float(m["team_rating"][1]))
+        map_cols["round_start"].append(len(round_cols["map_idx"]))
+        map_cols["round_count"].append(len(rounds))
+        map_cols["has_econ"].append(len(rounds) > 0 and "team1_buy" in rounds[0])
+
+        for round in rounds:
+            round_cols["map_idx"].append(i)
+            round_cols["round_winner"].append(int(round["round_winner"]))
+            round_cols["round_type"].append(round_types.get(round["round_type"], -1))
+            round_cols["team1_buy"].append(_to_int(round.get("team1_buy")))
+            round_cols["team2_buy"].append(_to_int(round.get("team2_buy")))
+            round_cols["team1_buy_type"].append(buy_types.get(round.get("team1_buy_type"), -1))
+            round_cols["team2_buy_type"].append(buy_types.get(round.get("team2_buy_type"), -1))
+
+    map_dtypes = {
+        "id": "int64", "match_id": "int64", "date": "datetime64[m]",
+        "map_name": "int32", "team1_id": "int64", "team2_id": "int64",
+        "picked_by": "int64", "ct_start_team": "int64", "rating1": "float32",
+        "rating2": "float32", "round_start": "int64", "round_count": "int16",
+        "has_econ": "bool"
+    }
+    map = {c: np.array(v, dtype=map_dtypes.get(c, "int16")) for c, v in map_cols.items()}
+
+    round_dtypes = {
+        "map_idx": "int32", "round_winner": "int64", "round_type": "int8",
+        "team1_buy": "int32", "team2_buy": "int32", "team1_buy_type": "int8",
+        "team2_buy_type": "int8"
+    }
+    round = {c: np.array(v, dtype=round_dtypes[c]) for c, v in round_cols.items()}
+
+    mp_cols = {c: [] for c in ["map_id", "player_id", "kills", "headshots",
+        "assists", "flash_assists", "deaths", "kast", "adr", "first_kills",
+        "first_deaths", "rating"]}
+    for (map_id, player_id), stats in map_player_dict.items():
+        mp_cols["map_id"].append(int(map_id))
+        mp_cols["player_id"].append(int(player_id))
+        for key in list(mp_cols.keys())[2:]:
+            mp_cols[key].append(float(stats[key]))
+    mp_dtypes = {"map_id": "int64", "player_id": "int64", "kast": "float32",
+        "adr": "float32", "rating": "float32"}
+    map_player = {c: np.array(v, dtype=mp_dtypes.get(c, "int16")) for c, v in mp_cols.items()}
+
+    tables = {
+        "team": team,
+        "match": match,
+        "map": map,
+        "round": round,
+        "map_player": map_player
+    }
+    strings = {
+        "team_name": names,
+        "map_name": map_names,
+        "round_type": ROUND_TYPES,
+        "buy_type": BUY_TYPES
+    }
+    return tables, strings
+
+def write_snapshot(dirname, tables, strings):
+    """
+    Writes tables as one .npy file per column, plus a blob and offsets
+    array per string table, and a manifest describing them
+    """
+    os.makedirs(dirname, exist_ok=True)
+
+    manifest = {"version": SNAPSHOT_VERSION, "tables": {}, "strings": list(strings)}
+    for table, cols in tables.items():
+        rows = None
+        for col, arr in cols.items():
+            if rows is not None and len(arr) != rows:
+                raise ValueError(f"Column {table}.{col} has {len(arr)} rows, expected {rows}")
+            rows = len(arr)
+            np.save(os.path.join(dirname, f"{table}.{col}.npy"), arr)
+        manifest["tables"][table] = {"rows": rows or 0, "columns": list(cols)}
+
+    for name, values in strings.items():
+        encoded = [s.encode("utf-8") for s in values]
+        offsets = np.zeros(len(encoded) + 1, dtype="int64")
+        offsets[1:] = np.cumsum([len(s) for s in encoded])
+        np.save(os.path.join(dirname, f"{name}.offsets.npy"), offsets)
+        with open(os.path.join(dirname, f"{name}.strings.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+
+    # Write manifest last so a partially written snapshot is never opened
+    with open(os.path.join(dirname, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+
+def open_snapshot(dirname):
+    """
+    Opens a snapshot written by write_snapshot. Nothing is parsed or copied,
+    columns are memory mapped on first access
+    """
+    return Snapshot(dirname)
+
+def build_snapshot(dirname="snapshot"):
+    """
+    Builds a snapshot from the .json files in the working directory
+    """
+    team_dict = read_json("team.json")
+    event_dict = read_json("event.json")
+    match_dict = read_json("match.json")
+    map_dict = read_json("map.json")
+    map_player_dict = read_json("map_player.json", is_tuple_key=True)
+
+    tables, strings = dicts_to_tables(team_dict, event_dict, match_dict, map_dict, map_player_dict)
+    write_snapshot(dirname, tables, strings)
+    return tables, strings
+
+def main():
+    tables, _ = build_snapshot()
+    for table, cols in tables.items():
+        rows = len(next(iter(cols.values()))) if cols else 0
+        print(f"{table}: {rows} rows, {len(cols)} columns")
+
+if __name__ == "__main__":
+    main()
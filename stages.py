@@ -0,0 +1,316 @@
+import os
+import shutil
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from artifact_cache import file_hash
+from main import (MAJOR_END_DATE, get_major_players, get_major_teams, get_map_ids,
+    read_json, remove_invalid_maps, write_dict)
+from roster_index import RosterIndex
+from scheduler import REMAINING_FILE, CrawlScheduler, crawl_maps
+
+STATE_FILE = "stages_state.json"
+# Maps get_map_player_info has left to fetch
+MAP_PLAYER_REMAINING_FILE = "map_player_remaining.json"
+
+# Tables keyed by (map_id, player_id)
+TUPLE_KEY_FILES = ["map_player.json", "map_players.json"]
+
+class Stage():
+    """
+    A step of the scrape: func is called with the table read from each
+    input file, in order, then params and context as keyword arguments,
+    and returns one table per output file (a tuple if there are several)
+    """
+
+    def __init__(self, name, func, inputs, outputs, params=None, context=None, pending=None):
+        """
+        Params:
+            params:  keyword arguments that change the outputs, so are part
+                     of the stage's hash
+            context: keyword arguments that don't, like the HLTV client
+            pending: function returning whether the last run left work for
+                     the next, like a crawl cut short by its budget. The
+                     stage is never current while it does
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params if params is not None else {}
+        self.context = context if context is not None else {}
+        self.pending = pending
+
+    def key(self):
+        """
+        Identifies everything the outputs depend on besides the inputs
+        """
+        return f"{self.func.__module__}.{self.func.__qualname__}({sorted(self.params.items())!r})"
+
+    def run(self):
+        tables = [read_json(f, is_tuple_key=f in TUPLE_KEY_FILES) for f in self.inputs]
+        outputs = self.func(*tables, **self.params, **self.context)
+        if len(self.outputs) == 1:
+            outputs = (outputs,)
+        for table, filename in zip(outputs, self.outputs):
+            write_dict(table, filename)
+
+class Pipeline():
+    """
+    Runs stages in dependency order, a stage depending on the stages that
+    write its input files. Stages whose dependencies are done run
+    concurrently on threads, and a stage is skipped when the content hash
+    of its inputs, its parameters and its outputs are all unchanged since
+    it last ran, so only invalidated work is redone
+    """
+
+    def __init__(self, stages, state_file=STATE_FILE):
+        self.stages = {s.name: s for s in stages}
+        self.state_file = state_file
+        self.producer = {}
+        for stage in stages:
+            for f in stage.outputs:
+                if f in self.producer:
+                    raise ValueError(f"{f} is written by both {self.producer[f]} and {stage.name}")
+                self.producer[f] = stage.name
+        self.dependencies = {s.name: {self.producer[f] for f in s.inputs if f in self.producer}
+            for s in stages}
+        self.order()
+
+    def order(self):
+        """
+        Returns the stage names in a dependency order, raising ValueError
+        on a cycle
+        """
+        order = []
+        done = set()
+        visiting = set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stages have a cycle through {name}")
+            visiting.add(name)
+            for dep in sorted(self.dependencies[name]):
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _read_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        return read_json(self.state_file)
+
+    def _fingerprint(self, stage):
+        return {"key": stage.key(), "inputs": {f: file_hash(f) for f in stage.inputs}}
+
+    def _back_up(self, stage):
+        """
+        Copies the outputs a stage's first run overwrites, like tables
+        committed before the pipeline wrote them, to <output>.bak unless
+        there already is one
+        """
+        for f in stage.outputs:
+            if not os.path.exists(f):
+                continue
+            print(f"{stage.name}: overwriting {f}, which the pipeline hasn't written before. "
+                f"The first version is kept in {f}.bak")
+            if not os.path.exists(f + ".bak"):
+                shutil.copyfile(f, f + ".bak")
+
+    def is_current(self, stage, state):
+        """
+        Whether stage's last run had the same inputs and parameters and its
+        outputs haven't changed since
+        """
+        last = state.get(stage.name)
+        if last is None or any(file_hash(f) is None for f in stage.inputs):
+            return False
+        if stage.pending is not None and stage.pending():
+            return False
+        fingerprint = self._fingerprint(stage)
+        if last["key"] != fingerprint["key"] or last["inputs"] != fingerprint["inputs"]:
+            return False
+        return all(file_hash(f) is not None and last["outputs"].get(f) == file_hash(f)
+            for f in stage.outputs)
+
+    def run(self, only=None, force=(), workers=4):
+        """
+        Params:
+            only:   stage names to run, all if None. Inputs of other stages
+                    are read from disk as they are
+            force:  stage names to run even if they are current
+        Returns:
+            dictionary {(stage: "ran", "skipped" or "failed")}, in the order
+            the stages finished
+        """
+        names = [n for n in self.order() if only is None or n in only]
+        state = self._read_state()
+        results = {}
+        errors = []
+        remaining = {n: self.dependencies[n] & set(names) for n in names}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while len(remaining) > 0 or len(running) > 0:
+                ready = [n for n, deps in remaining.items() if all(d in results for d in deps)]
+                for name in ready:
+                    del remaining[name]
+                    stage = self.stages[name]
+                    if any(results[d] == "failed" for d in self.dependencies[name] if d in results):
+                        results[name] = "failed"
+                    elif name not in force and self.is_current(stage, state):
+                        print(f"{name}: up to date")
+                        results[name] = "skipped"
+                    else:
+                        print(f"{name}: running")
+                        if name not in state:
+                            self._back_up(stage)
+                        running[executor.submit(stage.run)] = name
+                if len(ready) > 0 or len(running) == 0:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    if future.exception() is not None:
+                        errors.append((name, future.exception()))
+                        results[name] = "failed"
+                        continue
+                    state[name] = dict(self._fingerprint(stage),
+                        outputs={f: file_hash(f) for f in stage.outputs})
+                    write_dict(state, self.state_file)
+                    results[name] = "ran"
+
+        for name, e in errors:
+            print(f"{name} failed: {e!r}")
+        if len(errors) > 0:
+            raise errors[0][1]
+        return results
+
+def _major_teams(hltv):
+    return get_major_teams(hltv)
+
+def _major_players(team_dict, hltv):
+    player_dict = get_major_players(hltv, team_dict)
+    return team_dict, player_dict
+
+def _map_ids(team_dict, latest_date, min_players, hltv, refetch=False):
+    # Maps of an earlier scrape answer the lineup listing of the teams they
+    # cover. That needs every map the last listing found for the team to be
+    # in map.json, so teams with maps still to crawl or found invalid are
+    # requested. map.json is written by a later stage, so it isn't an input.
+    # A refetch requests every listing
+    index = None
+    if not refetch and os.path.exists("map.json") and os.path.exists("map_ids.json"):
+        map_dict = read_json("map.json")
+        index = RosterIndex(map_dict, {m: teams for m, teams in read_json("map_ids.json").items()
+            if m not in map_dict})
+    return get_map_ids(hltv, team_dict, latest_date, min_players, index)
+
+def _match_info(map_ids, team_dict, hltv):
+    return hltv.get_match_info(map_ids, team_dict)
+
+def _read_existing(filename, keys):
+    if not os.path.exists(filename):
+        return {}
+    return {k: v for k, v in read_json(filename).items() if k in keys}
+
+def _map_info(team_dict, match_dict, map_pick_dict, event_dict, hltv, scheduler, budget=None, workers=0,
+    refetch=False):
+    # Maps of the matches scraped on earlier runs are kept and only the rest
+    # are fetched, highest priority first, unless every map is refetched.
+    # The outputs aren't inputs, as the stage would then depend on itself
+    map_ids = set() if refetch else {m for match in match_dict.values() for m in match["map_ids"]}
+    return crawl_maps(hltv, scheduler, team_dict, match_dict, map_pick_dict, event_dict,
+        _read_existing("map.json", map_ids), _read_existing("invalid_maps.json", map_ids), budget, workers)
+
+def _crawl_pending(remaining_file):
+    return os.path.exists(remaining_file) and len(read_json(remaining_file)) > 0
+
+def _map_player_info(match_dict, event_dict, team_dict, player_dict, hltv, scheduler, budget=None, workers=0,
+    refetch=False):
+    # As in _map_info the maps of earlier runs keep their rows, and so do
+    # the players and team members they found. Which maps are invalid is
+    # only known after get_map_info, so remove_invalid_maps drops their rows
+    map_ids = set() if refetch else {m for match in match_dict.values() for m in match["map_ids"]}
+    map_player_dict = {} if refetch or not os.path.exists("map_players.json") else {k: v for k, v in
+        read_json("map_players.json", is_tuple_key=True).items() if k[0] in map_ids}
+    known = set(player_dict)
+    if not refetch:
+        if os.path.exists("new_players.json"):
+            for player_id, player in read_json("new_players.json").items():
+                player_dict.setdefault(player_id, player)
+        for team_id, team in _read_existing("map_player_teams.json", team_dict).items():
+            players = team_dict[team_id]["players"]
+            players.extend(p for p in team["players"] if p not in players)
+
+    done = {map_id for map_id, _ in map_player_dict}
+    pending = [m for match in match_dict.values() for m in match["map_ids"] if m not in done]
+    scheduled, remaining = scheduler.plan(pending, match_dict, event_dict, {}, budget, requests_per_map=1)
+    # Only the teams of each map are needed, which the matches already have
+    map_teams = {map_id: {"team1_id": match["team1_id"], "team2_id": match["team2_id"]}
+        for match in match_dict.values() for map_id in match["map_ids"]}
+    new_rows, player_dict, team_dict = hltv.get_map_player_info({m: map_teams[m] for m in scheduled},
+        player_dict, team_dict, workers=workers)
+    map_player_dict.update(new_rows)
+    return (map_player_dict, {p: v for p, v in player_dict.items() if p not in known}, team_dict,
+        {m: None for m in remaining})
+
+def _remove_invalid_maps(match_dict, event_dict, map_player_dict, invalid_map_ids):
+    match_dict, event_dict = remove_invalid_maps(list(invalid_map_ids), match_dict, event_dict)
+    return match_dict, event_dict, {k: v for k, v in map_player_dict.items() if k[0] not in invalid_map_ids}
+
+def scrape_stages(hltv, latest_date=MAJOR_END_DATE, min_players=4, workers=0, scheduler=None,
+    budget=None, refetch=False):
+    """
+    The stages of the scrape, sharing one HLTV client and so one rate
+    budget. get_map_info and get_map_player_info both only need the
+    matches, so they run at the same time. Each fetches the maps not
+    scraped on earlier runs in the order of scheduler within budget
+    requests, and is rerun until none are left. The map player rows go to
+    map_players.json, and remove_invalid_maps writes them without those of
+    the maps get_map_info found invalid to map_player.json. Players found
+    on maps who aren't in player.json go to new_players.json, and the teams
+    with them added to map_player_teams.json
+    Params:
+        workers:    processes get_map_info and get_map_player_info parse
+                    pages in, 0 to parse them as they are fetched
+        scheduler:  CrawlScheduler ordering the maps, the default weights
+                    if None
+        budget:     requests each of get_map_info and get_map_player_info
+                    may send per run, None for no limit
+        refetch:    whether to fetch every lineup listing and map again
+                    rather than answer from the maps earlier runs scraped,
+                    as a reparse with changed parsers needs
+    """
+    h = {"hltv": hltv}
+    parse = {"hltv": hltv, "workers": workers}
+    crawl = dict(parse, scheduler=scheduler if scheduler is not None else CrawlScheduler(), budget=budget,
+        refetch=refetch)
+    return [
+        Stage("major_teams", _major_teams, [], ["major_teams.json"], context=h),
+        Stage("major_players", _major_players, ["major_teams.json"], ["team.json", "player.json"],
+            context=h),
+        Stage("map_ids", _map_ids, ["team.json"], ["map_ids.json"],
+            {"latest_date": latest_date, "min_players": min_players}, dict(h, refetch=refetch)),
+        Stage("match_info", _match_info, ["map_ids.json", "team.json"],
+            ["matches.json", "map_picks.json", "events.json"], context=h),
+        Stage("map_info", _map_info, ["team.json", "matches.json", "map_picks.json", "events.json"],
+            ["map.json", "invalid_maps.json", REMAINING_FILE], context=crawl,
+            pending=partial(_crawl_pending, REMAINING_FILE)),
+        Stage("map_player_info", _map_player_info, ["matches.json", "events.json", "team.json", "player.json"],
+            ["map_players.json", "new_players.json", "map_player_teams.json", MAP_PLAYER_REMAINING_FILE],
+            context=crawl, pending=partial(_crawl_pending, MAP_PLAYER_REMAINING_FILE)),
+        Stage("remove_invalid_maps", _remove_invalid_maps,
+            ["matches.json", "events.json", "map_players.json", "invalid_maps.json"],
+            ["match.json", "event.json", "map_player.json"]),
+    ]
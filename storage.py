@@ -0,0 +1,430 @@
+import sqlite3
+
+from records import FLOAT_FORMATS
+
+DB_FILENAME = "hltv.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS team (
+    id              INTEGER PRIMARY KEY,
+    name            TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS player (
+    id              INTEGER PRIMARY KEY,
+    name            TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS team_player (
+    team_id         INTEGER NOT NULL,
+    player_id       INTEGER NOT NULL,
+    position        INTEGER NOT NULL,
+    major_roster    INTEGER NOT NULL,
+    PRIMARY KEY (team_id, player_id)
+);
+CREATE TABLE IF NOT EXISTS event (
+    id              INTEGER PRIMARY KEY,
+    name            TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match (
+    id              INTEGER PRIMARY KEY,
+    event_id        INTEGER,
+    position        INTEGER,
+    team1_id        INTEGER NOT NULL,
+    team2_id        INTEGER NOT NULL,
+    format          TEXT,
+    lan             INTEGER,
+    score1          INTEGER,
+    score2          INTEGER
+);
+CREATE TABLE IF NOT EXISTS match_map (
+    match_id        INTEGER NOT NULL,
+    map_id          INTEGER NOT NULL,
+    position        INTEGER NOT NULL,
+    map_picked_by   INTEGER,
+    PRIMARY KEY (match_id, map_id)
+);
+CREATE TABLE IF NOT EXISTS map (
+    id              INTEGER PRIMARY KEY,
+    date            TEXT NOT NULL,
+    map_name        TEXT NOT NULL,
+    team1_id        INTEGER NOT NULL,
+    team2_id        INTEGER NOT NULL,
+    map_picked_by   INTEGER,
+    ct_start_team   INTEGER,
+    score1          INTEGER, score2          INTEGER,
+    first_half1     INTEGER, first_half2     INTEGER,
+    second_half1    INTEGER, second_half2    INTEGER,
+    overtime1       INTEGER, overtime2       INTEGER,
+    rating1         REAL,    rating2         REAL,
+    first_kills1    INTEGER, first_kills2    INTEGER,
+    clutches1       INTEGER, clutches2       INTEGER
+);
+CREATE TABLE IF NOT EXISTS map_lineup (
+    map_id          INTEGER NOT NULL,
+    team_idx        INTEGER NOT NULL,
+    position        INTEGER NOT NULL,
+    player_id       INTEGER NOT NULL,
+    PRIMARY KEY (map_id, team_idx, position)
+);
+CREATE TABLE IF NOT EXISTS round (
+    map_id          INTEGER NOT NULL,
+    round_no        INTEGER NOT NULL,
+    round_winner    INTEGER NOT NULL,
+    round_type      TEXT,
+    team1_buy       INTEGER,
+    team2_buy       INTEGER,
+    team1_buy_type  TEXT,
+    team2_buy_type  TEXT,
+    PRIMARY KEY (map_id, round_no)
+);
+CREATE TABLE IF NOT EXISTS map_player (
+    map_id          INTEGER NOT NULL,
+    player_id       INTEGER NOT NULL,
+    kills           INTEGER,
+    headshots       INTEGER,
+    assists         INTEGER,
+    flash_assists   INTEGER,
+    deaths          INTEGER,
+    kast            REAL,
+    adr             REAL,
+    first_kills     INTEGER,
+    first_deaths    INTEGER,
+    rating          REAL,
+    PRIMARY KEY (map_id, player_id)
+);
+CREATE INDEX IF NOT EXISTS match_event_idx ON match (event_id);
+CREATE INDEX IF NOT EXISTS match_map_map_idx ON match_map (map_id);
+CREATE INDEX IF NOT EXISTS map_teams_idx ON map (team1_id, team2_id);
+CREATE INDEX IF NOT EXISTS map_team2_idx ON map (team2_id);
+CREATE INDEX IF NOT EXISTS map_date_idx ON map (date);
+CREATE INDEX IF NOT EXISTS map_name_idx ON map (map_name, date);
+CREATE INDEX IF NOT EXISTS map_player_player_idx ON map_player (player_id);
+"""
+
+MAP_PLAYER_STATS = ["kills", "headshots", "assists", "flash_assists", "deaths",
+    "kast", "adr", "first_kills", "first_deaths", "rating"]
+
+# (map_dict key, column prefix) of the (team1, team2) pairs in map rows
+MAP_PAIRS = [("score", "score"), ("first_half_score", "first_half"),
+    ("second_half_score", "second_half"), ("overtime_score", "overtime"),
+    ("team_rating", "rating"), ("first_kills", "first_kills"),
+    ("clutches", "clutches")]
+
+def _int(val):
+    return None if val is None else int(val)
+
+def _str(val, key=None):
+    """
+    Values are strings in the .json tables, convert back on load
+    """
+    if val is None:
+        return None
+    if key in FLOAT_FORMATS:
+        return FLOAT_FORMATS[key].format(val)
+    return str(val)
+
+class Storage():
+    """
+    SQLite backed store for the scraped tables. Each upsert only writes the
+    rows it is given, and the load_* methods return dictionaries in the same
+    format as read_json on the corresponding .json file
+    """
+
+    def __init__(self, filename=DB_FILENAME):
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Upserts
+
+    def upsert_teams(self, team_dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO team (id, name) VALUES (?, ?)",
+                [(int(t), team_dict[t]["name"]) for t in team_dict])
+            for t in team_dict:
+                players = team_dict[t].get("players", [])
+                major = team_dict[t].get("major_roster", [])
+                self.conn.execute("DELETE FROM team_player WHERE team_id = ?", (int(t),))
+                self.conn.executemany(
+                    "INSERT INTO team_player VALUES (?, ?, ?, ?)",
+                    [(int(t), int(p), i, p in major) for i, p in enumerate(players)])
+
+    def upsert_players(self, player_dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO player (id, name) VALUES (?, ?)",
+                [(int(p), player_dict[p]["name"]) for p in player_dict])
+
+    def upsert_events(self, event_dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO event (id, name) VALUES (?, ?)",
+                [(int(e), event_dict[e]["event_name"]) for e in event_dict])
+            for e in event_dict:
+                self.conn.executemany(
+                    "UPDATE match SET event_id = ?, position = ? WHERE id = ?",
+                    [(int(e), i, int(m)) for i, m in enumerate(event_dict[e]["match_ids"])])
+                # Matches not stored yet get their event when upserted
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO match (id, event_id, position, team1_id, team2_id) "
+                    "VALUES (?, ?, ?, -1, -1)",
+                    [(int(m), int(e), i) for i, m in enumerate(event_dict[e]["match_ids"])])
+
+    def upsert_matches(self, match_dict, map_picks_dict=None):
+        """
+        Params:
+            match_dict:     dictionary returned from HLTV.get_match_info()
+            map_picks_dict: dictionary returned from HLTV.get_match_info()
+        """
+        map_picks_dict = map_picks_dict if map_picks_dict is not None else {}
+        with self.conn:
+            for m in match_dict:
+                match = match_dict[m]
+                self.conn.execute(
+                    "INSERT INTO match (id, team1_id, team2_id, format, lan, score1, score2) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET team1_id = excluded.team1_id, "
+                    "team2_id = excluded.team2_id, format = excluded.format, "
+                    "lan = excluded.lan, score1 = excluded.score1, score2 = excluded.score2",
+                    (int(m), int(match["team1_id"]), int(match["team2_id"]),
+                        match["format"], bool(match["LAN"]),
+                        int(match["score"][0]), int(match["score"][1])))
+                self.conn.execute("DELETE FROM match_map WHERE match_id = ?", (int(m),))
+                self.conn.executemany(
+                    "INSERT INTO match_map VALUES (?, ?, ?, ?)",
+                    [(int(m), int(map_id), i, _int(map_picks_dict.get(map_id)))
+                        for i, map_id in enumerate(match["map_ids"])])
+
+    def upsert_maps(self, map_dict):
+        """
+        Params:
+            map_dict: dictionary returned from HLTV.get_map_info()
+        """
+        with self.conn:
+            for m in map_dict:
+                map = map_dict[m]
+                row = [int(m), map["date"], map["map_name"], int(map["team1_id"]),
+                    int(map["team2_id"]), _int(map["map_picked_by"]),
+                    int(map["ct_start_team"])]
+                for key, _ in MAP_PAIRS:
+                    cast = float if key == "team_rating" else int
+                    row.extend([cast(map[key][0]), cast(map[key][1])])
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO map VALUES ({', '.join(['?'] * len(row))})", row)
+
+                self.conn.execute("DELETE FROM map_lineup WHERE map_id = ?", (int(m),))
+                self.conn.executemany(
+                    "INSERT INTO map_lineup VALUES (?, ?, ?, ?)",
+                    [(int(m), t, i, int(p)) for t in range(2)
+                        for i, p in enumerate(map[f"team{t+1}_players"])])
+
+                self.conn.execute("DELETE FROM round WHERE map_id = ?", (int(m),))
+                self.conn.executemany(
+                    "INSERT INTO round VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(int(m), i, int(r["round_winner"]), r["round_type"],
+                        _int(r.get("team1_buy")), _int(r.get("team2_buy")),
+                        r.get("team1_buy_type"), r.get("team2_buy_type"))
+                        for i, r in enumerate(map["rounds"])])
+
+    def upsert_map_players(self, map_player_dict):
+        """
+        Params:
+            map_player_dict: dictionary returned from HLTV.get_map_player_info()
+        """
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO map_player VALUES ({', '.join(['?'] * 12)})",
+                [(int(map_id), int(player_id)) + tuple(float(stats[s]) for s in MAP_PLAYER_STATS)
+                    for (map_id, player_id), stats in map_player_dict.items()])
+
+    def delete_maps(self, map_ids):
+        """
+        Removes maps and everything referring to them
+        """
+        ids = [(int(m),) for m in map_ids]
+        with self.conn:
+            for table, col in [("map", "id"), ("map_lineup", "map_id"), ("round", "map_id"),
+                ("map_player", "map_id"), ("match_map", "map_id")]:
+                self.conn.executemany(f"DELETE FROM {table} WHERE {col} = ?", ids)
+
+    # Loads, in the same format as the .json files
+
+    def load_teams(self):
+        team_dict = {}
+        for id, name in self.conn.execute("SELECT id, name FROM team"):
+            team_dict[str(id)] = {"name": name, "major_roster": [], "players": []}
+        rows = self.conn.execute(
+            "SELECT team_id, player_id, major_roster FROM team_player ORDER BY team_id, position")
+        for team_id, player_id, major in rows:
+            team_dict[str(team_id)]["players"].append(str(player_id))
+            if major:
+                team_dict[str(team_id)]["major_roster"].append(str(player_id))
+        return team_dict
+
+    def load_players(self):
+        return {str(id): {"name": name} for id, name in self.conn.execute("SELECT id, name FROM player")}
+
+    def load_events(self):
+        event_dict = {str(id): {"event_name": name, "match_ids": []}
+            for id, name in self.conn.execute("SELECT id, name FROM event")}
+        rows = self.conn.execute(
+            "SELECT id, event_id FROM match WHERE event_id IS NOT NULL ORDER BY event_id, position")
+        for match_id, event_id in rows:
+            if str(event_id) in event_dict:
+                event_dict[str(event_id)]["match_ids"].append(str(match_id))
+        return event_dict
+
+    def load_matches(self):
+        match_dict = {}
+        rows = self.conn.execute(
+            "SELECT id, team1_id, team2_id, format, lan, score1, score2 FROM match "
+            "WHERE team1_id != -1")
+        for id, t1, t2, format, lan, s1, s2 in rows:
+            match_dict[str(id)] = {
+                "team1_id": str(t1),
+                "team2_id": str(t2),
+                "format":   format,
+                "LAN":      bool(lan),
+                "score":    [str(s1), str(s2)],
+                "map_ids":  []
+            }
+        rows = self.conn.execute("SELECT match_id, map_id FROM match_map ORDER BY match_id, position")
+        for match_id, map_id in rows:
+            if str(match_id) in match_dict:
+                match_dict[str(match_id)]["map_ids"].append(str(map_id))
+        return match_dict
+
+    def load_map_picks(self):
+        return {str(map_id): _str(pick)
+            for map_id, pick in self.conn.execute("SELECT map_id, map_picked_by FROM match_map")}
+
+    def load_maps(self, where="", params=()):
+        """
+        Returns maps in the format of HLTV.get_map_info(). where is an
+        optional SQL condition on the map table, e.g. "date >= ?"
+        """
+        where = f"WHERE {where}" if where else ""
+        cols = ["id", "date", "map_name", "team1_id", "team2_id", "map_picked_by", "ct_start_team"]
+        for _, prefix in MAP_PAIRS:
+            cols.extend([f"{prefix}1", f"{prefix}2"])
+        map_dict = {}
+        for row in self.conn.execute(f"SELECT {', '.join(cols)} FROM map {where} ORDER BY rowid", params):
+            row = dict(zip(cols, row))
+            map = {
+                "date":           row["date"],
+                "map_name":       row["map_name"],
+                "team1_id":       str(row["team1_id"]),
+                "team2_id":       str(row["team2_id"]),
+                "map_picked_by":  _str(row["map_picked_by"]),
+                "ct_start_team":  str(row["ct_start_team"]),
+            }
+            for key, prefix in MAP_PAIRS:
+                map[key] = [_str(row[f"{prefix}1"], key), _str(row[f"{prefix}2"], key)]
+            map["rounds"] = []
+            map["team1_players"] = []
+            map["team2_players"] = []
+            map_dict[str(row["id"])] = map
+        if len(map_dict) == 0:
+            return map_dict
+
+        ids = f"SELECT id FROM map {where}"
+        rows = self.conn.execute(
+            f"SELECT map_id, round_winner, round_type, team1_buy, team2_buy, team1_buy_type, "
+            f"team2_buy_type FROM round WHERE map_id IN ({ids}) ORDER BY map_id, round_no", params)
+        for map_id, winner, type, b1, b2, bt1, bt2 in rows:
+            round = {"round_winner": str(winner), "round_type": type}
+            if b1 is not None:
+                round.update({"team1_buy": str(b1), "team2_buy": str(b2),
+                    "team1_buy_type": bt1, "team2_buy_type": bt2})
+            map_dict[str(map_id)]["rounds"].append(round)
+
+        rows = self.conn.execute(
+            f"SELECT map_id, team_idx, player_id FROM map_lineup WHERE map_id IN ({ids}) "
+            "ORDER BY map_id, team_idx, position", params)
+        for map_id, team_idx, player_id in rows:
+            map_dict[str(map_id)][f"team{team_idx+1}_players"].append(str(player_id))
+
+        return map_dict
+
+    def load_map_players(self, where="", params=()):
+        where = f"WHERE {where}" if where else ""
+        map_player_dict = {}
+        rows = self.conn.execute(
+            f"SELECT map_id, player_id, {', '.join(MAP_PLAYER_STATS)} FROM map_player {where}", params)
+        for row in rows:
+            map_player_dict[(str(row[0]), str(row[1]))] = {
+                s: (_str(v, s) if s in FLOAT_FORMATS else str(int(v)))
+                for s, v in zip(MAP_PLAYER_STATS, row[2:])
+            }
+        return map_player_dict
+
+    # Indexed queries
+
+    def maps_by_team_pair(self, team1_id, team2_id):
+        """
+        Returns maps played between the two teams, in either order
+        """
+        return self.load_maps(
+            "(team1_id = ? AND team2_id = ?) OR (team1_id = ? AND team2_id = ?)",
+            (int(team1_id), int(team2_id), int(team2_id), int(team1_id)))
+
+    def maps_by_date_range(self, start, end):
+        """
+        Returns maps played between start and end inclusive. Dates are
+        strings in the map format, "%Y-%m-%d %H:%M", or a prefix of it
+        """
+        return self.load_maps("date >= ? AND date <= ?", (start, end + "\uffff"))
+
+    def maps_by_event(self, event_id):
+        return self.load_maps(
+            "id IN (SELECT mm.map_id FROM match_map mm JOIN match m ON m.id = mm.match_id "
+            "WHERE m.event_id = ?)", (int(event_id),))
+
+    def map_ids_by_event(self, event_id):
+        rows = self.conn.execute(
+            "SELECT mm.map_id FROM match_map mm JOIN match m ON m.id = mm.match_id "
+            "WHERE m.event_id = ? ORDER BY m.position, mm.position", (int(event_id),))
+        return [str(r[0]) for r in rows]
+
+    def map_players_by_player(self, player_id):
+        return self.load_map_players("player_id = ?", (int(player_id),))
+
+def import_json(storage):
+    """
+    Upserts every .json table in the working directory into storage
+    """
+    # Imported here as main imports this module
+    from main import read_json
+
+    storage.upsert_teams(read_json("team.json"))
+    storage.upsert_players(read_json("player.json"))
+    storage.upsert_matches(read_json("match.json"))
+    storage.upsert_events(read_json("event.json"))
+    storage.upsert_maps(read_json("map.json"))
+    storage.upsert_map_players(read_json("map_player.json", is_tuple_key=True))
+
+def read_tables(filename=DB_FILENAME):
+    """
+    Returns team, player, event, match, map and map_player dictionaries from
+    the database, as read_json would from the .json files
+    """
+    with Storage(filename) as storage:
+        return (storage.load_teams(), storage.load_players(), storage.load_events(),
+            storage.load_matches(), storage.load_maps(), storage.load_map_players())
+
+def main():
+    with Storage() as storage:
+        import_json(storage)
+
+if __name__ == "__main__":
+    main()
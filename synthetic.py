@@ -0,0 +1,322 @@
+import argparse
+import math
+import os
+import random
+
+from datetime import datetime, timedelta
+
+from main import MAJOR_EVENT_ID, write_dict
+from ratings import MAP_NAMES
+
+# Sizes of the committed dataset, multiplied by scale
+BASE_TEAMS = 16
+BASE_EVENTS = 59
+BASE_MATCHES = 317
+
+FORMATS = [("Bo1", 41), ("Bo3", 263), ("Bo5", 13)]
+FIRST_DATE = datetime(2019, 1, 1)
+LAST_DATE = datetime(2021, 11, 7)
+
+# Economy, for a whole team of 5
+START_MONEY = 4000
+MAX_MONEY = 80000
+WIN_REWARD = 16250
+LOSS_REWARDS = [7000, 9500, 12000, 14500, 17000]
+
+def _buy(money, rng):
+    """
+    Returns the equipment value a team buys with money, rounded like HLTV
+    """
+    if money >= 25000:
+        spend = rng.uniform(22000, min(money, 30000))
+    elif money >= 12000 and rng.random() < 0.5:
+        spend = rng.uniform(10500, min(money, 19000))
+    else:
+        spend = rng.uniform(min(money, 2000), min(money, 5000))
+    return int(spend) // 50 * 50
+
+def _buy_type(value):
+    # Same thresholds as HLTV._get_econ
+    if value > 20_000:
+        return "full_buy"
+    elif value > 10_000:
+        return "semi_buy"
+    elif value > 5_000:
+        return "semi_eco"
+    return "eco"
+
+class SyntheticDataset():
+    """
+    Seeded generator of datasets in the same format as the .json tables.
+    Every map is simulated round by round with a simple economy, so scores,
+    halves, overtime, econ and player stats are all consistent and pass
+    validation.validate_maps
+    """
+
+    def __init__(self, scale=1., seed=0, n_teams=None, n_events=None, n_matches=None,
+        econ_missing=0.):
+        """
+        Params:
+            scale:          multiplier of the committed dataset's sizes
+            seed:           int. Same seed, same dataset
+            n_teams, n_events, n_matches: override the scaled sizes
+            econ_missing:   proportion of maps without econ stats, which
+                            validation quarantines
+        """
+        self.rng = random.Random(seed)
+        self.n_teams = n_teams if n_teams is not None else max(2, int(round(BASE_TEAMS * scale)))
+        self.n_events = n_events if n_events is not None else max(1, int(round(BASE_EVENTS * scale)))
+        self.n_matches = n_matches if n_matches is not None else max(1, int(round(BASE_MATCHES * scale)))
+        self.econ_missing = econ_missing
+
+        self.team_dict = {}
+        self.player_dict = {}
+        self.event_dict = {}
+        self.match_dict = {}
+        self.map_dict = {}
+        self.map_player_dict = {}
+
+        self.strength = {}
+        self.player_skill = {}
+        self.next_id = {"match": 2300000, "map": 100000}
+
+    def _new_id(self, kind):
+        self.next_id[kind] += 1
+        return str(self.next_id[kind])
+
+    def generate(self):
+        """
+        Returns team_dict, player_dict, event_dict, match_dict, map_dict,
+        map_player_dict
+        """
+        self._teams()
+        events = self._events()
+        matches_per_event = self._split(self.n_matches, len(events))
+        for (event_id, start), n in zip(events, matches_per_event):
+            self.event_dict[event_id]["match_ids"] = [self._match(start) for _ in range(n)]
+        return self.team_dict, self.player_dict, self.event_dict, self.match_dict, \
+            self.map_dict, self.map_player_dict
+
+    def _split(self, n, k):
+        """
+        Splits n into k random positive parts, or zeros if n < k
+        """
+        if n < k:
+            return [1] * n + [0] * (k - n)
+        cuts = sorted(self.rng.sample(range(1, n), k - 1))
+        return [b - a for a, b in zip([0] + cuts, cuts + [n])]
+
+    def _teams(self):
+        player_id = 1000
+        for i in range(self.n_teams):
+            team_id = str(4000 + i * 7)
+            players = []
+            # Some teams have a substitute
+            for _ in range(6 if self.rng.random() < 0.3 else 5):
+                player_id += 1
+                players.append(str(player_id))
+                self.player_dict[str(player_id)] = {"name": f"player{player_id}"}
+                self.player_skill[str(player_id)] = self.rng.gauss(0, 0.1)
+            self.team_dict[team_id] = {
+                "name": f"Team {i}",
+                "major_roster": players[:5],
+                "players": players
+            }
+            self.strength[team_id] = self.rng.gauss(0, 0.4)
+
+    def _events(self):
+        """
+        Returns [(event_id, start date)] in date order. The last event gets
+        the Major's id so it is the default test set
+        """
+        span = (LAST_DATE - FIRST_DATE).days
+        starts = sorted(FIRST_DATE + timedelta(days=self.rng.randrange(span - 14))
+            for _ in range(self.n_events))
+        events = []
+        for i, start in enumerate(starts):
+            event_id = str(MAJOR_EVENT_ID) if i == len(starts) - 1 else str(5000 + i)
+            self.event_dict[event_id] = {"event_name": f"Event {event_id}", "match_ids": []}
+            events.append((event_id, start))
+        return events
+
+    def _match(self, start):
+        match_id = self._new_id("match")
+        team1_id, team2_id = self.rng.sample(list(self.team_dict), 2)
+        format = self.rng.choices([f for f, _ in FORMATS], [w for _, w in FORMATS])[0]
+        best_of = int(format[2])
+        date = start + timedelta(days=self.rng.randrange(14), hours=self.rng.randrange(10, 22))
+        date = date.strftime("%Y-%m-%d %H:%M")
+
+        # Veto: alternate picks then a decider
+        map_names = self.rng.sample(MAP_NAMES, best_of)
+        wins = [0, 0]
+        map_ids = []
+        for i, map_name in enumerate(map_names):
+            if best_of == 1 or i == best_of - 1:
+                picked_by = None
+            else:
+                picked_by = team1_id if i % 2 == 0 else team2_id
+            map_id = self._new_id("map")
+            team1_won = self._map(map_id, date, map_name, team1_id, team2_id, picked_by)
+            map_ids.append(map_id)
+            wins[0 if team1_won else 1] += 1
+            if max(wins) > best_of // 2:
+                break
+
+        self.match_dict[match_id] = {
+            "team1_id": team1_id,
+            "team2_id": team2_id,
+            "format":   format,
+            "LAN":      self.rng.random() < 0.45,
+            "score":    [str(wins[0]), str(wins[1])],
+            "map_ids":  map_ids
+        }
+        return match_id
+
+    def _map(self, map_id, date, map_name, team1_id, team2_id, picked_by):
+        """
+        Simulates a map round by round and adds it and its player stats
+        Returns:
+            True if team1 won
+        """
+        rng = self.rng
+        ct_bias = 0.1 if map_name in ("Nuke", "Overpass", "Train") else 0.
+        diff = self.strength[team1_id] - self.strength[team2_id]
+        ct_team = rng.randrange(2)
+        ct_start = ct_team
+        has_econ = rng.random() >= self.econ_missing
+
+        score = [0, 0]
+        halves = [[0, 0], [0, 0], [0, 0]]
+        money = [START_MONEY, START_MONEY]
+        loss_streak = [0, 0]
+        rounds = []
+        first_kills = [0, 0]
+        n = 0
+        while True:
+            # Money reset at the half and every 3 overtime rounds. Sides swap
+            # at the same rounds, except overtime starts on the sides of the
+            # second half, as economy.round_table has them
+            if n == 15 or (n > 30 and (n - 30) % 3 == 0):
+                ct_team = 1 - ct_team
+            if n == 15 or (n >= 30 and (n - 30) % 3 == 0):
+                money = [START_MONEY, START_MONEY] if n == 15 else [50000, 50000]
+                loss_streak = [0, 0]
+            buys = [_buy(money[0], rng), _buy(money[1], rng)]
+            logit = diff + (ct_bias if ct_team == 0 else -ct_bias) \
+                + (buys[0] - buys[1]) / 12000.
+            winner = 0 if rng.random() < 1. / (1. + math.exp(-logit)) else 1
+            loser = 1 - winner
+
+            winner_is_ct = winner == ct_team
+            if winner_is_ct:
+                round_type = rng.choices(["elimination", "defuse", "timeout"], [6, 2, 1])[0]
+            else:
+                round_type = rng.choices(["elimination", "bomb"], [6, 3])[0]
+            round = {"round_winner": team1_id if winner == 0 else team2_id, "round_type": round_type}
+            if has_econ:
+                round.update({
+                    "team1_buy": str(buys[0]),
+                    "team2_buy": str(buys[1]),
+                    "team1_buy_type": _buy_type(buys[0]),
+                    "team2_buy_type": _buy_type(buys[1])
+                })
+            rounds.append(round)
+            first_kills[winner if rng.random() < 0.7 else loser] += 1
+
+            money[winner] = min(money[winner] - buys[winner] + WIN_REWARD, MAX_MONEY)
+            money[loser] = min(money[loser] - buys[loser] + LOSS_REWARDS[min(loss_streak[loser], 4)], MAX_MONEY)
+            loss_streak[winner] = 0
+            loss_streak[loser] += 1
+
+            score[winner] += 1
+            halves[0 if n < 15 else (1 if n < 30 else 2)][winner] += 1
+            n += 1
+            if n <= 30 and max(score) == 16:
+                break
+            # Overtime is MR3, first to 4 of 6 rounds, repeated while tied
+            if n > 30 and score[winner] == 19 + 3 * ((n - 31) // 6):
+                break
+
+        team1_won = score[0] > score[1]
+        ratings = [1. + (0.1 if won else -0.1) + rng.gauss(0, 0.06) for won in (team1_won, not team1_won)]
+        players = []
+        for team_id in (team1_id, team2_id):
+            pool = self.team_dict[team_id]["players"]
+            # Usually the main roster, sometimes with the substitute in
+            lineup = pool[:5] if len(pool) == 5 or rng.random() < 0.85 else pool[:4] + pool[5:6]
+            players.append(lineup)
+
+        self.map_dict[map_id] = {
+            "date":              date,
+            "map_name":          map_name,
+            "team1_id":          team1_id,
+            "team2_id":          team2_id,
+            "map_picked_by":     picked_by,
+            "ct_start_team":     team1_id if ct_start == 0 else team2_id,
+            "score":             [str(s) for s in score],
+            "first_half_score":  [str(s) for s in halves[0]],
+            "second_half_score": [str(s) for s in halves[1]],
+            "overtime_score":    [str(s) for s in halves[2]],
+            "team_rating":       [f"{r:.2f}" for r in ratings],
+            "first_kills":       [str(f) for f in first_kills],
+            "clutches":          [str(rng.randrange(4)) for _ in range(2)],
+            "rounds":            rounds,
+            "team1_players":     players[0],
+            "team2_players":     players[1]
+        }
+
+        for side, lineup in enumerate(players):
+            self._map_players(map_id, lineup, n, ratings[side], first_kills[side], first_kills[1 - side])
+        return team1_won
+
+    def _map_players(self, map_id, lineup, n_rounds, team_rating, team_fk, team_fd):
+        rng = self.rng
+        fks = [0] * len(lineup)
+        fds = [0] * len(lineup)
+        for _ in range(team_fk):
+            fks[rng.randrange(len(lineup))] += 1
+        for _ in range(team_fd):
+            fds[rng.randrange(len(lineup))] += 1
+        for i, player_id in enumerate(lineup):
+            rating = max(team_rating + self.player_skill[player_id] + rng.gauss(0, 0.2), 0.1)
+            kills = max(int(rng.gauss(rating * 0.68 * n_rounds, 3)), 0)
+            deaths = max(int(rng.gauss((1.35 - 0.4 * rating) * 0.7 * n_rounds, 3)), 0)
+            assists = max(int(rng.gauss(0.13 * n_rounds, 2)), 0)
+            self.map_player_dict[(map_id, player_id)] = {
+                "kills": str(kills),
+                "headshots": str(int(kills * rng.uniform(0.3, 0.65))),
+                "assists": str(assists),
+                "flash_assists": str(rng.randrange(assists + 1)),
+                "deaths": str(deaths),
+                "kast": f"{min(max(rng.gauss(50 + 20 * rating, 8), 20.), 100.):.1f}",
+                "adr": f"{max(rng.gauss(75 * rating, 10), 10.):.1f}",
+                "first_kills": str(fks[i]),
+                "first_deaths": str(fds[i]),
+                "rating": f"{rating:.2f}"
+            }
+
+def write_dataset(dirname, team_dict, player_dict, event_dict, match_dict, map_dict, map_player_dict):
+    """
+    Writes the tables into dirname with the names of the committed files
+    """
+    os.makedirs(dirname, exist_ok=True)
+    for table, filename in [(team_dict, "team.json"), (player_dict, "player.json"),
+        (event_dict, "event.json"), (match_dict, "match.json"), (map_dict, "map.json"),
+        (map_player_dict, "map_player.json")]:
+        write_dict(table, os.path.join(dirname, filename))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset")
+    parser.add_argument("--scale", type=float, default=1., help="multiple of the committed dataset's size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="directory, default synthetic/<scale>x")
+    args = parser.parse_args()
+
+    tables = SyntheticDataset(args.scale, args.seed).generate()
+    output = args.output if args.output is not None else os.path.join("synthetic", f"{args.scale:g}x")
+    write_dataset(output, *tables)
+    print(f"{len(tables[4])} maps and {len(tables[5])} map player rows written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+
+from urllib.parse import urlsplit, urlunsplit
+
+REDIRECT_FILE = "redirects.json"
+# Redirects learned between writes of the redirect file
+SAVE_EVERY = 50
+
+_NON_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+def slugify(name):
+    """
+    Slug of a team, event or player name as the site writes it in urls:
+    lowercase ascii with dots and apostrophes dropped and every other run
+    of characters that aren't letters or digits one dash, so
+    "Virtus.pro" is "virtuspro" and "Natus Vincere" "natus-vincere"
+    """
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    name = name.lower().replace(".", "").replace("'", "")
+    return _NON_SLUG_RE.sub("-", name).strip("-")
+
+class UrlBuilder():
+    """
+    Builds the canonical url of each kind of page from ids and names, and
+    remembers where redirected urls led so they are requested there
+    directly next time. A redirect that only changes the host, like to
+    "www.", is applied to every url
+    """
+
+    def __init__(self, base_url, redirect_file=None, save_every=SAVE_EVERY):
+        """
+        Params:
+            base_url:       "https://" and the domain
+            redirect_file:  json file the learned redirects are kept in
+                            between runs, None to keep them in memory.
+                            Written by flush every save_every redirects
+                            and by save
+        """
+        self.base_url = base_url
+        self.redirect_file = redirect_file
+        self.save_every = save_every
+        self.redirects = {}
+        self.hosts = {}
+        self.unsaved = 0
+        self.lock = threading.Lock()
+        if redirect_file is not None and os.path.exists(redirect_file):
+            with open(redirect_file) as handle:
+                saved = json.loads(handle.read())
+            self.redirects = saved["urls"]
+            self.hosts = saved["hosts"]
+
+    def event(self, event_id, event_name):
+        return f"{self.base_url}/events/{event_id}/{slugify(event_name)}"
+
+    def events_archive(self, start_date, end_date, offset=0):
+        return (
+            f"{self.base_url}/events/archive?startDate={start_date.isoformat()}"
+            f"&endDate={end_date.isoformat()}&offset={offset}"
+        )
+
+    def team_stats(self, team_id, team_name, event_id=None):
+        url = f"{self.base_url}/stats/teams/{team_id}/{slugify(team_name)}"
+        return url if event_id is None else f"{url}?event={event_id}"
+
+    def lineup_matches(self, player_ids, min_players=5):
+        lineup = "".join(f"&lineup={id}" for id in player_ids)
+        return f"{self.base_url}/stats/lineup/matches?minLineupMatch={min_players}{lineup}"
+
+    def match(self, match_id, team1_name, team2_name, event_name=None):
+        slug = f"{slugify(team1_name)}-vs-{slugify(team2_name)}"
+        if event_name is not None:
+            slug += f"-{slugify(event_name)}"
+        return f"{self.base_url}/matches/{match_id}/{slug}"
+
+    def map_stats(self, map_id, team1_name, team2_name, page=""):
+        """
+        Params:
+            page:   "" for the overview, "economy" or "performance"
+        """
+        path = "/stats/matches/" + (f"{page}/" if page else "") + "mapstatsid"
+        return f"{self.base_url}{path}/{map_id}/{slugify(team1_name)}-vs-{slugify(team2_name)}"
+
+    def resolve(self, url):
+        """
+        Returns where url was last redirected to, url itself if it never was
+        """
+        if url in self.redirects:
+            return self.redirects[url]
+        parts = urlsplit(url)
+        if parts.netloc in self.hosts:
+            url = urlunsplit(parts._replace(netloc=self.hosts[parts.netloc]))
+        return self.redirects.get(url, url)
+
+    def learn(self, url, final_url):
+        """
+        Records that url, as returned by resolve, was redirected to
+        final_url
+        """
+        if final_url == url:
+            return
+        requested = urlsplit(url)
+        final = urlsplit(final_url)
+        with self.lock:
+            if requested._replace(netloc=final.netloc) == final:
+                self.hosts[requested.netloc] = final.netloc
+            else:
+                self.redirects[url] = final_url
+            self.unsaved += 1
+
+    def flush(self):
+        """
+        Saves the redirects if save_every have been learned since last saved
+        """
+        if self.unsaved >= self.save_every:
+            self.save()
+
+    def save(self):
+        if self.redirect_file is None or self.unsaved == 0:
+            return
+        with self.lock:
+            saved = {"hosts": dict(self.hosts), "urls": dict(self.redirects)}
+            self.unsaved = 0
+        with open(self.redirect_file, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,155 @@
+import numpy as np
+
+from main import read_json, write_dict
+
+RULES = ["distinct_teams", "known_teams", "winner", "half_sums", "regulation",
+    "score_rounds", "round_winners", "econ", "players_per_team", "match_reference",
+    "event_reference", "map_players"]
+
+QUARANTINE_FILE = "quarantine.json"
+
+def _int_pairs(maps, key):
+    """
+    Returns an int64 array (len(maps), 2) of a ["x", "y"] field, -1 where
+    the field is missing or not a pair of integers
+    """
+    out = np.full((len(maps), 2), -1, dtype="int64")
+    for i, m in enumerate(maps):
+        try:
+            out[i] = [int(x) for x in m[key]]
+        except (KeyError, TypeError, ValueError):
+            pass
+    return out
+
+def validate_maps(map_dict, match_dict=None, event_dict=None, team_dict=None,
+    map_player_dict=None, players_per_team=5, rules=RULES):
+    """
+    Runs every consistency rule over all maps at once. Rules needing a
+    dictionary that isn't given are skipped
+    Params:
+        players_per_team:   number of players each team must have on a map
+        rules:              names from RULES to check
+    Returns:
+        dictionary {(map_id: [failed rule])} of maps to quarantine
+    """
+    map_ids = list(map_dict.keys())
+    maps = list(map_dict.values())
+    n = len(maps)
+    failed = {}
+
+    def check(rule, ok):
+        if rule not in rules:
+            return
+        for i in np.flatnonzero(~ok):
+            failed.setdefault(map_ids[i], []).append(rule)
+
+    team1 = np.array([m["team1_id"] for m in maps], dtype=object)
+    team2 = np.array([m["team2_id"] for m in maps], dtype=object)
+    score = _int_pairs(maps, "score")
+    first = _int_pairs(maps, "first_half_score")
+    second = _int_pairs(maps, "second_half_score")
+    overtime = _int_pairs(maps, "overtime_score")
+
+    check("distinct_teams", team1 != team2)
+    if team_dict is not None:
+        check("known_teams", np.array([t1 in team_dict and t2 in team_dict
+            for t1, t2 in zip(team1, team2)], dtype=bool))
+    check("winner", (score.min(axis=1) >= 0) & (score[:, 0] != score[:, 1]))
+
+    parsed = (first.min(axis=1) >= 0) & (second.min(axis=1) >= 0) & (overtime.min(axis=1) >= 0)
+    check("half_sums", parsed & np.all(first + second + overtime == score, axis=1))
+
+    # MR15: each half is at most 15 rounds and overtime only follows 15-15
+    regulation = first + second
+    has_overtime = overtime.sum(axis=1) > 0
+    check("regulation", (first.sum(axis=1) <= 15) & np.where(has_overtime,
+        np.all(regulation == 15, axis=1), regulation.max(axis=1) <= 16))
+
+    # Round level checks, flattened with the index of each round's map
+    n_rounds = np.array([len(m.get("rounds", [])) for m in maps], dtype="int64")
+    check("score_rounds", n_rounds == score.sum(axis=1))
+    round_map = np.repeat(np.arange(n), n_rounds)
+    rounds = [r for m in maps for r in m.get("rounds", [])]
+    winners = np.array([r.get("round_winner") for r in rounds], dtype=object)
+    t1_wins = np.bincount(round_map[winners == team1[round_map]], minlength=n)
+    t2_wins = np.bincount(round_map[winners == team2[round_map]], minlength=n)
+    check("round_winners", (t1_wins == score[:, 0]) & (t2_wins == score[:, 1]))
+    has_econ = np.array(["team1_buy" in r and "team2_buy" in r for r in rounds], dtype=bool)
+    check("econ", (np.bincount(round_map[has_econ], minlength=n) == n_rounds) & (n_rounds > 0))
+
+    n_players = np.array([[len(m.get("team1_players", [])), len(m.get("team2_players", []))]
+        for m in maps], dtype="int64").reshape(n, 2)
+    check("players_per_team", np.all(n_players == players_per_team, axis=1))
+
+    if match_dict is not None:
+        map_idx = {m: i for i, m in enumerate(map_ids)}
+        match_of = np.full(n, None, dtype=object)
+        references = np.zeros(n, dtype="int64")
+        teams_match = np.zeros(n, dtype=bool)
+        for match_id, match in match_dict.items():
+            for map in match["map_ids"]:
+                if map in map_idx:
+                    i = map_idx[map]
+                    match_of[i] = match_id
+                    references[i] += 1
+                    teams_match[i] = {match["team1_id"], match["team2_id"]} == {team1[i], team2[i]}
+        check("match_reference", (references == 1) & teams_match)
+
+        if event_dict is not None:
+            match_ids = {m for event in event_dict.values() for m in event["match_ids"]}
+            check("event_reference", np.array([m in match_ids for m in match_of], dtype=bool))
+
+    if map_player_dict is not None:
+        map_idx = {m: i for i, m in enumerate(map_ids)}
+        rows = np.array([map_idx.get(map_id, -1) for map_id, _ in map_player_dict], dtype="int64")
+        rows = np.bincount(rows[rows >= 0], minlength=n)
+        check("map_players", rows == n_players.sum(axis=1))
+
+    return failed
+
+def quarantine_maps(map_dict, quarantine):
+    """
+    Returns map_dict without the maps in quarantine, a dictionary as
+    returned from validate_maps
+    """
+    return {m: v for m, v in map_dict.items() if m not in quarantine}
+
+def load_valid_maps(filename="map.json", quarantine_file=None, **kwargs):
+    """
+    Reads the map json, validates it and writes the quarantine list
+    Params:
+        quarantine_file:    where to write the quarantine list, if not None.
+                            Callers validating with their own rules leave it
+                            out, so QUARANTINE_FILE always holds the full
+                            check of validation.main
+        kwargs:             passed to validate_maps
+    Returns:
+        map_dict without the quarantined maps
+    """
+    map_dict = read_json(filename)
+    quarantine = validate_maps(map_dict, **kwargs)
+    if quarantine_file is not None:
+        write_dict(quarantine, quarantine_file)
+    if len(quarantine) > 0:
+        print(f"{len(quarantine)} of {len(map_dict)} maps quarantined")
+    return quarantine_maps(map_dict, quarantine)
+
+def main():
+    team_dict = read_json("team.json")
+    event_dict = read_json("event.json")
+    match_dict = read_json("match.json")
+    map_dict = read_json("map.json")
+    map_player_dict = read_json("map_player.json", is_tuple_key=True)
+
+    quarantine = validate_maps(map_dict, match_dict, event_dict, team_dict, map_player_dict)
+    counts = {}
+    for rules in quarantine.values():
+        for rule in rules:
+            counts[rule] = counts.get(rule, 0) + 1
+    print(f"{len(quarantine)} of {len(map_dict)} maps quarantined")
+    for rule in RULES:
+        print(f"    {rule:17} {counts.get(rule, 0)}")
+    write_dict(quarantine, QUARANTINE_FILE)
+
+if __name__ == "__main__":
+    main()